@@ -0,0 +1,193 @@
+"""
+Runs every animation of AnimData with its default settings for a fixed number of frames,
+without sleeping, on synthetic trees of 100, 1000 and 10000 leds.
+Animations that write to the strip themselves run against the mock PixelStrip.
+Reported per animation and size:
+    fps:      frames per second when nothing waits for the frame clock
+    alloc/f:  memory allocated (and freed again) per frame, measured with tracemalloc in a separate pass
+    peak:     the peak memory of setup() and that pass together
+Save the results with --json and pass the file to --compare on another commit to see the difference.
+The locations and the random generators are seeded, so runs on the same machine are comparable.
+Files that animations cache (e.g. geodesic distances) are written to a temporary folder, so every run starts cold.
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import shutil
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+from cl_controller.animations import animations as anim
+from cl_controller.animations.precompute import SetupCache
+from cl_controller.mock import PixelStrip
+from .common import tree_locations, use_locations, default_settings
+
+#the geodesic distances of all pairs of leds are stored in a dense matrix (800 MB for 10000 leds)
+MAX_LEDS = {"geodesic": 2000}
+
+class BenchClock(anim.FrameClock):
+    """
+    A frame clock that never sleeps or skips frames. It stops the animation after the given number of frames
+    and calls on_frame after every frame.
+    """
+    def __init__(self, fps, animation, frames, on_frame=None):
+        super().__init__(fps)
+        self.animation = animation
+        self.limit = frames
+        self.on_frame = on_frame
+
+    def tick(self) -> int:
+        self.frames += 1
+        if(self.on_frame is not None):
+            self.on_frame()
+        if(self.frames >= self.limit):
+            self.animation._stop_event.set()
+        return 1
+
+class AllocationProbe:
+    """
+    Sums, over all frames, how much the traced memory grew above its level at the start of the frame.
+    """
+    def __init__(self):
+        self.total = 0
+        self.frames = 0
+        self._start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def __call__(self):
+        current, peak = tracemalloc.get_traced_memory()
+        self.total += peak-self._start
+        self.frames += 1
+        self._start = current
+        tracemalloc.reset_peak()
+
+def create(name: str, locations: np.ndarray):
+    animation_cls = anim.AnimData().get(name)
+    if(animation_cls is None):
+        return None, "unknown"
+    #every setup starts cold, with the same random choices
+    SetupCache().clear()
+    np.random.seed(0)
+    random.seed(0)
+    animation = animation_cls()
+    result = animation.setup(**default_settings(animation_cls))
+    if(not result["success"]):
+        return None, result.get("message", "setup failed")
+    return animation, None
+
+def run_frames(animation, locations: np.ndarray, frames: int, on_frame=None):
+    if(animation.renders_frames):
+        dt = 1./animation.fps
+        for k in range(frames):
+            animation.render(k*dt, locations)
+            if(on_frame is not None):
+                on_frame()
+    else:
+        strip = PixelStrip(len(locations))
+        strip.begin()
+        animation.strip = strip
+        animation.clock = BenchClock(animation.fps, animation, frames, on_frame)
+        animation._stop_event.clear()
+        #run in this thread, play() would start a new one
+        animation.run()
+
+def bench(name: str, locations: np.ndarray, frames: int, alloc_frames: int) -> dict:
+    result = {"animation": name, "leds": len(locations)}
+    if(len(locations) > MAX_LEDS.get(name, len(locations))):
+        return {**result, "skipped": f"more than {MAX_LEDS[name]:d} leds"}
+    start = time.perf_counter()
+    try:
+        animation, error = create(name, locations)
+    except Exception as e:
+        animation, error = None, f"{type(e).__name__}: {e}"
+    if(animation is None):
+        return {**result, "skipped": error}
+    result["setup_ms"] = (time.perf_counter()-start)*1e3
+
+    start = time.perf_counter()
+    run_frames(animation, locations, frames)
+    elapsed = time.perf_counter()-start
+    result["fps"] = frames/elapsed
+    result["frame_ms"] = elapsed/frames*1e3
+
+    #allocations are measured on a fresh instance, tracing slows everything down
+    tracemalloc.start()
+    animation, _ = create(name, locations)
+    probe = AllocationProbe()
+    run_frames(animation, locations, alloc_frames, probe)
+    result["alloc_per_frame_kb"] = probe.total/max(probe.frames, 1)/1024
+    result["peak_kb"] = tracemalloc.get_traced_memory()[1]/1024
+    tracemalloc.stop()
+    return result
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main(names: list[str], sizes: list[int], frames: int, alloc_frames: int, json_path: str | None, compare: str | None):
+    baseline = {}
+    if(compare is not None):
+        with open(compare) as file:
+            data = json.load(file)
+        print(f"Comparing with {data['commit']}")
+        baseline = {(r["animation"], r["leds"]): r for r in data["results"] if "fps" in r}
+
+    commit = git_commit()
+    if(json_path is not None):
+        json_path = os.path.abspath(json_path)
+    #cache files of the animations are relative to the working directory
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="bench_animations")
+    os.makedirs(os.path.join(workdir, "animations"))
+    os.chdir(workdir)
+    try:
+        results = run_all(names, sizes, frames, alloc_frames, baseline)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+    if(json_path is not None):
+        with open(json_path, "w") as file:
+            json.dump({"commit": commit, "python": sys.version.split()[0], "numpy": np.__version__,
+                       "machine": platform.machine(), "frames": frames, "alloc_frames": alloc_frames,
+                       "results": results}, file, indent=2)
+        print("Results written to", json_path)
+
+def run_all(names: list[str], sizes: list[int], frames: int, alloc_frames: int, baseline: dict) -> list[dict]:
+    results = []
+    print(f"{'animation':>12s} {'leds':>6s} {'setup [ms]':>11s} {'fps':>9s} {'frame [ms]':>11s} {'alloc/f [KB]':>13s} {'peak [KB]':>10s}" + (f" {'vs base':>8s}" if baseline else ""))
+    for n in sizes:
+        locations = tree_locations(n)
+        use_locations(locations)
+        for name in names:
+            result = bench(name, locations, frames, alloc_frames)
+            results.append(result)
+            if("skipped" in result):
+                print(f"{name:>12s} {n:6d} skipped: {result['skipped']}")
+                continue
+            line = f"{name:>12s} {n:6d} {result['setup_ms']:11.1f} {result['fps']:9.0f} {result['frame_ms']:11.3f} {result['alloc_per_frame_kb']:13.1f} {result['peak_kb']:10.0f}"
+            base = baseline.get((name, n))
+            if(base is not None):
+                line += f" {result['fps']/base['fps']:7.2f}x"
+            print(line)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark all animations with their default settings")
+    parser.add_argument("--animations", nargs="+", default=None, help="Names of the animations (default: all)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Numbers of leds")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames to run per animation and size")
+    parser.add_argument("--alloc-frames", type=int, default=50, help="Number of frames to trace the allocations of")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results of an earlier run (--json) to compare the fps with")
+    args = parser.parse_args()
+    main(args.animations or anim.AnimData().names, args.sizes, args.frames, args.alloc_frames, args.json, args.compare)
@@ -0,0 +1,54 @@
+"""
+Frame time of the Compositor versus the number of leds and layers.
+At 30 fps, a frame has to be rendered within 33 ms.
+Before timing, checks that layers of the same animation with different settings don't affect each other.
+"""
+import argparse
+import numpy as np
+from cl_controller.animations.compositor import Compositor
+from cl_controller.animations.spiral import Spiral
+from .common import tree_locations, use_locations, time_per_call
+
+LAYERS = [
+    {"name": "fade"},
+    {"name": "snow", "blend": "alpha"},
+    {"name": "sweep_vert", "blend": "max", "opacity": 0.5},
+    {"name": "spiral", "blend": "multiply", "mask": {"axis": "z", "max": 0.5, "fade": 0.1}},
+]
+
+def check_layers(locations, frames: int = 60):
+    """
+    Two spiral layers with different inclinations render the same frames as each spiral on its own.
+    """
+    specs = [{"name": "spiral", "inclination": 0.5}, {"name": "spiral", "inclination": 3, "blend": "max"}]
+    expected = []
+    for spec in specs:
+        alone = Spiral()
+        alone.setup(**spec)
+        expected.append([alone.render(k/alone.fps, locations) for k in range(frames)])
+    animation = Compositor()
+    assert animation.setup(layers=specs)["success"]
+    for layer, spec, frames_alone in zip(animation.layers, specs, expected):
+        for k, frame in enumerate(frames_alone):
+            assert np.array_equal(layer.animation.render(k/animation.fps, locations), frame), \
+                f"the spiral layer with inclination {spec['inclination']} renders differently in the compositor"
+
+def main(frames: int, sizes: list[int]):
+    print(f"{'leds':>8s} {'layers':>7s} {'render [ms]':>12s} {'max fps':>9s}")
+    for n in sizes:
+        locations = tree_locations(n)
+        use_locations(locations)
+        check_layers(locations)
+        for num_layers in range(1, len(LAYERS)+1):
+            animation = Compositor()
+            animation.setup(layers=LAYERS[:num_layers])
+            dt = 1./animation.fps
+            t_render = time_per_call(lambda k: animation.render(k*dt, locations), frames)
+            print(f"{n:8d} {num_layers:7d} {t_render*1e3:12.3f} {1/t_render:9.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Compositor")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames to render per configuration")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Numbers of leds")
+    args = parser.parse_args()
+    main(args.frames, args.sizes)
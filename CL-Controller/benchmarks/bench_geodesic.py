@@ -0,0 +1,58 @@
+"""
+Time to compute all pairwise geodesic distances for the Geodesic animation,
+comparing the sparse shortest path implementation with the previous O(n^3) Dijkstra.
+"""
+import argparse
+import time
+import numpy as np
+from cl_controller.animations import geodesic
+from .common import tree_locations
+
+def legacy_geodesic_dists(X, kth: int):
+    #the implementation that calculate_geodesic_dists used before (without the cache file)
+    X2 = np.sum(X*X, axis=1, keepdims=True) #(N,1)
+    D = X2-2*X@X.T+X2.T
+    del X2
+    epsilon = np.mean(np.partition(D,kth,axis=1)[:,kth])
+    E = D<epsilon
+    G = np.full_like(D, np.inf)
+    P = np.full(D.shape,-1,dtype=np.int16)
+    n = G.shape[0]
+    for k in range(n):
+        G[k,k] = 0
+        P[k,k] = 1
+        T = list(range(n))
+        while len(T)>0:
+            i = T[np.argmin([G[k,i] for i in T])]
+            T.remove(i)
+            for j in [j for j in T if E[i,j]==1]:
+                if G[k,i]+D[i,j] < G[k,j]:
+                    G[k,j] = G[k,i] + D[i,j]
+                    P[k,j] = i
+    return G, P
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter()-start, result
+
+def main(kth: int, sizes: list[int], legacy_max: int):
+    print("Shortest paths using " + ("scipy.sparse.csgraph" if geodesic.dijkstra is not None else "the heap based Dijkstra"))
+    print(f"{'leds':>8s} {'new [s]':>10s} {'legacy [s]':>11s} {'speedup':>8s}")
+    for n in sizes:
+        X = tree_locations(n)
+        t_new, (G, _) = timed(geodesic.geodesic_dists, X, kth)
+        if(n <= legacy_max):
+            t_legacy, (G_legacy, _) = timed(legacy_geodesic_dists, X, kth)
+            assert np.allclose(G, G_legacy), "The distances do not match the legacy implementation"
+            print(f"{n:8d} {t_new:10.3f} {t_legacy:11.3f} {t_legacy/t_new:8.1f}")
+        else:
+            print(f"{n:8d} {t_new:10.3f} {'-':>11s} {'-':>8s}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the geodesic distance calculation")
+    parser.add_argument("--kth", type=int, default=8, help="The k-parameter of the animation")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 200, 400, 1000, 2000, 5000], help="Numbers of leds")
+    parser.add_argument("--legacy-max", type=int, default=400, help="Largest number of leds to run the legacy implementation for")
+    args = parser.parse_args()
+    main(args.kth, args.sizes, args.legacy_max)
@@ -0,0 +1,51 @@
+"""
+Time to list and load presets from PresetRepository, compared with querying SQLite for every call
+(which is what the preset api did before the presets were cached).
+The presets are written to a temporary database.
+"""
+import os
+import json
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from cl_controller.web.preset_handler import PresetRepository
+from .common import time_per_call
+
+ANIMATIONS = ["fade", "spiral", "snow", "disco", "sphere", "snake", "disks", "rotate"]
+
+def main(presets: int, calls: int):
+    workdir = tempfile.mkdtemp(prefix="bench_presets")
+    try:
+        path = os.path.join(workdir, "database.db")
+        repository = PresetRepository(path)
+        rng = random.Random(0)
+        for i in range(presets):
+            repository.create(f"preset {i:d}", rng.choice(ANIMATIONS), {"brightness": rng.randint(0, 255), "speed": rng.random()})
+        ids = [row["id"] for row in repository.list()]
+
+        con = sqlite3.connect(path)
+        def query_list(k):
+            con.execute("SELECT id, name, animation, created_on, json FROM presets WHERE animation=(?)", (ANIMATIONS[k % len(ANIMATIONS)],)).fetchall()
+        def query_settings(k):
+            json.loads(con.execute("SELECT json FROM presets WHERE id=(?)", (ids[k % len(ids)],)).fetchone()[0])
+
+        print(f"{presets:d} presets, times in microseconds")
+        print(f"{'operation':>20s} {'sqlite':>10s} {'repository':>11s}")
+        for name, query, cached in [
+                ("list(animation)", query_list, lambda k: repository.list(ANIMATIONS[k % len(ANIMATIONS)])),
+                ("settings(id)", query_settings, lambda k: repository.settings(ids[k % len(ids)]))]:
+            print(f"{name:>20s} {time_per_call(query, calls)*1e6:10.1f} {time_per_call(cached, calls)*1e6:11.1f}")
+        print(f"{'list()':>20s} {'':>10s} {time_per_call(lambda k: repository.list(), calls)*1e6:11.1f}")
+        con.close()
+        repository.close()
+    finally:
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark listing and loading presets")
+    parser.add_argument("--presets", type=int, default=500, help="Number of presets in the database")
+    parser.add_argument("--calls", type=int, default=2000, help="Number of calls per operation")
+    args = parser.parse_args()
+    main(args.presets, args.calls)
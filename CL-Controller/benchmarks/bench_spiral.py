@@ -0,0 +1,45 @@
+"""
+Frame time of the Spiral animation versus the number of leds,
+comparing the vectorized render() with the previous per-led loop.
+"""
+import argparse
+import numpy as np
+import cl_controller.utils as utils
+from cl_controller.animations import spiral
+from cl_controller.mock import PixelStrip
+from .common import tree_locations, use_locations, default_settings, time_per_call
+
+def legacy_frame(animation: spiral.Spiral, strip: PixelStrip, phi: float):
+    #the loop that Spiral.run() used before render() was vectorized
+    loc = spiral.spiral(phi, radius=animation.radius, vert_step=animation.vert_step)
+    color = animation.color(phi, animation.max_phi, 0)  # type: ignore
+    for i in range(len(animation.locations)):
+        d = np.linalg.norm(loc-animation.locations[i])
+        if(d>animation.radius*1.5):
+            strip.setPixelColor(i, animation.background)
+        elif(d < animation.radius*0.5):
+            strip.setPixelColor(i, color)
+        else:
+            strip.setPixelColor(i, utils.adjustBrightness(color, 255*(1.5-d/animation.radius)))
+
+def main(frames: int, sizes: list[int]):
+    print(f"{'leds':>8s} {'render [ms]':>12s} {'loop [ms]':>12s} {'speedup':>8s}")
+    for n in sizes:
+        locations = tree_locations(n)
+        use_locations(locations)
+        animation = spiral.Spiral()
+        animation.setup(**default_settings(spiral.Spiral))
+        strip = PixelStrip(n)
+        dt = 1./animation.fps
+        t_render = time_per_call(lambda k: animation.render(k*dt, locations), frames)
+        #the per-led loop is slow, don't wait for it too long
+        legacy_frames = max(1, frames*100//n)
+        t_loop = time_per_call(lambda k: legacy_frame(animation, strip, (k+1)*animation.step_size), legacy_frames)
+        print(f"{n:8d} {t_render*1e3:12.3f} {t_loop*1e3:12.3f} {t_loop/t_render:8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Spiral animation")
+    parser.add_argument("--frames", type=int, default=200, help="Number of frames to render per size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="Numbers of leds")
+    args = parser.parse_args()
+    main(args.frames, args.sizes)
@@ -0,0 +1,62 @@
+"""
+Requests per second of the web ui (/home and /home?animation=...) with the Flask test client:
+    reload:       what /home did before the pages were cached, reloading webcontroller and generating the page on every request
+    cached:       the /home route now, the page is generated once and served from the cache
+    conditional:  the browser already has the page and sends If-None-Match, which is answered with 304 Not Modified
+"""
+import os
+import time
+import argparse
+import importlib
+from flask import Flask, request
+import cl_controller.web.webcontroller as webcontroller
+from cl_controller.animations import animations as anim
+
+def create_app() -> Flask:
+    #only the routes of the web ui, create_app() would start the strip
+    root_path = os.path.dirname(os.path.abspath(webcontroller.__file__+"/.."))
+    app = Flask("cl_controller", root_path=root_path, template_folder='assets/templates', static_folder='assets/static')
+
+    def args():
+        return dict(animation=request.args.get("animation", default=None, type=str), preset=request.args.get("preset", default=None, type=int))
+
+    @app.route("/reload")
+    def reload():
+        importlib.reload(webcontroller)
+        return webcontroller.render_webpage(**args())
+
+    @app.route("/home")
+    def cached():
+        return webcontroller.webpage_response(request, **args())
+    return app
+
+def requests_per_second(client, url: str, duration: float, headers: dict | None = None, status: int = 200) -> float:
+    n = 0
+    start = time.perf_counter()
+    while(time.perf_counter()-start < duration):
+        response = client.get(url, headers=headers)
+        assert response.status_code == status, f"{url}: {response.status_code}"
+        n += 1
+    return n/(time.perf_counter()-start)
+
+def main(names: list[str], duration: float):
+    client = create_app().test_client()
+    print(f"{'page':>12s} {'reload [req/s]':>15s} {'cached [req/s]':>15s} {'304 [req/s]':>12s} {'speedup':>8s}")
+    for name in names:
+        query = "" if name == "home" else "?animation="+name
+        status = client.get("/home"+query).status_code
+        if(status != 200):
+            print(f"{name:>12s} skipped: status {status:d}")
+            continue
+        reload = requests_per_second(client, "/reload"+query, duration)
+        cached = requests_per_second(client, "/home"+query, duration)
+        etag = client.get("/home"+query).headers["ETag"]
+        conditional = requests_per_second(client, "/home"+query, duration, headers={"If-None-Match": etag}, status=304)
+        print(f"{name:>12s} {reload:15.0f} {cached:15.0f} {conditional:12.0f} {cached/reload:7.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pages of the web ui")
+    parser.add_argument("--animations", nargs="+", default=None, help="Names of the animations (default: all), 'home' is the main page")
+    parser.add_argument("--duration", type=float, default=1., help="Seconds to send requests for, per page and mode")
+    args = parser.parse_args()
+    main(args.animations or ["home"]+anim.AnimData().names, args.duration)
@@ -0,0 +1,39 @@
+"""
+Helpers shared by the benchmarks. Run the benchmarks from the CL-Controller folder, e.g.
+python -m benchmarks.bench_spiral
+"""
+import time
+import logging
+import numpy as np
+from cl_controller.animations import animations as anim
+
+#the mock strip can log every pixel, which would dominate the timings
+logging.getLogger("PixelStrip").setLevel(logging.WARNING)
+
+def tree_locations(n: int, height: float = 400, base_radius: float = 95, seed: int = 0) -> np.ndarray:
+    """
+    Synthetic (n,3) led locations spread over the surface of a cone shaped tree.
+    """
+    rng = np.random.default_rng(seed)
+    z = rng.uniform(0, height, n)
+    r = base_radius*np.sqrt(1-z/(height+25))*rng.uniform(0.7, 1, n)
+    phi = rng.uniform(0, 2*np.pi, n)
+    return np.stack((r*np.cos(phi), r*np.sin(phi), z), axis=1)
+
+def use_locations(locations: np.ndarray):
+    """
+    Make get_locations() return the given locations instead of loading locations.npy.
+    """
+    anim.locations = locations
+
+def default_settings(animation_class) -> dict:
+    return {key: setting["default"] for key, setting in animation_class.instructions.items()}
+
+def time_per_call(func, n: int) -> float:
+    """
+    Average time in seconds of n calls to func(k), k=0...n-1.
+    """
+    start = time.perf_counter()
+    for k in range(n):
+        func(k)
+    return (time.perf_counter()-start)/n
@@ -1,8 +1,12 @@
 import threading
+import time
+import logging
 import numpy as np
 import importlib
 from abc import abstractmethod
 from typing import List
+import cl_controller.utils as utils
+from cl_controller.metrics import FrameTimes
 
 info = {
     "fade": {
@@ -60,6 +64,8 @@ info = {
 }
 names = list(info.keys())
 
+FPS = 30 #default target frame rate of the animations
+
 locations = None
 animation_file = "animations/locations.npy"
 def get_locations():
@@ -130,28 +136,248 @@ class AnimData:
         else:
             return None
 
+class FrameClock:
+    """
+    Paces a render loop using monotonic deadlines instead of a fixed sleep,
+    so the frame rate does not drift with the time spent rendering.
+    tick() returns the number of frame periods that passed since the previous tick:
+    1 if the frame was on time, more if frames had to be dropped to catch up.
+    The time between the end of one tick and the start of the next is the time spent on the frame (see times).
+    """
+    def __init__(self, fps: float = FPS, wait=time.sleep):
+        if(not fps > 0):
+            raise ValueError(f"The frame rate has to be positive, got {fps}")
+        self.fps = fps
+        self.interval = 1./fps
+        self._wait = wait
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.dropped = 0
+        self.start = time.monotonic()
+        self.deadline = self.start + self.interval
+        self.times = FrameTimes(interval=self.interval)
+        self._resumed = self.start
+
+    def tick(self) -> int:
+        now = time.monotonic()
+        self.times.record(self._resumed, now)
+        if(now < self.deadline):
+            self._wait(self.deadline-now)
+            frames = 1
+        else:
+            #we are late, skip the deadlines we already missed
+            frames = int((now-self.deadline)/self.interval)+1
+            self.dropped += frames-1
+        self.deadline += frames*self.interval
+        self.frames += frames
+        self._resumed = time.monotonic()
+        return frames
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic()-self.start
+
 class Animation(threading.Thread):
+    """
+    Base class of all animations. An animation can either override run() and write to the strip itself,
+    or implement render(t, locations), which returns the frame at time t. The latter can be driven by
+    the controller's RenderLoop without starting a thread and can be rendered ahead of time.
+    """
     instructions: dict = {}
     settings: List[str] = []
+    loop_duration: float | None = None #time in seconds after which render() repeats itself (the first loop may differ), if it does
     
-    def __init__(self):
+    def __init__(self, fps: float = FPS):
         super(Animation, self).__init__()
         self.daemon = True
         self._is_setup = False
         self._stop_event = threading.Event()
+        self.fps = fps
+        #waiting on the stop event makes stop() interrupt the sleep between frames
+        self.clock = FrameClock(fps, wait=self._stop_event.wait)
     
     @abstractmethod
     def setup(self, **kwargs) -> dict: ...
 
+    def render(self, t: float, locations: np.ndarray) -> np.ndarray:
+        """
+        Returns the frame (packed colors or r,g,b values) at time t (in seconds since the start)
+        for the leds at the given locations.
+        """
+        raise NotImplementedError()
+
+    @property
+    def renders_frames(self) -> bool:
+        return type(self).render is not Animation.render
+
     #should not be overriden
     def play(self,strip):
         print("Starting animation!")
         self.strip = strip
+        self.clock.reset()
         self.start()
     
+    def show_frame(self, frame: np.ndarray):
+        """
+        Write a whole frame (packed colors or r,g,b values) to the strip and show it.
+        """
+        utils.write_frame(self.strip, frame)
+        self.strip.show()
+
     def stop(self):
         print("Stopping animation...")
         self._stop_event.set()
 
     def run(self):
-        pass
\ No newline at end of file
+        #animations that implement render() can still be played as a thread
+        if not self.renders_frames:
+            return
+        if not self._is_setup:
+            print("Not setup!")
+            return
+        locations = get_locations()
+        last_frame = None
+        while not self._stop_event.is_set():
+            frame = self.render(self.clock.frames/self.fps, locations)
+            if(frame is not last_frame):
+                self.show_frame(frame)
+            last_frame = frame
+            self.clock.tick()
+
+def sweep_activation(values: np.ndarray, init: float, step_size: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    For animations that light up the leds as a plane (sphere, angle, ...) moves from init in steps of step_size,
+    returns the frame (1, 2, ...) at which the plane reaches each of the values and its position at that frame.
+    """
+    frames = np.maximum(1, np.ceil((values-init)/step_size-1e-9)).astype(int)
+    return frames, init+frames*step_size
+
+def render_sweep(t: float, fps: float, loop_frames: int, activation: np.ndarray, positions: np.ndarray, max_x: float, color) -> np.ndarray:
+    """
+    The frame at time t of a sweep that repeats every loop_frames frames (see sweep_activation).
+    The leds that were reached in the current iteration get its color, the others still have
+    the color of the previous iteration. color is a function returned by utils.parse_color_mode_array.
+    """
+    iteration, k = divmod(int(round(t*fps)), loop_frames)
+    reached = activation <= k+1
+    colors = color(positions, max_x, np.where(reached, iteration, iteration-1))
+    if(iteration == 0):
+        colors[~reached] = 0
+    return colors
+
+def render_frames(animation: Animation, times, locations: np.ndarray | None = None) -> np.ndarray:
+    """
+    Renders the frames at the given times (in seconds) into a (len(times), N) array of packed colors.
+    """
+    if(locations is None):
+        locations = get_locations()
+    frames = np.empty((len(times), len(locations)), dtype=np.uint32)
+    for k, t in enumerate(times):
+        frames[k] = utils.pack_frame(animation.render(t, locations))
+    return frames
+
+class Transition:
+    """
+    Crossfade from an outgoing animation (or a fixed frame) to the incoming one.
+    """
+    def __init__(self, duration: float, animation: Animation | None = None, t0: float = 0., frame: np.ndarray | None = None):
+        self.duration = duration
+        self.animation = animation #rendered at t0 + the time since the start of the transition
+        self.t0 = t0
+        self.frame = frame #used if there is no outgoing animation
+
+    def blend(self, t: float, frame: np.ndarray, locations: np.ndarray) -> np.ndarray | None:
+        """
+        The crossfade at time t since the start of the transition, None once it is finished.
+        """
+        if(t >= self.duration):
+            return None
+        outgoing = self.frame if self.animation is None else self.animation.render(self.t0+t, locations)
+        return utils.crossfade(outgoing, frame, t/self.duration)
+
+class RenderLoop(threading.Thread):
+    """
+    A single long-running thread that drives the render() method of the current animation
+    and hands the frames to the output callback. Swapping the animation does not start a new thread.
+    As the only writer to the output, it can crossfade from the previous animation to the next one.
+    """
+    def __init__(self, output):
+        super(RenderLoop, self).__init__()
+        self.daemon = True
+        self.output = output
+        self.animation = None
+        self.transition = None
+        self.frame = None #the last frame that was output
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self.clock = FrameClock(FPS, wait=self._stop_event.wait)
+
+    def set_animation(self, animation: Animation, transition: float = 0., start_frame: np.ndarray | None = None):
+        """
+        Start rendering the given animation. If transition > 0, crossfade to it in that many seconds
+        from the animation that is currently rendered or, if there is none, from start_frame.
+        """
+        with self._lock:
+            if(transition <= 0):
+                self.transition = None
+            elif(self.transition is not None and self.frame is not None):
+                #already crossfading, continue from what is shown right now
+                self.transition = Transition(transition, frame=self.frame)
+            elif(self.animation is not None):
+                self.transition = Transition(transition, animation=self.animation, t0=self.clock.frames/self.clock.fps)
+            elif(start_frame is not None):
+                self.transition = Transition(transition, frame=start_frame)
+            else:
+                self.transition = None
+            self.animation = animation
+            self.locations = get_locations()
+            self.clock = FrameClock(animation.fps, wait=self._stop_event.wait)
+        self._wake.set()
+        if not self.is_alive():
+            self.start()
+
+    def clear(self):
+        #once this returns, the loop will not output any more frames of the previous animation
+        with self._lock:
+            self.animation = None
+            self.transition = None
+            self._wake.clear()
+
+    def stop(self):
+        self.clear()
+        self._stop_event.set()
+        self._wake.set()
+
+    def run(self):
+        last_frame = None
+        while not self._stop_event.is_set():
+            self._wake.wait()
+            with self._lock:
+                animation, clock = self.animation, self.clock
+                if(animation is None):
+                    last_frame = None
+                    continue
+                try:
+                    t = clock.frames/clock.fps
+                    frame = animation.render(t, self.locations)
+                    if(self.transition is not None):
+                        blended = self.transition.blend(t, frame, self.locations)
+                        if(blended is None):
+                            self.transition = None
+                            last_frame = None #show the incoming frame, even if it is static
+                        else:
+                            frame = blended
+                    if(frame is not last_frame): #static animations return the same frame over and over
+                        self.output(frame)
+                        self.frame = frame
+                    last_frame = frame
+                except Exception:
+                    logging.error(f"Error while rendering {animation}", exc_info=True)
+                    self.animation = None
+                    self.transition = None
+                    self._wake.clear()
+                    continue
+            clock.tick()
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+Looping animations can be baked into clips: one loop of frames stored in a .npy file,
+preceded by the first loop if that one is different (e.g. because it starts from black).
+Playing a clip only reads the frames from the memory-mapped file, so it takes almost no cpu.
+Clips are keyed by the animation's name, its settings, the frame rate, the led locations
+and the source code of the animation's module, so changing the animation does not replay old clips.
+"""
+import os
+import json
+import time
+import queue
+import inspect
+import logging
+import tempfile
+import functools
+import threading
+import numpy as np
+from hashlib import sha1
+from .animations import Animation, get_locations
+from .precompute import locations_hash
+import cl_controller.utils as utils
+
+clip_dir = "animations/clips"
+MAX_CLIP_BYTES = 64*2**20 #longer loops are played live
+MAX_TOTAL_BYTES = 512*2**20 #the least recently used clips are removed above this
+CLIP_FORMAT_VERSION = 2 #increase when the way clips are baked or stored changes
+TMP_PREFIX = "tmp-" #clips that are being baked, see bake()
+TMP_MAX_AGE = 3600 #seconds after which clean_up() removes the files of a bake that did not finish
+
+@functools.cache
+def code_hash(animation_cls: type[Animation]) -> str:
+    """
+    Hash of the source of the module that defines the animation (which includes its helper functions).
+    """
+    try:
+        source = inspect.getsource(inspect.getmodule(animation_cls))
+    except (OSError, TypeError):
+        source = animation_cls.__module__+"."+animation_cls.__qualname__
+    return sha1(source.encode()).hexdigest()
+
+def clip_key(name: str, animation_cls: type[Animation], settings: dict, fps: float, locations: np.ndarray) -> str:
+    #settings that are not given are replaced by their defaults, so both map to the same clip
+    values = {k: settings.get(k, animation_cls.instructions.get(k, {}).get("default")) for k in animation_cls.settings}
+    description = json.dumps({"name": name, "settings": values, "fps": fps, "version": CLIP_FORMAT_VERSION,
+                              "code": code_hash(animation_cls)}, sort_keys=True, default=str)
+    return sha1((description+locations_hash(locations)).encode()).hexdigest()
+
+def temp_path(directory: str) -> str:
+    #unique per bake, so bakes of the same clip in other threads or processes don't write to the same file
+    fd, path = tempfile.mkstemp(dir=directory, prefix=TMP_PREFIX, suffix=".npy")
+    os.close(fd)
+    return path
+
+def bake(animation: Animation, path: str, locations: np.ndarray | None = None, max_bytes: int = MAX_CLIP_BYTES) -> bool:
+    """
+    Renders a set up animation into a .npy file of packed colors with shape (1, loop, N) or,
+    if the first loop differs from the following ones, (2, loop, N) with the first loop in front.
+    Returns False if the animation does not loop, its loop is not a whole number of frames or the clip would be too large.
+    """
+    if(animation.loop_duration is None or not animation.renders_frames):
+        return False
+    if(locations is None):
+        locations = get_locations()
+    loop_frames = animation.loop_duration*animation.fps
+    num_frames = max(1, int(round(loop_frames)))
+    if(loop_frames > 0 and abs(loop_frames-num_frames) > 1e-6):
+        #the clip would have a seam and drift against the live animation
+        logging.info(f"Not baking {animation}: its loop is {loop_frames:.3f} frames long")
+        return False
+    if(2*num_frames*len(locations)*4 > max_bytes):
+        logging.info(f"Not baking {animation}: {num_frames:d} frames is too long")
+        return False
+    fps = animation.fps
+    directory = os.path.dirname(path) or "."
+    tmp = temp_path(directory)
+    try:
+        #the second loop is the one that repeats
+        frames = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint32, shape=(1, num_frames, len(locations)))
+        for k in range(num_frames):
+            frames[0, k] = animation.render((num_frames+k)/fps, locations)
+        for k in range(num_frames):
+            frame = utils.pack_frame(animation.render(k/fps, locations))
+            if(not np.array_equal(frame, frames[0, k])):
+                #the first loop is different after all, store it in front of the repeating loop
+                tmp2 = temp_path(directory)
+                clip = np.lib.format.open_memmap(tmp2, mode="w+", dtype=np.uint32, shape=(2, num_frames, len(locations)))
+                clip[1] = frames[0]
+                for j in range(k):
+                    clip[0, j] = frames[0, j]
+                for j in range(k, num_frames):
+                    clip[0, j] = animation.render(j/fps, locations)
+                del frames
+                os.remove(tmp)
+                frames, tmp = clip, tmp2
+                break
+        frames.flush()
+        del frames
+        os.replace(tmp, path) #the clip only becomes visible once it is complete
+    except BaseException:
+        if(os.path.exists(tmp)):
+            os.remove(tmp)
+        raise
+    return True
+
+class ClipPlayer(Animation):
+    """
+    Plays a baked clip in a loop, see ClipLibrary.
+    """
+    def setup(self, **kwargs):
+        self.name = kwargs.get("name", "clip")
+        clip = np.load(kwargs["path"], mmap_mode="r")
+        self.first = clip[0] #the first loop
+        self.frames = clip[-1] #the loop that repeats
+        self.loop_duration = len(self.frames)/self.fps
+        self._current = (None, None, None)
+        self._is_setup = True
+        return {"success": True}
+
+    def render(self, t, locations):
+        iteration, k = divmod(int(round(t*self.fps)), len(self.frames))
+        frames = self.first if iteration == 0 else self.frames
+        if(self._current[0] is not frames or self._current[1] != k):
+            #return the same object for the same frame, so the render loop can skip it
+            self._current = (frames, k, frames[k])
+        return self._current[2]
+
+    def __str__(self):
+        return f"ClipPlayer({self.name})"
+
+class ClipLibrary:
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ClipLibrary, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._worker = None
+
+    def path(self, key: str) -> str:
+        return os.path.join(clip_dir, key + ".npy")
+
+    def get(self, name: str, animation_cls: type[Animation], settings: dict, fps: float) -> ClipPlayer | None:
+        """
+        Returns a player for the clip of this animation, if it was baked before.
+        """
+        path = self.path(clip_key(name, animation_cls, settings, fps, get_locations()))
+        if not os.path.exists(path):
+            return None
+        player = ClipPlayer(fps=fps)
+        try:
+            player.setup(name=name, path=path)
+        except (OSError, ValueError):
+            logging.error(f"Could not load clip {path}", exc_info=True)
+            return None
+        os.utime(path) #marks the clip as recently used
+        return player
+
+    def bake_async(self, name: str, animation_cls: type[Animation], settings: dict, fps: float):
+        """
+        Bakes the clip of this animation in a background thread, so the next time it can be played from the clip.
+        The animation is set up again, so the instance that is playing live is not touched.
+        """
+        key = clip_key(name, animation_cls, settings, fps, get_locations())
+        with self._lock:
+            if(key in self._pending or os.path.exists(self.path(key))):
+                return
+            self._pending.add(key)
+            self._queue.put((key, name, animation_cls, settings, fps))
+            if(self._worker is None or not self._worker.is_alive()):
+                self._worker = threading.Thread(target=self._work, daemon=True, name="clips")
+                self._worker.start()
+
+    def _work(self):
+        while True:
+            key, name, animation_cls, settings, fps = self._queue.get()
+            try:
+                animation = animation_cls(fps=fps)
+                if(animation.setup(**settings)["success"]):
+                    os.makedirs(clip_dir, exist_ok=True)
+                    if(bake(animation, self.path(key))):
+                        logging.info(f"Baked a clip of {name}")
+                        self.clean_up()
+            except Exception:
+                logging.error(f"Baking a clip of {name} failed", exc_info=True)
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def clean_up(self, max_bytes: int = MAX_TOTAL_BYTES):
+        """
+        Removes the least recently used clips until they fit in max_bytes.
+        """
+        clips = []
+        for f in os.listdir(clip_dir):
+            path = os.path.join(clip_dir, f)
+            if(f.startswith(TMP_PREFIX)):
+                #being baked, or left behind by a bake that did not finish
+                try:
+                    if(time.time()-os.path.getmtime(path) > TMP_MAX_AGE):
+                        os.remove(path)
+                except OSError:
+                    pass #the bake finished in the meantime
+            elif(f.endswith(".npy")):
+                clips.append(path)
+        clips.sort(key=os.path.getmtime, reverse=True)
+        total = 0
+        for path in clips:
+            total += os.path.getsize(path)
+            if(total > max_bytes):
+                os.remove(path)
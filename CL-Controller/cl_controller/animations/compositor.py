@@ -0,0 +1,127 @@
+"""
+Plays several animations at once as layers. Every frame, the layers are rendered and blended
+on top of each other (bottom to top) into a shared rgb buffer with one of the blend modes below.
+A mask limits a layer to part of the tree.
+"""
+import numpy as np
+import cl_controller.utils as utils
+from .animations import Animation, AnimData, get_locations
+
+BLEND_MODES = ["add", "max", "alpha", "multiply"]
+
+def parse_mask(spec, locations: np.ndarray) -> np.ndarray | None:
+    """
+    Converts a mask specification into a (N,1) array of weights in [0,1], or None for no mask.
+    spec: a list of led ids, or {"axis": "x"|"y"|"z", "min": 0, "max": 1} with coordinates normalized to [0,1]
+          (add "fade": 0.1 to fade the edges out over that distance)
+    """
+    if(spec is None):
+        return None
+    mask = np.zeros(len(locations), dtype=np.float32)
+    if(isinstance(spec, list)):
+        mask[np.asarray(spec, dtype=int)] = 1
+    elif(isinstance(spec, dict)):
+        axis = "xyz".index(spec.get("axis", "z"))
+        x = locations[:, axis]
+        x = (x-np.min(x))/max(np.max(x)-np.min(x), 1e-9)
+        lower, upper = spec.get("min", 0), spec.get("max", 1)
+        fade = spec.get("fade", 0)
+        if(fade > 0):
+            mask[:] = np.clip(np.minimum(x-lower, upper-x)/fade+1, 0, 1)
+        else:
+            mask[(x >= lower) & (x <= upper)] = 1
+    else:
+        raise ValueError("Invalid mask", spec)
+    return mask[:, None]
+
+class Layer:
+    def __init__(self, animation: Animation, blend: str = "add", opacity: float = 1., mask: np.ndarray | None = None):
+        if(blend not in BLEND_MODES):
+            raise ValueError(f"Unknown blend mode '{blend}'")
+        self.animation = animation
+        self.blend = blend
+        self.opacity = opacity
+        self.mask = mask
+        self.weight = opacity if mask is None else (opacity*mask).astype(np.float32)
+        self._last = None #the frame of the previous render
+        self.rgb = None
+
+    def render(self, t: float, locations: np.ndarray) -> bool:
+        """
+        Renders the layer into self.rgb, returns False if the frame did not change.
+        """
+        frame = self.animation.render(t, locations)
+        if(self._last is not None and frame is self._last):
+            return False
+        self._last = frame
+        self.rgb = utils.color_to_rgb_array(utils.pack_frame(frame)).astype(np.float32)
+        return True
+
+class Compositor(Animation):
+    """
+    Blends the frames of several animations. The layers are given as a list of animation settings
+    (like those of /api/anim/) with the extra keys:
+        blend: add (default), max, alpha (black is transparent) or multiply
+        opacity: 0...1
+        mask: see parse_mask
+    The first layer is the bottom one.
+    """
+    def setup(self, **kwargs):
+        locations = get_locations()
+        specs = kwargs.get("layers", [])
+        if(not isinstance(specs, list) or len(specs) == 0):
+            return {"success": False, "message": "No layers given"}
+        animdata = AnimData()
+        self.layers = []
+        for i, spec in enumerate(specs):
+            animation_cls = animdata.get(spec.get("name", ""))
+            if(animation_cls is None):
+                return {"success": False, "message": f"Layer {i:d}: could not find animation '{spec.get('name')}'"}
+            animation = animation_cls(fps=self.fps)
+            if(not animation.renders_frames):
+                return {"success": False, "message": f"Layer {i:d}: '{spec['name']}' cannot be used as a layer"}
+            result = animation.setup(**spec)
+            if(not result["success"]):
+                return {**result, "message": f"Layer {i:d}: " + result.get("message", "")}
+            try:
+                mask = parse_mask(spec.get("mask"), locations)
+                self.layers.append(Layer(animation, spec.get("blend", "add"), float(spec.get("opacity", 1)), mask))
+            except (ValueError, IndexError) as e:
+                return {"success": False, "message": f"Layer {i:d}: {e}"}
+        self.buffer = np.zeros((len(locations), 3), dtype=np.float32)
+        self._tmp = np.zeros_like(self.buffer)
+        self.frame = None
+        #the layers only loop together if all of them are static
+        if(all(layer.animation.loop_duration == 0 for layer in self.layers)):
+            self.loop_duration = 0
+        self._is_setup = True
+        return {"success": True}
+
+    def render(self, t, locations):
+        changed = [layer.render(t, locations) for layer in self.layers]
+        if(self.frame is not None and not any(changed)):
+            return self.frame
+        buffer, tmp = self.buffer, self._tmp
+        buffer.fill(0)
+        for layer in self.layers:
+            w = layer.weight
+            rgb = layer.rgb
+            if(layer.blend == "add"):
+                np.multiply(rgb, w, out=tmp)
+                buffer += tmp
+            elif(layer.blend == "max"):
+                np.multiply(rgb, w, out=tmp)
+                np.maximum(buffer, tmp, out=buffer)
+            elif(layer.blend == "alpha"):
+                #black leds of the layer are transparent
+                alpha = np.where(np.any(rgb > 0, axis=1, keepdims=True), w, 0)
+                buffer *= 1-alpha
+                np.multiply(rgb, alpha, out=tmp)
+                buffer += tmp
+            elif(layer.blend == "multiply"):
+                np.multiply(rgb, w/255., out=tmp)
+                tmp += 1-w
+                buffer *= tmp
+        rgb = np.clip(buffer, 0, 255).astype(np.uint8)
+        self.frame = utils.Color_array(rgb[:,0], rgb[:,1], rgb[:,2]).astype(np.uint32)
+        return self.frame
@@ -1,4 +1,3 @@
-from time import sleep
 import numpy as np
 from .animations import Animation, get_locations
 import cl_controller.utils as utils
@@ -23,9 +22,10 @@ class Disco(Animation):
 
     def setup(self, **kwargs):
         self.num_leds = len(get_locations())
-        interval = 1./30 #30 fps
+        interval = 1./self.fps
         mean = interval/(max(0.5,kwargs.get("duration", 5))/self.num_leds)
-        self.dist = lambda: np.random.poisson(lam=mean)
+        #number of leds to change in the given number of frame periods
+        self.dist = lambda frames=1: np.random.poisson(lam=mean*frames)
         self.brightness_min = max(0, kwargs.get("min_brightness", 0))
         self.brightness_max = min(255, kwargs.get("max_brightness", 255))
         self.fixed = kwargs.get("color", "random")=="fixed"
@@ -48,15 +48,16 @@ class Disco(Animation):
             idx = 0
             order = np.random.choice(self.num_leds, size=self.num_leds, replace=False)
             color = utils.wheel(((i+1)*40)%255, self.brightness_max)
+            frames = 1
             while not self._stop_event.is_set():
-                n = self.dist()
+                n = self.dist(frames)
                 for _ in range(n):
                     idx += 1
                     if(idx>self.num_leds-1): break
                     self.strip.setPixelColor(int(order[idx]), color)
                 else:
                     self.strip.show()
-                    sleep(1./30)
+                    frames = self.clock.tick()
                     continue #the while loop
                 
                 #we reached the end of the order
@@ -64,14 +65,15 @@ class Disco(Animation):
                 idx = 0
                 order = np.random.choice(self.num_leds, size=self.num_leds, replace=False)
                 color = utils.wheel(((i+1)*40)%255, self.brightness_max)
-                sleep(1./30)
+                frames = self.clock.tick()
 
         else:
+            frames = 1
             while not self._stop_event.is_set():
-                n = self.dist()
+                n = self.dist(frames)
                 idx = np.random.randint(low=0, high=self.num_leds, size=(n))
                 color = utils.Color(*utils.hsv_to_rgb(np.random.randint(0,255), 1, np.random.randint(self.brightness_min,self.brightness_max)/255))
                 for i in idx:
                     self.strip.setPixelColor(int(i), color)
                 self.strip.show()
-                sleep(1./30)
\ No newline at end of file
+                frames = self.clock.tick()
\ No newline at end of file
@@ -1,5 +1,6 @@
 from .animations import Animation, get_locations
 import numpy as np
+import logging
 import cl_controller.utils as utils
 
 class Disks(Animation):
@@ -31,7 +32,6 @@ class Disks(Animation):
             z = locations[:,2]
             z = (z-np.min(z))/(np.max(z)-np.min(z))*self.N #normalized to [0,N]
             z[z==self.N] = self.N-0.5
-            print(np.min(z), np.max(z))
             for i in range(len(z)):
                 self.sections[int(z[i])].append(i)
         else:
@@ -41,20 +41,16 @@ class Disks(Animation):
             for i in range(len(angles)):
                 self.sections[int(angles[i])].append(i)
 
+        logging.debug("Disks: leds per section " + ", ".join([str(len(section)) for section in self.sections]))
+        self.frame = np.zeros(len(locations), dtype=np.uint32)
+        for i, section in enumerate(self.sections):
+            self.frame[section] = utils.wheel(int(i/self.N*255))
+        self.loop_duration = 0 #static
+
         self._is_setup = True
         return {"success": True}
 
-    def run(self):
-        """
-        Plays the animation until self.stop() is called
-        """
-        if not self._is_setup:
-            print("Not setup!")
-            return
-        print(", ".join([str(len(section)) for section in self.sections]))
-        for i, section in enumerate(self.sections):
-            color = utils.wheel(int(i/self.N*255))
-            for idx in section:
-                self.strip.setPixelColor(idx, color)
-        self.strip.show()
+    def render(self, t, locations):
+        #always the same frame, so the render loop only needs to show it once
+        return self.frame
         
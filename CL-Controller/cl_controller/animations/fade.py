@@ -1,4 +1,4 @@
-from time import sleep
+import numpy as np
 from .animations import Animation, get_locations
 import cl_controller.utils as utils
 
@@ -17,22 +17,14 @@ class Fade(Animation):
     def setup(self, **kwargs):
         self.num_leds = len(get_locations())
         duration = max(1.5, kwargs.get("duration", 3))
-        self.step = 255/(duration*30)
+        self.step = 255/(duration*self.fps)
         self.brightness = min(255, max(0, kwargs.get("brightness", 255)))
+        self.loop_duration = duration
     
         self._is_setup = True
         return {"success": True}
 
-    def run(self):
-        if not self._is_setup:
-            print("Not setup!")
-            return
-        
-        i = 0
-        while not self._stop_event.is_set():
-            i += self.step
-            color = utils.wheel(int(i%255), brightness=self.brightness)
-            for idx in range(self.num_leds):
-                self.strip.setPixelColor(idx, color)
-            self.strip.show()
-            sleep(1./30)
\ No newline at end of file
+    def render(self, t, locations):
+        i = t*self.fps*self.step
+        color = utils.wheel(int(i%255), brightness=self.brightness)
+        return np.full(len(locations), color, dtype=np.uint32)
\ No newline at end of file
@@ -1,11 +1,87 @@
-from time import sleep
 import numpy as np
 from hashlib import sha1
 import os
+import heapq
 from random import randint
 from .animations import Animation, get_locations
+from .precompute import SetupCache
 import cl_controller.utils as utils
 
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+except ImportError:
+    print("scipy not available, using the pure python shortest path implementation")
+    dijkstra = None
+
+def _squared_dists(X, rows):
+    #squared distances of the given rows of X to all points of X
+    X2 = np.sum(X*X, axis=1)
+    return X2[rows,None]-2*X[rows]@X.T+X2[None,:]
+
+def epsilon_graph(X, kth: int, block_size: int = 1024):
+    """
+    Connects all LEDs whose squared distance is smaller than the average squared distance
+    to the k-th nearest neighbor. The distances are computed in blocks of rows, so the
+    full distance matrix is never needed.
+    Returns the edges as (rows, cols, squared distances).
+    """
+    n = X.shape[0]
+    blocks = [np.arange(i, min(i+block_size, n)) for i in range(0, n, block_size)]
+    kth_dists = np.concatenate([np.partition(_squared_dists(X, rows), kth, axis=1)[:,kth] for rows in blocks])
+    epsilon = np.mean(kth_dists) #average distance to k-th nearest neighbor
+    edges = []
+    for rows in blocks:
+        D = _squared_dists(X, rows)
+        D[np.arange(len(rows)), rows] = np.inf #no edges from a node to itself
+        i, j = np.nonzero(D<epsilon)
+        #zero weights would be interpreted as missing edges
+        edges.append((rows[i], j, np.maximum(D[i,j], np.finfo(float).tiny)))
+    return tuple(np.concatenate(e) for e in zip(*edges))
+
+def _dijkstra(neighbors, weights, source: int, n: int):
+    #heap based Dijkstra from a single source, used if scipy is not available
+    dist = [np.inf]*n
+    pred = [-1]*n
+    dist[source] = 0.
+    done = [False]*n
+    heap = [(0., source)]
+    while heap:
+        d, i = heapq.heappop(heap)
+        if done[i]:
+            continue
+        done[i] = True
+        for j, w in zip(neighbors[i], weights[i]):
+            if d+w < dist[j]:
+                dist[j] = d+w
+                pred[j] = i
+                heapq.heappush(heap, (d+w, j))
+    return dist, pred
+
+def geodesic_dists(X, kth: int):
+    """
+    Length of the shortest path between every pair of LEDs over the epsilon graph.
+    Returns the (N,N) distances G and predecessors P (P[k,j] is the node before j on the path from k).
+    """
+    n = X.shape[0]
+    rows, cols, weights = epsilon_graph(X, kth)
+    if dijkstra is not None:
+        G, P = dijkstra(csr_matrix((weights, (rows, cols)), shape=(n,n)), directed=False, return_predecessors=True)
+        P[P<0] = -1
+    else:
+        order = np.argsort(rows, kind="stable")
+        splits = np.searchsorted(rows[order], np.arange(1, n))
+        neighbors = [c.tolist() for c in np.split(cols[order], splits)]
+        edge_weights = [w.tolist() for w in np.split(weights[order], splits)]
+        G = np.empty((n,n))
+        P = np.empty((n,n), dtype=int)
+        for k in range(n):
+            G[k], P[k] = _dijkstra(neighbors, edge_weights, k, n)
+    #int16 would wrap above 32767 leds
+    P = P.astype(np.int16 if n <= np.iinfo(np.int16).max else np.int32)
+    P[np.arange(n), np.arange(n)] = np.arange(n)
+    return G, P
+
 def calculate_geodesic_dists(X, kth:int):
     cache_file = f"animations/geodesic_dists-{kth}.npz"
     if os.path.exists(cache_file):
@@ -17,29 +93,7 @@ def calculate_geodesic_dists(X, kth:int):
             print("Geodesic cache file is outdated")
     print("Calculating geodesic distances!")
     #the cache file doesn't exist or was calculated using a different X
-    X2 = np.sum(X*X, axis=1, keepdims=True) #(N,1)
-    D = X2-2*X@X.T+X2.T
-    del X2
-    #construct adjacency matrix
-    epsilon = np.mean(np.partition(D,kth,axis=1)[:,kth]) #average distance to k-th nearest neighbor 
-    E = D<epsilon #binary matrix connecting nodes with distance < epsilon
-    
-    #Now, find the shortest path from every LED to every LED through using the edges in E
-    G = np.full_like(D, np.inf)
-    P = np.full(D.shape,-1,dtype=np.int16)
-    n = G.shape[0]
-    for k in range(n):
-        #Run Dijkstra's algorithm for k
-        G[k,k] = 0
-        P[k,k] = 1
-        T = list(range(n))
-        while len(T)>0:
-            i = T[np.argmin([G[k,i] for i in T])]
-            T.remove(i)
-            for j in [j for j in T if E[i,j]==1]:
-                if G[k,i]+D[i,j] < G[k,j]:
-                    G[k,j] = G[k,i] + D[i,j]
-                    P[k,j] = i
+    G, P = geodesic_dists(X, kth)
     assert np.allclose(G.T,G)
     h = sha1(X).digest()
     np.savez(cache_file, G=G, P=P, h=h)
@@ -69,60 +123,90 @@ class Geodesic(Animation):
         """
         self.duration = max(1,kwargs.get("duration", 3)) #duration of one loop in seconds
         self.invert = kwargs.get("invert", False) #play the animation back-to-front if true
-        self.color = utils.parse_color_mode(kwargs.get("color", "255,0,0"), brightness=kwargs.get("brightness", 255), is_odd_black_constant=True) #get the color mode as a lambda, call with self.color(location, max_location, iteration)
+        self.pause = 0.3 #seconds between two iterations
+        self.color = utils.parse_color_mode_array(kwargs.get("color", "255,0,0"), brightness=kwargs.get("brightness", 255), is_odd_black_constant=True) #get the color mode as a function, call with self.color(locations, max_location, iterations)
         if(self.color is None):
             print("Invalid color!")
             return {"success": False, "message": "Invalid color"}
 
         #get the geodesic distances
         try:
-            self.D = calculate_geodesic_dists(get_locations(), kth=kwargs.get("k-parameter", 8))
+            locations = get_locations()
+            k = kwargs.get("k-parameter", 8)
+            self.D = SetupCache().get("geodesic", locations, (k,), lambda: calculate_geodesic_dists(locations, kth=k))
         except Exception as e:
             print(e)
             return {"success": False, "message": str(e)}
         
-        self.iteration = 0
+        #every iteration takes [duration] seconds, followed by a short pause before the next one starts
+        self.steps = max(1, int(np.ceil(self.fps*self.duration-1e-9)))
+        self.loop_frames = self.steps-1+max(1, int(round(self.pause*self.fps)))
+        self.seed = randint(0, 2**31-1) #the start of every iteration is random, but reproducible for a given t
+        self._iterations = {}
+        self._final = None
         self._is_setup = True
         return {"success": True}
 
-    def run(self):
+    def _iteration_data(self, iteration):
         """
-        Plays the animation until self.stop() is called
+        The frame at which every led is reached in the given iteration and the color it gets
         """
-        if not self._is_setup:
-            print("Not setup!")
-            return
-        
+        if(iteration not in self._iterations):
+            data = self._compute_iteration(iteration)
+            #only the current and the previous iteration are needed
+            self._iterations = {i: data for i, data in self._iterations.items() if i == iteration-1}
+            self._iterations[iteration] = data
+        return self._iterations[iteration]
+
+    def _compute_iteration(self, iteration):
         num_leds = self.D.shape[0]
-        def initialize():
-            start_loc = randint(0,num_leds-1)
-            dists = self.D[start_loc]
-            order = np.argsort(dists)
-            max_dist = np.max(dists[dists<np.inf])
-            step_size = max_dist/(30*self.duration)
-            current_dist = 0
-            return current_dist, dists[order], max_dist, step_size, order
-        
-        current_dist, dists, max_dist, step_size, order = initialize()
-        idx = 0
-        while not self._stop_event.is_set():
-            current_dist += step_size
-            changed = False #set to true if at least one led changed.
-            while(idx<num_leds and dists[idx] <= current_dist):
-                #while the next led in the order is less than the current angle, activate that led
-                self.strip.setPixelColor(int(order[idx]), self.color(current_dist, max_dist, self.iteration)) # type: ignore
-                changed = True
-                idx += 1
-            if(changed):
-                self.strip.show()
-                
-            if(current_dist < max_dist):
-                #continue with the next step
-                sleep(1./30)
-            else:
-                #We reached the end of the animation, start the next iteration
-                sleep(0.3)
-                self.iteration += 1
-                current_dist, dists, max_dist, step_size, order = initialize()
-                idx = 0 #reset back to the first led
-                
\ No newline at end of file
+        start_loc = np.random.default_rng([self.seed, iteration]).integers(num_leds)
+        dists = self.D[start_loc]
+        reachable = dists < np.inf
+        max_dist = np.max(dists[reachable])
+        if(max_dist > 0):
+            step_size = max_dist/(self.fps*self.duration)
+            activation = np.maximum(1, np.ceil(np.where(reachable, dists, 0)/step_size-1e-9)).astype(int)
+        else:
+            step_size = 0
+            activation = np.ones(num_leds, dtype=int)
+        activation[~reachable] = self.steps+1 #never reached in this iteration
+        colors = self.color(activation*step_size, max_dist, iteration)
+        return activation, colors
+
+    def _final_frame(self, iteration):
+        """
+        The frame at the end of the given iteration
+        """
+        if(iteration < 0):
+            return np.zeros(self.D.shape[0], dtype=np.uint32)
+        if(self._final is not None and self._final[0] == iteration):
+            return self._final[1]
+        activation, colors = self._iteration_data(iteration)
+        frame = colors.astype(np.uint32)
+        #leds that cannot be reached from the start keep their color of the previous iteration(s),
+        #going back until every led has a color (or black if it was never reached)
+        missing = activation > self.steps
+        previous = iteration-1
+        while(np.any(missing) and previous >= 0):
+            if(self._final is not None and self._final[0] == previous):
+                frame[missing] = self._final[1][missing]
+                break
+            activation, colors = self._compute_iteration(previous)
+            fill = missing & (activation <= self.steps)
+            frame[fill] = colors[fill]
+            missing &= ~fill
+            previous -= 1
+        else:
+            frame[missing] = 0
+        self._final = (iteration, frame)
+        return frame
+
+    def render(self, t, locations):
+        """
+        Returns the frame at time t
+        """
+        iteration, k = divmod(int(round(t*self.fps)), self.loop_frames)
+        previous = self._final_frame(iteration-1)
+        activation, colors = self._iteration_data(iteration)
+        return np.where(activation <= min(k+1, self.steps), colors, previous).astype(np.uint32)
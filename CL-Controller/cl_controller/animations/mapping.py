@@ -41,6 +41,17 @@ def convex_hull(points, edges=False):
     else:
         return bool_indices, np.array(convex_hull)
 
+def tree_projection(locations, angle):
+    """
+    Projects the 3D led locations onto the plane seen from the given angle (in degrees)
+    and maps the outline of the tree onto a square, see project().
+    """
+    alpha = (angle%360)*np.pi/180
+    P = np.array([[np.cos(alpha), -np.sin(alpha)],[np.sin(alpha), np.cos(alpha)]])
+    locs_2d = np.stack((locations[:,:2]@P.T[:,0], locations[:,2]), axis=1)
+    indices, hull, edges = convex_hull(locs_2d, edges=True)
+    return project(locs_2d, indices, edges)
+
 def find_edges(p, edges):
     #find the two edges that intersect y=p[1]
     target_edges = ~((edges[:,0,1]<=p[1]) ^ (edges[:,1,1]>=p[1]))
@@ -60,11 +60,11 @@ class Music(Animation):
             print("Not setup!")
             return
         self.last_update = time()
+        frame = np.zeros(sum(len(section) for section in self.sections), dtype=np.uint32)
         def callback(colors):
             for i, section in enumerate(self.sections): 
-                for idx in section:
-                    self.strip.setPixelColor(idx, int(colors[i]))
-            self.strip.show()
+                frame[section] = int(colors[i])
+            self.show_frame(frame)
             self.last_update = time()
         self.vis = Visualizer(self.mode, self.scale, self.bins)
 
@@ -0,0 +1,164 @@
+"""
+Cache for the expensive parts of animation setups, like the geodesic distances
+or the projection used by the camera animation. Results are keyed by the animation,
+the hash of the led locations and the relevant parameters. On startup, warm_up()
+computes the likely variants in a background thread, so starting an animation
+only has to look up the result.
+"""
+import os
+import queue
+import logging
+import threading
+import numpy as np
+from hashlib import sha1
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Any
+
+MAX_BYTES = 256*2**20 #results that are kept, the least recently used ones are dropped first
+
+def locations_hash(locations: np.ndarray) -> str:
+    return sha1(np.ascontiguousarray(locations)).hexdigest()
+
+def result_size(result) -> int:
+    """
+    Bytes of the arrays in a setup result (an array or a tuple/list/dict of them)
+    """
+    if(isinstance(result, np.ndarray)):
+        return result.nbytes
+    if(isinstance(result, (tuple, list))):
+        return sum(result_size(r) for r in result)
+    if(isinstance(result, dict)):
+        return sum(result_size(r) for r in result.values())
+    return 0
+
+class SetupCache:
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(SetupCache, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._futures: OrderedDict[tuple, Future] = OrderedDict() #least recently used first
+        self._sizes: dict[tuple, int] = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        #threads do not survive a fork (gunicorn --preload), so restart the background work in the child
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _key(self, name: str, locations: np.ndarray, params: tuple) -> tuple:
+        return (name, locations_hash(locations), params)
+
+    def _run(self, key: tuple, future: Future, compute: Callable[[], Any]):
+        try:
+            result = compute()
+            with self._lock:
+                if(self._futures.get(key) is future):
+                    self._sizes[key] = result_size(result)
+                    self._evict(keep=key)
+            future.set_result(result)
+        except Exception as e:
+            logging.error(f"Precomputing {key[0]} {key[2]} failed", exc_info=True)
+            with self._lock:
+                self._futures.pop(key, None)
+            future.set_exception(e)
+
+    def get(self, name: str, locations: np.ndarray, params: tuple, compute: Callable[[], Any]) -> Any:
+        """
+        Returns the result of compute() for the given key. If it was already computed
+        (or is being computed in the background) that result is used instead.
+        """
+        key = self._key(name, locations, params)
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if(owner):
+                future = self._futures[key] = Future()
+            else:
+                self._futures.move_to_end(key)
+        if(owner):
+            self._run(key, future, compute)
+        return future.result()
+
+    def submit(self, name: str, locations: np.ndarray, params: tuple, compute: Callable[[], Any]):
+        """
+        Schedules compute() in the background thread, unless the key is already known.
+        """
+        key = self._key(name, locations, params)
+        with self._lock:
+            if(key in self._futures):
+                return
+            future = self._futures[key] = Future()
+            self._queue.put((key, future, compute))
+            if(self._worker is None):
+                self._worker = threading.Thread(target=self._work, daemon=True, name="precompute")
+                self._worker.start()
+
+    def _evict(self, keep: tuple):
+        #drops the least recently used results until they fit in max_bytes, the result that was just computed stays
+        total = sum(self._sizes.values())
+        for key in list(self._futures):
+            if(total <= self.max_bytes):
+                break
+            if(key == keep or key not in self._sizes):
+                continue
+            total -= self._sizes.pop(key)
+            del self._futures[key]
+            logging.info(f"Dropped the precomputed {key[0]} {key[2]} from the cache")
+
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def clear(self):
+        """
+        Forgets the results that were computed, work that is still queued or running is kept.
+        """
+        with self._lock:
+            self._futures = OrderedDict((key, future) for key, future in self._futures.items() if not future.done())
+            self._sizes = {}
+
+    def _work(self):
+        while True:
+            key, future, compute = self._queue.get()
+            if(future.set_running_or_notify_cancel()):
+                self._run(key, future, compute)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._worker = None
+        jobs = []
+        while not self._queue.empty():
+            jobs.append(self._queue.get_nowait())
+        #jobs that were running in the parent will never finish here
+        unfinished = {key for key, future in self._futures.items() if not future.done()}
+        queued = {key for key, _, _ in jobs}
+        for key in unfinished-queued:
+            del self._futures[key]
+            self._sizes.pop(key, None)
+        self._queue = queue.Queue()
+        if(len(jobs)>0):
+            for job in jobs:
+                self._queue.put(job)
+            self._worker = threading.Thread(target=self._work, daemon=True, name="precompute")
+            self._worker.start()
+
+def warm_up(locations: np.ndarray, max_leds: int = 2000):
+    """
+    Precompute the setup results of the animations for their most likely parameters in the background.
+    """
+    from . import geodesic, mapping
+    cache = SetupCache()
+    if(len(locations) <= max_leds):
+        #only the default k-parameter, every distance matrix takes 8*N^2 bytes
+        k = geodesic.Geodesic.instructions["k-parameter"]["default"]
+        cache.submit("geodesic", locations, (k,), lambda: geodesic.calculate_geodesic_dists(locations, kth=k))
+    else:
+        logging.info(f"Not precomputing geodesic distances for {len(locations)} leds")
+    #the camera animation's default and every 45 degrees
+    for angle in [150, *range(0, 360, 45)]:
+        cache.submit("projection", locations, (angle,), lambda angle=angle: mapping.tree_projection(locations, angle))
@@ -1,5 +1,4 @@
-from time import sleep
-from .animations import Animation, get_locations
+from .animations import Animation, get_locations, sweep_activation, render_sweep
 import numpy as np
 import cl_controller.utils as utils
 
@@ -31,61 +30,36 @@ class Rotate(Animation):
         locations = get_locations() 
         invert = kwargs.get("invert", False) #play the animation back-to-front if true
         self.angles = np.arctan2(locations[:,1], locations[:,0])+np.pi #convert locations to angles in the xy-plane
-        self.order = np.argsort(self.angles).astype(int) #get the order of the leds, from smallest angle to largest: 0->2pi
 
-        #we want 30fp, travel up in [duration] number of seconds: step_size = distance/#steps
-        self.step_size = 2*np.pi/(30*duration)
+        #travel around in [duration] number of seconds: step_size = distance/#steps
+        self.step_size = 2*np.pi/(self.fps*duration)
         
-        self.color = utils.parse_color_mode(kwargs.get("color", "255,0,0"), brightness=kwargs.get("brightness", 255), is_odd_black_constant=True) #get the color mode as a lambda, call with self.color(location, max_location, iteration)
+        self.color = utils.parse_color_mode_array(kwargs.get("color", "255,0,0"), brightness=kwargs.get("brightness", 255), is_odd_black_constant=True) #get the color mode as a function, call with self.color(locations, max_location, iterations)
         if(self.color is None):
             print("Invalid color!")
             return {"success": False, "message": "Invalid color"}
 
+        #the iteration ends at the first frame at which the angle leaves [0, 2pi)
+        n = 2*np.pi/self.step_size
         if(invert):
             #start at the end
             self.init_loc = 2*np.pi
             self.step_size *= -1
-            self.check = lambda z1, z2: z1 >= z2
-            self.order = self.order[::-1] #sorts 2pi->0
+            self.loop_frames = int(np.floor(n+1e-9))+1
         else:
             #start at the beginning
             self.init_loc = 0
-            self.check = lambda z1, z2: z1 <= z2
-        
-        self.iteration = 0
+            self.loop_frames = int(np.ceil(n-1e-9))
 
-        self.angles = self.angles[self.order] #sort the angles according to their order
+        #the frame at which every led is reached and the angle at that moment
+        self.activation, self.positions = sweep_activation(self.angles, self.init_loc, self.step_size)
+        self.activation = np.minimum(self.activation, self.loop_frames)
+        self.loop_duration = self.loop_frames*self.color.period/self.fps
         self._is_setup = True
         return {"success": True}
 
-    def run(self):
+    def render(self, t, locations):
         """
-        Plays the animation until self.stop() is called
+        Returns the frame at time t
         """
-        if not self._is_setup:
-            print("Not setup!")
-            return
-        pi2 = np.pi*2 #just a helpful constant
-        
-        idx = 0 #current LED (goes to 99 max)
-        loc = self.init_loc #current angle
-        num_leds = len(self.angles)
-        while not self._stop_event.is_set():
-            loc += self.step_size
-            changed = False #set to true if at least one led changed.
-            while(idx<num_leds and self.check(self.angles[idx],loc)):
-                #while the next led in the order is less than the current angle, activate that led
-                self.strip.setPixelColor(int(self.order[idx]), self.color(loc, pi2, self.iteration))  # type: ignore
-                changed = True
-                idx += 1
-            if(changed):
-                self.strip.show()
-                
-            if(0 <= loc < pi2):
-                #continue with the next step
-                sleep(1./30)
-            else:
-                #We reached the end of the animation, start the next iteration
-                self.iteration += 1
-                idx = 0 #reset back to the first led
-                loc = self.init_loc #back to the start
\ No newline at end of file
+        return render_sweep(t, self.fps, self.loop_frames, self.activation, self.positions, 2*np.pi, self.color)
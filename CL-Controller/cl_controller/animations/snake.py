@@ -1,7 +1,6 @@
 from .animations import Animation, get_locations
 import numpy as np
 import cl_controller.utils as utils
-from time import sleep
 
 height = 425
 vert_step = 1.8
@@ -66,8 +65,8 @@ class Snake(Animation):
 
         self.max_z = np.max(self.locations[:,2])
         self.max_phi = (self.max_z/(vert_step*self.radius))*np.pi*2
-        #we want 30fp, travel up in [duration] number of seconds: step_size = distance/#steps
-        self.step_size = self.max_phi/(30*duration)        
+        #travel up in [duration] number of seconds: step_size = distance/#steps
+        self.step_size = self.max_phi/(self.fps*duration)        
 
         self.start_new_point = self.max_phi/self.amount
         self.init_phi = 0
@@ -86,7 +85,7 @@ class Snake(Animation):
         num_leds = len(self.locations)
         
         snakes = [Spiral(self.iteration, self.init_phi, self.color, self.radius)]
-
+        frames = 1
         while not self._stop_event.is_set():
             if(snakes[-1].phi>self.start_new_point and len(snakes)<self.amount):
                 self.iteration += 1
@@ -94,9 +93,9 @@ class Snake(Animation):
                 if(self.iteration>1000):
                     self.iteration = 0
             for snake in snakes:
-                snake.update(self.strip, self.step_size, self.max_phi, self.locations)
+                snake.update(self.strip, self.step_size*frames, self.max_phi, self.locations)
                 if(snake.phi > self.max_phi):
                     snakes.remove(snake)
 
             self.strip.show()
-            sleep(1./30)
\ No newline at end of file
+            frames = self.clock.tick()
\ No newline at end of file
@@ -1,35 +1,44 @@
 from .animations import Animation, get_locations
 import numpy as np
 import cl_controller.utils as utils
-from time import sleep
 
 max_z = 400
 base_radius = 100
 
-class LEDState:
-    def __init__(self, color=0, fade=0):
-        self.set_color(color, fade)
-    
-    def set_color(self, color, fade=0):
-        (self.r, self.g, self.b) = utils.color_to_rgb(color)
-        self.fade = fade
-        self.time = 0
-        self.fading = fade>0
+class LEDStates:
+    """
+    The color and fade state of all leds, stored as arrays (structure of arrays)
+    so that fading can be applied to all leds at once.
+    """
+    def __init__(self, n_leds, color=0, fade=0):
+        self.rgb = np.zeros((n_leds, 3), dtype=int) #r,g,b columns
+        self.fade = np.zeros(n_leds)
+        self.time = np.zeros(n_leds)
+        self.fading = np.zeros(n_leds, dtype=bool)
+        self.set_color(slice(None), color, fade)
+
+    def set_color(self, idx, color, fade=0):
+        """
+        Set the leds at the given indices to the given color(s), which will fade out in [fade] seconds.
+        """
+        self.rgb[idx] = np.stack(utils.color_to_rgb(color), axis=-1)
+        self.fade[idx] = fade
+        self.time[idx] = 0
+        self.fading[idx] = fade>0
 
     def update(self, dt):
-        if not self.fading:
+        if not self.fading.any():
             return
-        self.time += dt
-        if(self.time>self.fade):
-            self.fading = False
-            self.r = 0
-            self.g = 0
-            self.b = 0
-        else:
-            f = 1-dt/self.fade
-            self.r = int(self.r*f)
-            self.g = int(self.g*f)
-            self.b = int(self.b*f)
+        self.time[self.fading] += dt
+        done = self.fading & (self.time>self.fade)
+        self.fading[done] = False
+        self.rgb[done] = 0
+        idx = np.flatnonzero(self.fading)
+        f = 1-dt/self.fade[idx]
+        self.rgb[idx] = (self.rgb[idx]*f[:,None]).astype(int)
+
+    def colors(self) -> np.ndarray:
+        return utils.Color_array(self.rgb[:,0], self.rgb[:,1], self.rgb[:,2]).astype(np.uint32)
 
 class Snowball:
     def __init__(self, idx, radius, z, phi, theta, speed, fade):
@@ -44,19 +53,16 @@ class Snowball:
         self.r = 0
         self.fade = fade
 
-    #locs = (r, phi, theta)
-    def update(self, states, locs, color):
-        self.z -= self.speed
+    def move(self, frames=1):
+        """
+        Let the ball fall for the given number of frames, returns its new (x,y,z) location.
+        """
+        self.z -= self.speed*frames
         x = (max_z-self.z)/max_z
         self.r = base_radius*np.sqrt(max(0,x)) #(z-height)/(-height/base_radius)
         #self.r = base_radius-self.z*self.a
-
         x,y = to_cartesian(self.r, self.phi)
-        #for i in np.where(locs[0]*locs[0]+self.r*self.r-2*self.r*locs[0]*(self.sintheta*np.sin(locs[2])*np.cos(locs[1]-self.phi)+self.costheta*np.cos(locs[2]))<self.radius2)[0]:
-        for i in np.where((x-locs[:,0])**2+(y-locs[:,1])**2+(self.z-locs[:,2])**2<self.radius2)[0]:
-            #print(i, color(self.z, max_z, self.idx), type(color(self.z, max_z, self.idx)))
-            #strip.setPixelColor(int(i), color(self.z, max_z, self.idx))
-            states[i].set_color(color(self.z, max_z, self.idx), fade=self.fade)
+        return x, y, self.z
 
     def __str__(self):
         return "Ball {:d}: (r, z, phi): ({:.1f}, {:d}, {:.1f})".format(self.idx, self.r, int(self.z), self.phi)
@@ -131,7 +137,8 @@ class Snow(Animation):
 
         max_z = self.top = np.max(z)+self.radius+self.randomness
         self.bottom = np.min(z)-2*self.radius
-        #we want 30fp, travel up in [duration] number of seconds: step_size = distance/#steps
+        #the speed is given in distance per 1/30th of a second, convert it to distance per frame
+        self.speed_scale = 30/self.fps
         
         self.color = utils.parse_color_mode(kwargs.get("color", "255,0,0"), brightness=kwargs.get("brightness", 255))
         if(self.color is None):
@@ -140,40 +147,46 @@ class Snow(Animation):
 
         self.background = utils.parse_color(kwargs.get("background", "255,0,0"), brightness=kwargs.get("back_brightness", 255))
 
-        #self.locs = (z, phi, r)
+        self.balls = []
+        self.ball_idx = 0
+        self.theta = np.arctan(95/400)
+        self.states = LEDStates(len(self.locs), self.background, fade=0)
+        self.last_frame = -1
+
         self._is_setup = True
         return {"success": True}
 
-    def run(self):
-        if not self._is_setup:
-            print("Not setup!")
-            return
-        balls = []
-        pi2 = np.pi*2
-        theta = np.arctan(95/400)
-        idx = 0
-        n_leds = len(self.locs)
-        states = [LEDState(self.background, fade=0) for i in range(len(self.locs))]
-        while not self._stop_event.is_set():
-            if(len(balls)<self.max_n_balls):
-                balls.append(Snowball(idx, max(5,np.random.normal(self.radius, self.randomness)), self.top, np.random.rand()*pi2, theta, max(1,np.random.normal(self.speed, self.speed_std)), self.fade))
-                idx += 1
-                if(idx>1000): #prevent ridiculously large numbers
-                    idx = 0
-            #for i in range(n_leds):
-            #    self.strip.setPixelColor(i, self.background)
-
-            #for ball in balls:
-            #    ball.update(self.strip, self.color, self.locs)
-                #print(ball)
-            #    if(ball.z < self.bottom):
-            #        balls.remove(ball)
-            for ball in balls:
-                ball.update(states, self.locs, self.color)
-                if(ball.z < self.bottom):
-                    balls.remove(ball)
-            for i, state in enumerate(states):
-                state.update(1./30)
-                self.strip.setPixelColor(i, utils.Color(state.r, state.g, state.b))
-            self.strip.show()
-            sleep(1./30)
+    def add_ball(self):
+        speed = max(1,np.random.normal(self.speed, self.speed_std))*self.speed_scale
+        radius = max(5,np.random.normal(self.radius, self.randomness))
+        self.balls.append(Snowball(self.ball_idx, radius, self.top, np.random.rand()*np.pi*2, self.theta, speed, self.fade))
+        self.ball_idx += 1
+        if(self.ball_idx>1000): #prevent ridiculously large numbers
+            self.ball_idx = 0
+
+    def step(self, locations, frames=1):
+        """
+        Advance the snow by the given number of frames.
+        """
+        if(len(self.balls)<self.max_n_balls):
+            self.add_ball()
+        centers = np.array([ball.move(frames) for ball in self.balls]) #(n_balls, 3)
+        radius2 = np.array([ball.radius2 for ball in self.balls])
+        #which leds are inside which balls, for all balls at once (n_balls, n_leds)
+        inside = np.sum((locations[None,:,:]-centers[:,None,:])**2, axis=2) < radius2[:,None]
+        hit = np.flatnonzero(inside.any(axis=0))
+        if(len(hit)>0):
+            #if a led is inside multiple balls, the last ball determines its color
+            last = len(self.balls)-1-np.argmax(inside[::-1,hit], axis=0)
+            colors = np.array([self.color(ball.z, max_z, ball.idx) for ball in self.balls], dtype=np.int64)  # type: ignore
+            self.states.set_color(hit, colors[last], fade=self.fade)
+        self.balls = [ball for ball in self.balls if ball.z >= self.bottom]
+        self.states.update(frames/self.fps)
+
+    def render(self, t, locations):
+        #the snow is random, so every frame continues from the previous one
+        frame = int(round(t*self.fps))
+        frames = max(1, frame-self.last_frame)
+        self.last_frame = frame
+        self.step(locations, frames)
+        return self.states.colors()
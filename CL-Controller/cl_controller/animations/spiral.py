@@ -1,12 +1,11 @@
 from .animations import Animation, get_locations
 import numpy as np
 import cl_controller.utils as utils
-from time import sleep
 
 height = 425
 vert_step = 1.8
 
-def spiral(phase, radius=50, base_radius=95, height=height):
+def spiral(phase, radius=50, base_radius=95, height=height, vert_step=vert_step):
     z = phase/(2*np.pi)*vert_step*radius
     x = (height-z)/height
     r = base_radius*np.sqrt(max(0,x)) #(z-height)/(-height/base_radius)
@@ -39,10 +38,9 @@ class Spiral(Animation):
     settings = list(instructions.keys())
 
     def setup(self, **kwargs):
-        global vert_step
         duration = max(kwargs.get("duration", 3),1)
         self.invert = kwargs.get("invert", False)
-        vert_step = kwargs.get("inclination", 1.75)
+        self.vert_step = kwargs.get("inclination", 1.75)
         self.locations = get_locations()
 
         if("background" in kwargs and kwargs["background"]=="chase"):
@@ -54,66 +52,44 @@ class Spiral(Animation):
             self.background = utils.parse_color(kwargs.get("background", "0,0,0"), kwargs.get("back_brightness", 255))
         self.radius = kwargs.get("radius", 50)
         
-        self.color = utils.parse_color_mode(kwargs.get("color", "fixed"), kwargs.get("brightness", 255))
+        self.color = utils.parse_color_mode_array(kwargs.get("color", "fixed"), kwargs.get("brightness", 255))
         if(self.color is None):
             print("Invalid color")
             return {"success": False, "message": "Invalid color"}
 
         self.max_z = np.max(self.locations[:,2])
-        self.max_phi = (self.max_z/(vert_step*self.radius))*np.pi*2
-        #we want 30fp, travel up in [duration] number of seconds: step_size = distance/#steps
-        self.step_size = self.max_phi/(30*duration)        
+        self.max_phi = (self.max_z/(self.vert_step*self.radius))*np.pi*2
+        #travel up in [duration] number of seconds: step_size = distance/#steps
+        self.step_size = self.max_phi/(self.fps*duration)        
 
         if(self.invert):
             self.init_phi = self.max_phi
             self.step_size *= -1
         else:
             self.init_phi = 0
-        
-        self.iteration = 0
+        #number of frames it takes to travel along the whole spiral once
+        self.loop_frames = max(1, int(np.ceil(self.fps*duration-1e-9)))
+
+        if(self.background == "chase"):
+            #the chase leaves a trail, so every frame depends on the previous ones
+            self.frame = np.zeros(len(self.locations), dtype=np.uint32)
+            self.loop_duration = None
+        else:
+            self.loop_duration = self.loop_frames*self.color.period/self.fps
 
         self._is_setup = True
         return {"success": True}
 
-    def run(self):
-        if not self._is_setup:
-            print("Not setup")
-            return
-        
-        phi = 0
-        num_leds = len(self.locations)
+    def render(self, t, locations):
+        iteration, k = divmod(int(round(t*self.fps)), self.loop_frames)
+        phi = self.init_phi + (k+1)*self.step_size
+        loc = np.array(spiral(phi, radius=self.radius, vert_step=self.vert_step))
+        color = int(self.color(phi, self.max_phi, iteration))  # type: ignore
+        d = np.linalg.norm(locations-loc, axis=1)
         if(self.background == "chase"):
-            while not self._stop_event.is_set():
-                phi += self.step_size
-                loc = spiral(phi, radius=self.radius)
-                color = self.color(phi, self.max_phi, self.iteration)  # type: ignore
-                for i in range(num_leds):
-                    d = np.linalg.norm(loc-self.locations[i])
-                    if(d < self.radius):
-                        self.strip.setPixelColor(i, color)
-                self.strip.show()
-                if(phi<self.max_phi):# and loc[2]<self.max_z):
-                    sleep(1./30)
-                else:
-                    self.iteration += 1
-                    phi = self.init_phi #back to the top
-        else:
-            while not self._stop_event.is_set():
-                phi += self.step_size
-                loc = spiral(phi, radius=self.radius)
-                color = self.color(phi, self.max_phi, self.iteration)  # type: ignore
-                for i in range(num_leds):
-                    d = np.linalg.norm(loc-self.locations[i])
-                    if(d>self.radius*1.5):
-                        self.strip.setPixelColor(i, self.background)
-                    elif(d < self.radius*0.5):
-                        self.strip.setPixelColor(i, color)
-                    else:
-                        self.strip.setPixelColor(i, utils.adjustBrightness(color, 255*(1.5-d/self.radius)))
-
-                self.strip.show()
-                if(phi<self.max_phi):# and loc[2]<self.max_z):
-                    sleep(1./30)
-                else:
-                    self.iteration += 1
-                    phi = self.init_phi #back to the top
+            self.frame[d < self.radius] = color
+            return self.frame.copy()
+        #full color inside half the radius, fading out towards 1.5 times the radius
+        frame = utils.adjustBrightness_array(color, 255*(1.5-d/self.radius))
+        frame[d > self.radius*1.5] = self.background
+        return frame
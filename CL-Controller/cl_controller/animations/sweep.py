@@ -1,19 +1,17 @@
-from .animations import Animation, get_locations
+from .animations import Animation, get_locations, sweep_activation, render_sweep
 import numpy as np
 import cl_controller.utils as utils
-from time import sleep
 
 class Sweep(Animation):
     def _setup(self, locations: np.ndarray, **kwargs):
         self.duration = max(kwargs.get("duration", 3),1)
         invert = kwargs.get("invert", False)
-        self.order = np.argsort(locations).astype(int) #sorts small->big (or rising z)
-        self.max_loc, min_loc = locations[self.order[-1]], locations[self.order[0]]
+        self.max_loc, min_loc = np.max(locations), np.min(locations)
 
-        #we want 30fp, travel up in [duration] number of seconds: step_size = distance/#steps
-        self.step_size = (self.max_loc-min_loc)/(30*self.duration)
+        #travel up in [duration] number of seconds: step_size = distance/#steps
+        self.step_size = (self.max_loc-min_loc)/(self.fps*self.duration)
         
-        self.color = utils.parse_color_mode(kwargs.get("color", "255,0,0"), brightness=kwargs.get("brightness", 255), is_odd_black_constant=True)
+        self.color = utils.parse_color_mode_array(kwargs.get("color", "255,0,0"), brightness=kwargs.get("brightness", 255), is_odd_black_constant=True)
         if(self.color is None):
             print("Invalid color!")
             return {"success": False, "message": "Invalid color"}
@@ -21,42 +19,17 @@ class Sweep(Animation):
         if(invert):
             self.init_loc = min_loc
             self.step_size *= -1
-            self.check = lambda z1, z2: z1 <= z2
         else:
-            self.order = self.order[::-1] #sorts big->small (falling z)
             self.init_loc = self.max_loc
-            self.check = lambda z1, z2: z1 >= z2
-        
-        self.iteration = 0
 
-        self.locs = locations[self.order]
+        #the plane moves down (or up if inverted) and lights up every led it passes
+        self.activation, self.positions = sweep_activation(locations, self.init_loc, -self.step_size)
+        self.loop_frames = int(np.max(self.activation))
+        self.loop_duration = self.loop_frames*self.color.period/self.fps
         return {"success": True}
 
-    def run(self):
-        if not self._is_setup:
-            print("Not setup!")
-            return
-        idx = 0
-        loc = self.init_loc
-        changed = False
-        num_leds = len(self.locs)
-        while not self._stop_event.is_set():
-            loc -= self.step_size
-            changed = False
-            while(idx<num_leds and self.check(self.locs[idx],loc)): #todo take invert into account
-                self.strip.setPixelColor(int(self.order[idx]), self.color(loc, self.max_loc, self.iteration))  # type: ignore
-                changed = True
-                idx += 1
-            if(changed):
-                self.strip.show()
-                
-            if(idx<num_leds):
-                #continue with the next step
-                sleep(1./30)
-            else:
-                self.iteration += 1
-                idx = 0
-                loc = self.init_loc #back to the top
+    def render(self, t, locations):
+        return render_sweep(t, self.fps, self.loop_frames, self.activation, self.positions, self.max_loc, self.color)
 
 class Sweep_Vertical(Sweep):
     instructions = {
@@ -77,9 +50,9 @@ class Sweep_Vertical(Sweep):
     settings = list(instructions.keys())
 
     def setup(self, **kwargs):
-        super()._setup(get_locations()[:, 2], **kwargs)
-        self._is_setup = True
-        return {"success": True}
+        result = super()._setup(get_locations()[:, 2], **kwargs)
+        self._is_setup = result["success"]
+        return result
 
 class Sweep_Horizontal(Sweep):
     instructions = {
@@ -124,12 +97,12 @@ class Sweep_Horizontal(Sweep):
         mat = np.array([[np.cos(angle)], [np.sin(angle)]])
         locs = locs@mat
         locs = locs.reshape(locs.shape[0])
-        super()._setup(locs, **kwargs)
-        self._is_setup = True
-        return {"success": True}
+        result = super()._setup(locs, **kwargs)
+        self._is_setup = result["success"]
+        return result
 
 class SweepX(Sweep):
     def setup(self, **kwargs):
-        super()._setup(get_locations()[:, 0], **kwargs)
-        self._is_setup = True
-        return {"success": True}
\ No newline at end of file
+        result = super()._setup(get_locations()[:, 0], **kwargs)
+        self._is_setup = result["success"]
+        return result
\ No newline at end of file
@@ -8,6 +8,7 @@ import logging
 import sys
 import cv2 as cv
 from . import mapping
+from .precompute import SetupCache
 import threading
 sys.path.append("../movenet")
 from picamera2 import Picamera2
@@ -153,13 +154,8 @@ class Video(Animation):
         
         self._is_setup = True
         locs = get_locations()
-        alpha = kwargs.get("angle", 0)%360
-        alpha *= np.pi/180
-        P = np.array([[np.cos(alpha), -np.sin(alpha)],[np.sin(alpha), np.cos(alpha)]])
-        locs_2d = np.stack((locs[:,:2]@P.T[:,0], locs[:,2]), axis=1)
-
-        indices, hull, edges = mapping.convex_hull(locs_2d, edges=True)
-        self.projections = mapping.project(locs_2d,indices, edges)
+        angle = kwargs.get("angle", 0)%360
+        self.projections = SetupCache().get("projection", locs, (angle,), lambda: mapping.tree_projection(locs, angle))
         logging.debug("Projection X min/max: "+ f"{np.min(self.projections[:,0])}/{np.max(self.projections[:,0])}")
         logging.debug("Projection Y min/max: "+ f"{np.min(self.projections[:,1])}/{np.max(self.projections[:,1])}")
         
@@ -205,17 +201,14 @@ class Video(Animation):
                     i = KEYPOINT_DICT[key]
                     circles[key].update(xy[i], conf[i])
 
-            color = self.background(counterA, 100, iA)
-            for idx in range(self.num_leds):
-                self.strip.setPixelColor(int(idx), color)
+            frame = np.full(self.num_leds, self.background(counterA, 100, iA), dtype=np.uint32)
             color = self.color(counterB, 100, iB)
             for name in circles:
                 circle = circles[name]
                 dists = np.sum(np.square(self.projections-np.expand_dims(circle.location,axis=0)),axis=1)
-                for idx in np.where(dists<self.radius)[0]:
-                    self.strip.setPixelColor(int(idx), color)
+                frame[dists<self.radius] = color
 
-            self.strip.show()
+            self.show_frame(frame)
             counterA += 1
             if(counterA > 100):
                 counterA = 0
@@ -224,7 +217,7 @@ class Video(Animation):
             if(counterB > 100):
                 counterB = 0
                 iB += 1
-            time.sleep(1./30)
+            self.clock.tick()
         self.reader.stop()
         self.reader.join()
         self.picam2.close()
\ No newline at end of file
@@ -1,19 +1,30 @@
+let eventSource = null;
+
 function startScan() {
-    const eventSource = new EventSource('/bluetooth/scan');
+    if (eventSource) {
+        return;
+    }
+    eventSource = new EventSource('/bluetooth/scan');
 
+    // one message per device that was found: {"mac_address": ..., "name": ...}
     eventSource.onmessage = function(event) {
-        console.log("Received:", event.data);
-        // Parse and display the device info as needed
+        const device = JSON.parse(event.data);
+        console.log("Found:", device.name, device.mac_address);
     };
 
     eventSource.onerror = function(event) {
         console.error("Error:", event);
         eventSource.close();
+        eventSource = null;
     };
 }
 
-// To stop scanning, call the stop-scan endpoint:
+// Closing the stream stops the scan once nobody else is watching, stop-scan stops it for everyone
 function stopScan() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
     fetch('/bluetooth/stop-scan', { method: 'POST' })
         .then(response => response.json())
         .then(data => console.log(data));
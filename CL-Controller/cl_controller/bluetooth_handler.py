@@ -1,94 +1,192 @@
 from flask_restx import Namespace, Resource
-from flask import jsonify, request, Response, render_template
+from flask import request, Response, render_template
 import subprocess
 import threading
+import logging
+import queue
+import json
 import time
+import os
 import re
+from . import jobs
 
 bluetooth_api = Namespace("bluetooth", description="Bluetooth related operations")
-scan_process = None
-stop_scan = False
-lock = threading.Lock()
+SCAN_DURATION = 15 #seconds
+KEEP_ALIVE = 10 #seconds between keep-alive comments, a disconnected client is noticed when writing one
+#set to e.g. Test/fake_bluetoothctl to test without bluetooth
+BLUETOOTHCTL = os.environ.get("CL_BLUETOOTHCTL", "bluetoothctl")
 
-def clean_bluetooth_output(raw_output):
+ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+# e.g. "[NEW] Device MAC_ADDRESS Device_Name"
+NEW_DEVICE = re.compile(r'\[NEW\] Device ([0-9A-F:]{17}) (.+)')
+
+def parse_device(line):
     """
-    Clean the raw Bluetooth output by removing ANSI escape codes
-    and extracting relevant device information.
+    Returns the device of a "[NEW] Device" line of bluetoothctl, or None.
     """
-    # Remove ANSI escape codes
-    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-    cleaned_lines = [ansi_escape.sub('', line) for line in raw_output]
+    match = NEW_DEVICE.search(ANSI_ESCAPE.sub('', line))
+    if match:
+        return {"mac_address": match.group(1), "name": match.group(2).strip()}
+    return None
 
-    # Extract devices
-    devices = []
-    for line in cleaned_lines:
-        # Match lines containing discovered devices (e.g., "[NEW] Device MAC_ADDRESS Device_Name")
-        match = re.search(r'\[NEW\] Device ([0-9A-F:]{17}) (.+)', line)
-        if match:
-            mac_address = match.group(1)
-            name = match.group(2)
-            devices.append({"mac_address": mac_address, "name": name})
+class ScanSession:
+    """
+    One bluetoothctl process that scans for as long as anybody is listening.
+    Every listener gets its own queue with the devices, each device is only reported once per scan.
+    """
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ScanSession, cls).__new__(cls)
+            cls._instance._initialize()
+            #the scan of the parent is not inherited by the workers (gunicorn --preload)
+            os.register_at_fork(after_in_child=cls._instance._initialize)
+        return cls._instance
 
-    return devices
+    def _initialize(self):
+        self.process = None
+        self.devices = {} #mac address -> device, in the order they were found
+        self.listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> queue.Queue:
+        """
+        Starts scanning if needed. The queue receives the devices that were already found and every new one,
+        followed by None when the scan ends.
+        """
+        listener = queue.Queue()
+        with self._lock:
+            for device in self.devices.values():
+                listener.put(device)
+            self.listeners.append(listener)
+            if(self.process is None):
+                self._start()
+        return listener
 
-def bluetooth_scan_stream():
+    def unsubscribe(self, listener: queue.Queue):
+        with self._lock:
+            if(listener in self.listeners):
+                self.listeners.remove(listener)
+            if(len(self.listeners) == 0):
+                self._stop()
+
+    def stop(self) -> bool:
+        """
+        Stops the scan for everyone, returns False if there was none.
+        """
+        with self._lock:
+            scanning = self.process is not None
+            self._stop()
+            return scanning
+
+    def _start(self):
+        self.devices = {}
+        self.process = subprocess.Popen([BLUETOOTHCTL], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        self.process.stdin.write('scan on\n')
+        self.process.stdin.flush()
+        threading.Thread(target=self._read, args=(self.process,), daemon=True, name="bluetooth-scan").start()
+
+    def _stop(self):
+        process, self.process = self.process, None
+        if(process is None):
+            return
+        try:
+            process.stdin.write('scan off\nexit\n')
+            process.stdin.flush()
+        except OSError:
+            pass #it exited in the meantime
+        process.terminate()
+        process.wait()
+        for listener in self.listeners:
+            listener.put(None)
+        self.listeners = []
+
+    def _read(self, process):
+        for line in iter(process.stdout.readline, ''):
+            device = parse_device(line)
+            if(device is None):
+                continue
+            with self._lock:
+                if(process is not self.process or device["mac_address"] in self.devices):
+                    continue
+                self.devices[device["mac_address"]] = device
+                for listener in self.listeners:
+                    listener.put(device)
+        with self._lock:
+            if(process is self.process):
+                #bluetoothctl exited on its own
+                logging.warning("bluetoothctl exited with code " + str(process.poll()))
+                self.process = None
+                for listener in self.listeners:
+                    listener.put(None)
+                self.listeners = []
+
+def scan_stream(duration=None):
     """
-    Generator function to stream Bluetooth scan results in real-time.
+    Generator of the devices that are found, as server-sent events. Ends after duration seconds (if given)
+    or when the client disconnects, which also stops the scan if nobody else is listening.
     """
-    global scan_process, stop_scan
+    session = ScanSession()
+    listener = session.subscribe()
+    end = None if duration is None else time.monotonic()+duration
+    try:
+        while end is None or time.monotonic() < end:
+            timeout = KEEP_ALIVE if end is None else min(KEEP_ALIVE, max(end-time.monotonic(), 0))
+            try:
+                device = listener.get(timeout=timeout)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            if(device is None):
+                break
+            yield f"data: {json.dumps(device)}\n\n"
+    finally:
+        session.unsubscribe(listener)
 
+def scan_job(job, duration=SCAN_DURATION):
+    """
+    Scans for devices for the given number of seconds, reporting every new device as progress of the job.
+    """
+    session = ScanSession()
+    listener = session.subscribe()
+    devices = []
+    start = time.monotonic()
     try:
-        # Start bluetoothctl in a subprocess
-        scan_process = subprocess.Popen(
-            ['bluetoothctl'],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1  # Line buffering
-        )
-
-        # Send 'scan on' command
-        scan_process.stdin.write('scan on\n')
-        scan_process.stdin.flush()
-
-        # Read and yield output line-by-line
-        for line in iter(scan_process.stdout.readline, ''):
-            if stop_scan:
+        while(time.monotonic()-start < duration):
+            try:
+                device = listener.get(timeout=max(duration-(time.monotonic()-start), 0))
+            except queue.Empty:
+                break
+            if(device is None):
                 break
-            yield f"data: {line.strip()}\n\n"  # Format for SSE (Server-Sent Events)
+            devices.append(device)
+            job.update(progress=(time.monotonic()-start)/duration, device=device)
     finally:
-        with lock:
-            if scan_process:
-                scan_process.stdin.write('scan off\nexit\n')
-                scan_process.stdin.flush()
-                scan_process.terminate()
-                scan_process.wait()
-
-@bluetooth_api.route('/scan', methods=['GET'])
+        session.unsubscribe(listener)
+    return devices
+
+@bluetooth_api.route('/scan', methods=['GET', 'POST'])
 class ScanDevices(Resource):
     def get(self):
-        global scan_process, stop_scan
-        gen = bluetooth_scan_stream()
-        devices = []
-        def gather_data():
-            for line in gen:
-                devices.append(line)
-        thread = threading.Thread(target=gather_data)
-        thread.start()
-        time.sleep(15)
-        stop_scan = True
-        time.sleep(1)
-        with lock:
-            if scan_process:
-                scan_process.stdin.write('scan off\nexit\n')
-                scan_process.stdin.flush()
-                scan_process.terminate()
-                scan_process.wait()
-        thread.join()
-        devices = clean_bluetooth_output(devices)
-        return jsonify(devices)
-        #return Response(bluetooth_scan_stream(), mimetype='text/event-stream')
+        """
+        Streams the devices that are found as server-sent events, one json object per device.
+        Optional query parameter: duration (seconds), otherwise the scan runs until the client disconnects.
+        """
+        duration = request.args.get("duration", default=None, type=float)
+        return Response(scan_stream(duration), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    def post(self):
+        """
+        Scans in the background, see /api/jobs/<job>/events for the devices that are found.
+        Optional body: {"duration": seconds}
+        """
+        duration = float((request.get_json(silent=True) or {}).get("duration", SCAN_DURATION))
+        job = jobs.JobManager().submit("bluetooth scan", scan_job, duration)
+        if(jobs.wants_events(request)):
+            return jobs.event_response(job)
+        return {"success": True, "job": job.id}
 
 @bluetooth_api.route('/stop-scan', methods=['POST'])
 class StopScan(Resource):
@@ -96,15 +194,10 @@ class StopScan(Resource):
         """
         Stop scanning for Bluetooth devices.
         """
-        if scan_process:
-            scan_process.stdin.write('scan off\n')
-            scan_process.stdin.flush()
-            scan_process.terminate()
-            scan_process.wait()
-            scan_process = None
-            return jsonify({"message": "Scanning stopped"})
+        if ScanSession().stop():
+            return {"message": "Scanning stopped"}
         else:
-            return jsonify({"error": "No active scan process"}), 400
-        
+            return {"error": "No active scan process"}, 400
+
 def render_webpage():
-    return render_template("bluetooth.html")
\ No newline at end of file
+    return render_template("bluetooth.html")
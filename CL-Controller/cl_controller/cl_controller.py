@@ -1,8 +1,17 @@
 # -*- coding: utf-8 -*-
-from flask import Flask, request, redirect
+from flask import Flask, Response, request, redirect
 from flask_restx import Api, Resource, fields
 from .ws2811Controller import ws2811Controller
 from .animations import animations as anim
+from .animations import precompute
+from .animations.clips import ClipLibrary
+from .animations import compositor
+from . import stream as frame_stream
+from . import ddp
+from . import metrics
+from . import utils
+from . import hardware
+from . import jobs
 import subprocess
 import logging
 import cl_controller.web.webcontroller as webcontroller
@@ -21,13 +30,24 @@ LED_DMA = 10          # DMA channel to use for generating signal (try 10)
 LED_BRIGHTNESS = 255  # Set to 0 for darkest and 255 for brightest
 LED_INVERT = False    # True to invert the signal (when using NPN transistor level shift)
 LED_CHANNEL = 0       # set to '1' for GPIOs 13, 19, 41, 45 or 53
+ANIMATION_FPS = 30    # Target frame rate of the animations (can be overridden per request with 'fps')
+ANIMATION_TRANSITION = 1.0 # Seconds of crossfade when an animation is started (can be overridden per request with 'transition')
+ANIMATION_CLIPS = True # Bake looping animations into clips and play those the next time (can be disabled per request with 'clip')
+MAX_FPS = 240         # Highest frame rate a request may ask for
+HARDWARE_PROCESS = False # Drive the strip from a separate process, so gunicorn can run several workers (can be overridden with wsgi:main(hardware_process=...))
 
 SWITCH_PIN = 23     #GPIO in BCM channel
 SHUTDOWN_PIN = 3
 
 class LEDUtil():
-    def __init__(self, *args, **kwargs):
-        self.controller = ws2811Controller(LED_COUNT, LED_PIN, LED_FREQ_HZ, LED_DMA, LED_INVERT, LED_BRIGHTNESS, LED_CHANNEL, SWITCH_PIN)
+    """
+    The operations of the api on the controller. See hardware.RemoteLEDUtil for the same operations
+    on a controller in another process.
+    """
+    def __init__(self, animdata=None, led_buffer=None):
+        self.controller = ws2811Controller(LED_COUNT, LED_PIN, LED_FREQ_HZ, LED_DMA, LED_INVERT, LED_BRIGHTNESS, LED_CHANNEL, SWITCH_PIN, led_buffer=led_buffer)
+        self.animdata = animdata if animdata is not None else anim.AnimData()
+        self.ddp_listener = None
         logging.info("Initialized controller:"+str(self.controller))
         self.controller.begin()
 
@@ -36,7 +56,7 @@ class LEDUtil():
     
     @property
     def leds(self):
-        return self.controller.leds
+        return self.controller.leds.to_list()
 
     def get(self, led_id):
         return self.controller.get(led_id)
@@ -66,18 +86,177 @@ class LEDUtil():
         led = self.get(led_id)
         if(led is None):
             return {"success": False, "message": f"Could not find LED with ID {led_id:d}"}
-        backup = led.copy()
-        led.update(data)
-        if(self.controller.update(led, show=True)):
-            return {"success": True, **led}
+        #only the given fields, so the store knows which ones are missing (e.g. the brightness of a led that is turned on)
+        if(self.controller.update({**data, "id": led_id}, show=True)):
+            return {"success": True, **self.get(led_id)}
         else:
-            led.update(backup)
             return {"success": False, "message": ""}
 
+    def update_many(self, data):
+        """
+        Applies a batch of led updates and shows the result once.
+        data: either a list of (partial) led instructions, e.g. [{"id": 0, "color": "255,0,0", "state": true}, ...],
+              or a compact dict of columns, e.g. {"id": [0, 1, 2], "color": ["255,0,0", "0,255,0", "0,0,255"], "state": true}
+              in which a single value applies to all ids.
+        """
+        try:
+            instructions = parse_batch(data)
+        except (KeyError, TypeError, ValueError) as e:
+            return {"success": False, "message": "Invalid batch: " + str(e)}
+        logging.info(f"Received batch update of {len(instructions):d} leds")
+        for instruction in instructions:
+            if(self.get(instruction["id"]) is None):
+                return {"success": False, "message": f"Could not find LED with ID {instruction['id']:d}"}
+        if(self.controller.update_all(instructions, show=True)):
+            return {"success": True, "count": len(instructions)}
+        return {"success": False, "message": ""}
+
+    def play(self, data):
+        """
+        Starts the animation with the name and settings in data, from its clip if it was baked before.
+        """
+        animation_cls = self.animdata.get(data["name"])
+        if(animation_cls is None):
+            return {"success": False, "message": "Could not find animation '" + data["name"] +"'."}
+        fps = data.get("fps", ANIMATION_FPS)
+        transition = data.get("transition", ANIMATION_TRANSITION)
+        use_clips = data.get("clip", ANIMATION_CLIPS)
+        if(use_clips):
+            clip = ClipLibrary().get(data["name"], animation_cls, data, fps)
+            if(clip is not None):
+                self.controller.play_animation(clip, transition=transition)
+                return {"success": True, "clip": True}
+        animation = animation_cls(fps=fps)
+        result = animation.setup(**data)
+        if(result["success"]):
+            self.controller.play_animation(animation, transition=transition)
+            if(use_clips and animation.renders_frames and animation.loop_duration):
+                ClipLibrary().bake_async(data["name"], animation_cls, data, fps)
+        else:
+            del animation
+        return result
+
+    def play_layers(self, data):
+        animation = compositor.Compositor(fps=data.get("fps", ANIMATION_FPS))
+        result = animation.setup(**data)
+        if(result["success"]):
+            self.controller.play_animation(animation, transition=data.get("transition", ANIMATION_TRANSITION))
+        return result
+
+    def stop_animation(self):
+        self.controller.stop_animation()
+        return {"success": True}
+
+    def start_ddp(self, port: int = ddp.DDP_PORT):
+        #realtime led data over UDP, bypasses flask entirely
+        try:
+            self.ddp_listener = ddp.DDPListener(self.controller, port=port)
+            self.ddp_listener.start()
+        except OSError as e:
+            logging.error("Could not start the DDP listener: " + str(e))
+            self.ddp_listener = None
+
+    def ddp_stats(self):
+        if(self.ddp_listener is None):
+            return {"success": False, "message": "The DDP listener is not enabled"}
+        return {"success": True, **self.ddp_listener.stats()}
+
+    def stream_stats(self):
+        animation = self.controller.animation
+        if(isinstance(animation, frame_stream.FrameStream)):
+            return {"active": True, **animation.stats()}
+        return {"active": False}
+
+    def receive_stream(self, stream, fmt: str, fps: float):
+        return frame_stream.receive(stream, self.controller, fmt=fmt, fps=fps)
+
+    def metrics(self) -> str:
+        return str(metrics.collect(self.controller, self.ddp_listener))
+
+def check_fps(fps) -> str | None:
+    """
+    Returns why the requested frame rate can not be used, or None if it can.
+    """
+    if(isinstance(fps, bool) or not isinstance(fps, (int, float))):
+        return "fps has to be a number"
+    if(not 0 < fps <= MAX_FPS):
+        return f"fps has to be greater than 0 and at most {MAX_FPS:d}"
+    return None
+
+def check_transition(transition) -> str | None:
+    """
+    Returns why the requested crossfade duration can not be used, or None if it can.
+    """
+    if(isinstance(transition, bool) or not isinstance(transition, (int, float))):
+        return "transition has to be a number"
+    if(not transition >= 0):
+        return "transition has to be at least 0"
+    return None
+
+def check_play(data: dict) -> str | None:
+    """
+    Checks the fps and transition of a request that starts an animation.
+    """
+    if("fps" in data and check_fps(data["fps"])):
+        return check_fps(data["fps"])
+    if("transition" in data):
+        return check_transition(data["transition"])
+    return None
+
+def check_instruction(instruction: dict) -> dict:
+    """
+    Raises TypeError or ValueError if the color, state or brightness of a led instruction is invalid.
+    """
+    if("color" in instruction and (not isinstance(instruction["color"], str) or utils.color_channels(instruction["color"]) is None)):
+        raise ValueError(f"Invalid color {instruction['color']!r} for LED {instruction['id']:d}, expected 'r,g,b'")
+    if("state" in instruction and not isinstance(instruction["state"], bool)):
+        raise TypeError(f"Invalid state {instruction['state']!r} for LED {instruction['id']:d}, expected true or false")
+    if("brightness" in instruction):
+        brightness = instruction["brightness"]
+        if(isinstance(brightness, bool) or not isinstance(brightness, int) or not 0 <= brightness <= 255):
+            raise ValueError(f"Invalid brightness {brightness!r} for LED {instruction['id']:d}, expected an integer in 0...255")
+    return instruction
+
+def parse_batch(data) -> list[dict]:
+    """
+    Converts the body of a batch request (see LEDUtil.update_many) to a list of led instructions,
+    raises KeyError, TypeError or ValueError if any of them is invalid.
+    """
+    if(isinstance(data, dict)):
+        ids = data["id"]
+        if(not isinstance(ids, list)):
+            raise TypeError("'id' should be a list")
+        columns = {}
+        for key in ["color", "state", "brightness"]:
+            if(key not in data):
+                continue
+            value = data[key]
+            if(isinstance(value, list)):
+                if(len(value) != len(ids)):
+                    raise ValueError(f"'{key}' has {len(value):d} values for {len(ids):d} ids")
+                columns[key] = value
+            else:
+                columns[key] = [value]*len(ids)
+        return [check_instruction({"id": int(led_id), **{key: column[j] for key, column in columns.items()}}) for j, led_id in enumerate(ids)]
+    elif(isinstance(data, list)):
+        instructions = []
+        for instruction in data:
+            if(not isinstance(instruction, dict)):
+                raise TypeError("Every instruction should be an object")
+            instructions.append({key: instruction[key] for key in ["color", "state", "brightness"] if key in instruction})
+            instructions[-1]["id"] = int(instruction["id"])
+            check_instruction(instructions[-1])
+        return instructions
+    raise TypeError("Expected a list of instructions or a dict of columns")
+
 def create_app(**kwargs):
     logging.debug("Starting")
     animdata = anim.AnimData(**kwargs)
-    led_util = LEDUtil()
+    if(kwargs.get("hardware_process", HARDWARE_PROCESS)):
+        #the strip, its led states and the DDP listener live in another process, this one only forwards the requests
+        led_util = hardware.start(LED_COUNT, setup_hardware, kwargs)
+    else:
+        led_util = setup_hardware(kwargs)
     root_path = os.path.dirname(os.path.abspath(__file__))
     print("Using root path", root_path)
     app = Flask(__name__, root_path=root_path, template_folder='assets/templates', static_folder='assets/static')
@@ -93,6 +272,18 @@ def create_app(**kwargs):
     ns_all = api.namespace('all', description="Global LED operations", path="/api/all")
     ns_anim = api.namespace('anim', description="Animation related operations", path="/api/anim")
     ns_rpi = api.namespace('rpi', description="Raspberry Pi related operations", path="/api/rpi")
+    ns_stream = api.namespace('stream', description="Stream frames rendered elsewhere", path="/api/stream")
+    ns_jobs = api.namespace('jobs', description="Background jobs and their progress", path="/api/jobs")
+
+    def start_job(name, func, *args):
+        """
+        Runs func(job, *args) in the background. Responds with the id of the job or, if the client
+        accepts text/event-stream, with the events of the job.
+        """
+        job = jobs.JobManager().submit(name, func, *args)
+        if(jobs.wants_events(request)):
+            return jobs.event_response(job)
+        return {"success": True, "job": job.id}
 
     leds_model = api.model('leds', {
         'id': fields.Integer(readonly=True, description="The LED's number"),
@@ -108,10 +299,14 @@ def create_app(**kwargs):
         'brightness': fields.Integer(required=False, description="Sets the LEDs' brightness")
     })
 
+    @app.route("/api/metrics")
+    def frame_metrics():
+        #frame timing in the Prometheus text format, to tune animations under real load
+        return Response(led_util.metrics(), content_type=metrics.MetricsText.content_type)
+
     @app.route("/home")
     def webpage():
-        importlib.reload(webcontroller)
-        return webcontroller.render_webpage(animation=request.args.get("animation", default=None, type=str), preset=request.args.get("preset", default=None, type=int))
+        return webcontroller.webpage_response(request, animation=request.args.get("animation", default=None, type=str), preset=request.args.get("preset", default=None, type=int))
 
     try:
         import video_stream_opencv as video_stream
@@ -177,6 +372,17 @@ def create_app(**kwargs):
             """
             return led_util.update(api.payload, led_id)
 
+    @ns_leds.route("/batch")
+    class LEDBatch(Resource):
+        def patch(self):
+            """
+            Update many leds at once, the strip is only shown once.
+            Accepts a list of leds or a dict of columns: {"id": [...], "color": [...] or "r,g,b", "state": [...] or bool, "brightness": [...] or int}
+            """
+            result = led_util.update_many(api.payload)
+            #nothing was applied if the batch is invalid
+            return result if result["success"] else (result, 400)
+
     @ns_anim.route("/")
     class AnimList(Resource):
         def get(self):
@@ -185,24 +391,37 @@ def create_app(**kwargs):
         def post(self):
             data = api.payload
             #print(data)
+            error = check_play(data)
+            if(error):
+                return {"success": False, "message": error}, 400
             if("name" in data):
-                animation = animdata.get(data["name"])
-                if(animation is not None):
-                    animation = animation()
-                    result = animation.setup(**data)
-                    if(result["success"]):
-                        led_util.controller.play_animation(animation)
-                    else:
-                        del animation
-                    return result
-                else:
-                    return {"success": False, "message": "Could not find animation '" + data["name"] +"'."}
+                if(data.get("async", False)):
+                    #setting up an animation can take a while, don't keep the client waiting
+                    return start_job("animation", lambda job, data: led_util.play(data), data)
+                return led_util.play(data)
             elif("stop" in data):
-                led_util.controller.stop_animation()
-                return {"success": True}
+                return led_util.stop_animation()
             else:
                 return {"success": False, "message": "No animation name specified."}
 
+    @ns_anim.route("/layers")
+    class AnimLayers(Resource):
+        def get(self):
+            return {"blend_modes": compositor.BLEND_MODES}
+
+        def post(self):
+            """
+            Play several animations on top of each other, e.g.
+            {"layers": [{"name": "fade"}, {"name": "snow", "blend": "alpha", "mask": {"axis": "z", "min": 0.5}}]}
+            """
+            data = api.payload
+            error = check_play(data)
+            if(error):
+                return {"success": False, "message": error}, 400
+            if(data.get("async", False)):
+                return start_job("layers", lambda job, data: led_util.play_layers(data), data)
+            return led_util.play_layers(data)
+
     @ns_anim.route("/<string:name>")
     @ns_anim.response(404, "animation not found")
     @ns_anim.param("name", "The name of the animation")
@@ -214,6 +433,54 @@ def create_app(**kwargs):
                 return {"success": True, **animation.instructions}
             return {"success": False, "message": "Unknown animation name"}
 
+    @ns_stream.route("/")
+    class FrameStream(Resource):
+        def get(self):
+            return led_util.stream_stats()
+
+        def post(self):
+            """
+            Stream raw frames in the (chunked) request body, the statistics are returned once the stream ends.
+            Query parameters: format ('rgb': 3 bytes per led, 'packed': 4 byte little-endian colors per led) and fps.
+            """
+            fmt = request.args.get("format", default="rgb", type=str)
+            fps = request.args.get("fps", default=frame_stream.STREAM_FPS, type=float)
+            error = check_fps(fps)
+            if(error):
+                return {"success": False, "message": error}, 400
+            return led_util.receive_stream(request.stream, fmt=fmt, fps=fps)
+
+    @ns_stream.route("/ddp")
+    class DDPStats(Resource):
+        def get(self):
+            return led_util.ddp_stats()
+
+    @ns_jobs.route("/")
+    class JobList(Resource):
+        def get(self):
+            return {"jobs": jobs.JobManager().to_list()}
+
+    @ns_jobs.route("/<string:job_id>")
+    @ns_jobs.param("job_id", "The id of the job")
+    class JobInformation(Resource):
+        def get(self, job_id):
+            job = jobs.JobManager().get(job_id)
+            if(job is None):
+                return {"success": False, "message": "Unknown job"}, 404
+            return {"success": True, **job.to_dict()}
+
+    @ns_jobs.route("/<string:job_id>/events")
+    @ns_jobs.param("job_id", "The id of the job")
+    class JobEvents(Resource):
+        def get(self, job_id):
+            """
+            The progress of the job as server-sent events, the stream ends when the job is done.
+            """
+            job = jobs.JobManager().get(job_id)
+            if(job is None):
+                return {"success": False, "message": "Unknown job"}, 404
+            return jobs.event_response(job, request.headers.get("Last-Event-ID"))
+
     @ns_rpi.route("/")
     class RPIInformation(Resource):
         def post(self):
@@ -221,6 +488,8 @@ def create_app(**kwargs):
             if("option" in data):
                 option = data["option"]
                 if(option in ["kill", "reboot", "shutdown"]):
+                    if(data.get("async", False)):
+                        return start_job(option, lambda job, option: dict(zip(["success", "stdout", "stderr"], shutdown(option))), option)
                     success, stdout, stderr = shutdown(option)
                     return {"success": success, "message": stdout if success else stderr}
             return {"success": False, "message": "Unknown option"}
@@ -249,15 +518,31 @@ def create_app(**kwargs):
         if(proc.stdout.strip() == "active"):
             return True, proc.stdout, proc.stderr
         return False, proc.stdout, proc.stderr
-        
-    def button_shutdown(option="shutdown"):
-        requests.post("http://localhost/api/rpi", json={"option": "shutdown"})
-        time.sleep(3)
-    
+
+    return app
+
+def button_shutdown(option="shutdown"):
+    requests.post("http://localhost/api/rpi", json={"option": "shutdown"})
+    time.sleep(3)
+
+def setup_hardware(kwargs, led_buffer=None) -> LEDUtil:
+    """
+    Creates the controller and everything that drives the strip directly.
+    Runs in the hardware process if HARDWARE_PROCESS is set (see hardware.start).
+    """
+    animdata = anim.AnimData(**kwargs)
+    try:
+        #fill the setup cache in the background, so starting an animation doesn't block a worker
+        precompute.warm_up(anim.get_locations())
+    except Exception as e:
+        logging.error("Could not start precomputing animation setups: " + str(e))
+    led_util = LEDUtil(animdata, led_buffer=led_buffer)
+    if(kwargs.get("ddp", False)):
+        led_util.start_ddp(kwargs.get("ddp_port", ddp.DDP_PORT))
     print("Setting up shutdown trigger")
     led_util.get_controller().setup_trigger(SHUTDOWN_PIN, button_shutdown)
     print("Shutdown trigger set up")
-    return app
+    return led_util
 
 if __name__=="__main__":
     app = create_app()
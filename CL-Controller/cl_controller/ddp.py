@@ -0,0 +1,194 @@
+"""
+Listener for the Distributed Display Protocol (DDP), a lightweight UDP protocol for realtime led data
+that is supported by e.g. xLights, WLED and LedFx. Packets are written to the strip directly,
+without going through flask or the LEDUtil. See http://www.3waylabs.com/ddp/ for the protocol.
+"""
+import os
+import time
+import socket
+import struct
+import logging
+import threading
+import numpy as np
+
+DDP_PORT = 4048
+HEADER = struct.Struct(">BBBBIH") #flags, sequence number, data type, destination id, data offset, data length
+TIMECODE = struct.Struct(">I")
+
+#flags
+VERSION_MASK = 0xc0
+VERSION_1 = 0x40
+TIMECODE_FLAG = 0x10
+PUSH_FLAG = 0x01
+
+#destination ids that do not contain led data
+STATUS_IDS = {246, 250, 251, 254, 255}
+#data types of 8 bit rgb: 0x0b as in the specification, 0x01 is sent by some implementations
+RGB8_TYPES = {0x0b, 0x01}
+
+def timecode(t: float | None = None) -> int:
+    """
+    The DDP timecode of the given time: 16 bits of seconds and 16 bits of fraction, wrapping every 18 hours.
+    """
+    if(t is None):
+        t = time.time()
+    return int(t*65536) & 0xffffffff
+
+def next_sequence(sequence: int, count: int = 1) -> int:
+    """
+    The sequence number count packets after the given one. They run from 1 to 15, 0 means they are not used.
+    """
+    if(sequence == 0):
+        return 0
+    return (sequence-1+count) % 15 + 1
+
+def build_packets(rgb: bytes, sequence: int = 0, max_payload: int = 1440, with_timecode: bool = True) -> list[bytes]:
+    """
+    Splits a frame of r,g,b bytes into DDP packets. The push flag is set on the last one.
+    sequence: the sequence number of the first packet, every following packet gets the next one (see next_sequence)
+    """
+    packets = []
+    for i, offset in enumerate(range(0, max(len(rgb), 1), max_payload)):
+        data = rgb[offset:offset+max_payload]
+        last = offset+max_payload >= len(rgb)
+        flags = VERSION_1 | (PUSH_FLAG if last else 0) | (TIMECODE_FLAG if with_timecode else 0)
+        header = HEADER.pack(flags, next_sequence(sequence & 0x0f, i), 0x0b, 1, offset, len(data))
+        if(with_timecode):
+            header += TIMECODE.pack(timecode())
+        packets.append(header+data)
+    return packets
+
+class DDPListener:
+    """
+    Receives DDP packets on a UDP port and shows every pushed frame on the controller's strip.
+    Keeps counters of the received packets and frames, the packets that were lost (gaps in the sequence numbers)
+    and the latency of the packets that carry a timecode (which requires the clocks of both machines to be synchronized).
+    """
+    def __init__(self, controller, port: int = DDP_PORT, host: str = "0.0.0.0"):
+        self.controller = controller
+        self.port = port
+        self.host = host
+        self.num_leds = controller.led_count()
+        self.buffer = np.zeros(self.num_leds*3, dtype=np.uint8)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._socket = None
+        self._was_running = False
+        self.reset_stats()
+        #the listener only lives in one process: after a fork (gunicorn --preload) it moves to the child
+        os.register_at_fork(before=self._before_fork, after_in_child=self._after_fork)
+
+    def reset_stats(self):
+        self.packets = 0
+        self.frames = 0
+        self.bytes = 0
+        self.lost = 0
+        self.invalid = 0
+        self.latency_count = 0
+        self.latency_sum = 0.
+        self.latency_max = 0.
+        self.last_sequence = 0
+
+    def stats(self) -> dict:
+        return {"port": self.port, "running": self.running, "packets": self.packets, "frames": self.frames,
+                "bytes": self.bytes, "lost": self.lost, "invalid": self.invalid,
+                "loss": self.lost/max(self.lost+self.packets, 1),
+                "latency_avg": self.latency_sum/self.latency_count if self.latency_count else None,
+                "latency_max": self.latency_max if self.latency_count else None}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if(self.running):
+            return
+        self._stop_event.clear()
+        #bind in start() so a port that is in use is reported right away
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.settimeout(0.5)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ddp")
+        self._thread.start()
+        logging.info(f"Listening for DDP on port {self.port:d}")
+
+    def stop(self):
+        self._stop_event.set()
+        if(self._thread is not None):
+            self._thread.join()
+            self._thread = None
+        if(self._socket is not None):
+            self._socket.close()
+            self._socket = None
+
+    def _before_fork(self):
+        self._was_running = self.running
+        if(self._was_running):
+            self.stop()
+
+    def _after_fork(self):
+        self._thread = None
+        if(self._was_running):
+            self.start()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                packet = self._socket.recv(65536)  # type: ignore
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            try:
+                self.handle(packet, time.time())
+            except Exception:
+                logging.error("Error while handling a DDP packet", exc_info=True)
+
+    def handle(self, packet: bytes, received: float):
+        """
+        Processes a single DDP packet, received at the given time.
+        """
+        if(len(packet) < HEADER.size or packet[0] & VERSION_MASK != VERSION_1):
+            self.invalid += 1
+            return
+        flags, sequence, data_type, destination, offset, length = HEADER.unpack_from(packet)
+        start = HEADER.size
+        if(flags & TIMECODE_FLAG):
+            if(len(packet) < start+TIMECODE.size):
+                self.invalid += 1
+                return
+            latency = ((timecode(received)-TIMECODE.unpack_from(packet, start)[0]) & 0xffffffff)/65536
+            start += TIMECODE.size
+            if(latency < 32768): #otherwise the sender's clock is ahead of ours
+                self.latency_count += 1
+                self.latency_sum += latency
+                self.latency_max = max(self.latency_max, latency)
+        self.packets += 1
+        self.bytes += len(packet)
+        sequence &= 0x0f
+        if(sequence != 0):
+            if(self.last_sequence != 0):
+                #sequence numbers run from 1 to 15, 0 means the sender does not use them
+                self.lost += (sequence-self.last_sequence-1) % 15
+            self.last_sequence = sequence
+        if(destination in STATUS_IDS):
+            return
+        if(data_type not in RGB8_TYPES):
+            self.invalid += 1
+            return
+        data = np.frombuffer(packet, dtype=np.uint8, count=min(length, len(packet)-start), offset=start)
+        #data that does not fit on the strip is ignored
+        data = data[:max(0, len(self.buffer)-offset)]
+        self.buffer[offset:offset+len(data)] = data
+        if(flags & PUSH_FLAG):
+            self.show()
+
+    def show(self):
+        controller = self.controller
+        if(controller.animation is not None):
+            controller.stop_animation()
+        if(not controller.on):
+            controller.turn_on()
+        controller.set_frame(self.buffer.reshape(self.num_leds, 3), show=True)
+        self.frames += 1
@@ -0,0 +1,245 @@
+"""
+Drives the strip from a process of its own (see HARDWARE_PROCESS in cl_controller.py).
+Only that process creates the controller, so the web workers never compete for the DMA channel or the GPIO pins.
+The workers send the api's commands to it over a multiprocessing connection and read the led states
+from shared memory without asking.
+"""
+import os
+import time
+import atexit
+import signal
+import logging
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from multiprocessing.connection import Listener, Client
+from .led_store import LEDStore
+from .metrics import MetricsText
+try:
+    from gevent import monkey
+    from gevent.socket import wait_read
+except ImportError:
+    monkey = None
+
+#the methods of LEDUtil that can be called from the web workers
+COMMANDS = ["update_all", "update", "update_many", "play", "play_layers", "stop_animation",
+            "ddp_stats", "stream_stats", "metrics"]
+#commands that only read, they don't wait for the others (e.g. while an animation is set up)
+READ_COMMANDS = ["ddp_stats", "stream_stats", "metrics"]
+STARTUP_TIMEOUT = 60 #seconds, the startup animation of the controller takes a few seconds
+MAX_IDLE_CONNECTIONS = 4 #per worker
+
+_process = None
+_shm = None
+_owner = None #pid of the process that started the hardware process
+
+def start(num_leds: int, setup, kwargs: dict) -> "RemoteLEDUtil":
+    """
+    Starts the hardware process, in which setup(kwargs, led_buffer=...) creates the LEDUtil that executes the commands.
+    Call this before the web workers are forked (gunicorn --preload): they inherit the shared memory
+    and connect to the hardware process when they send their first command.
+    """
+    global _process, _shm, _owner
+    _shm = shared_memory.SharedMemory(create=True, size=LEDStore.nbytes(num_leds))
+    _owner = os.getpid()
+    authkey = os.urandom(32)
+    #forked, so the process starts before any request was handled and setup does not need to be picklable
+    ctx = multiprocessing.get_context("fork")
+    receiver, sender = ctx.Pipe(duplex=False)
+    _process = ctx.Process(target=serve, args=(setup, kwargs, _shm, authkey, sender), name="cl-hardware")
+    _process.start()
+    sender.close()
+    atexit.register(stop)
+    if(not receiver.poll(STARTUP_TIMEOUT)):
+        stop()
+        raise RuntimeError("The hardware process did not start")
+    address = receiver.recv()
+    logging.info(f"Hardware process {_process.pid:d} is listening on {address}")
+    return RemoteLEDUtil(address, authkey, LEDStore.attach(num_leds, _shm.buf))
+
+def stop():
+    """
+    Stops the hardware process, which turns the strip off, and removes the shared memory.
+    Does nothing in the web workers.
+    """
+    global _process, _owner
+    if(os.getpid() != _owner):
+        return
+    if(_process is not None):
+        _process.terminate()
+        _process.join(timeout=5)
+        _process = None
+    if(_shm is not None):
+        #only the name is removed, the memory stays mapped as long as the led store uses it
+        _shm.unlink()
+    _owner = None
+
+def serve(setup, kwargs: dict, shm: shared_memory.SharedMemory, authkey: bytes, ready):
+    """
+    The main function of the hardware process.
+    """
+    def terminate(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, terminate)
+    parent = os.getppid()
+    def watch_parent():
+        #stop as well if the server dies without stopping us
+        while(os.getppid() == parent):
+            time.sleep(1)
+        os.kill(os.getpid(), signal.SIGTERM)
+    threading.Thread(target=watch_parent, daemon=True, name="parent-watch").start()
+
+    led_util = setup(kwargs, led_buffer=shm.buf)
+    server = HardwareServer(led_util, authkey)
+    ready.send(server.address)
+    ready.close()
+    try:
+        server.serve_forever()
+    finally:
+        led_util.get_controller().stop()
+
+class HardwareServer:
+    """
+    Executes the commands of the web workers on the LEDUtil, one at a time.
+    Every connection (one per worker) is handled in a thread of its own.
+    """
+    def __init__(self, led_util, authkey: bytes, address: str | None = None):
+        self.led_util = led_util
+        self.listener = Listener(address, family="AF_UNIX", authkey=authkey)
+        self.address = self.listener.address
+        self._lock = threading.Lock()
+
+    def serve_forever(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+                logging.warning("Rejected a connection to the hardware process: " + str(e))
+                continue
+            threading.Thread(target=self._handle, args=(connection,), daemon=True, name="hardware-client").start()
+
+    def _handle(self, connection):
+        with connection:
+            while True:
+                try:
+                    command, args = connection.recv()
+                except (EOFError, OSError):
+                    return
+                connection.send(self.execute(command, args))
+
+    def execute(self, command: str, args: tuple) -> tuple:
+        """
+        Returns ("ok", result) or ("error", message).
+        Commands that change the leds run one at a time, the ones that only read run right away.
+        """
+        if(command not in COMMANDS):
+            return ("error", f"Unknown command '{command}'")
+        try:
+            if(command in READ_COMMANDS):
+                return ("ok", getattr(self.led_util, command)(*args))
+            with self._lock:
+                return ("ok", getattr(self.led_util, command)(*args))
+        except Exception as e:
+            logging.error(f"Command {command} failed", exc_info=True)
+            return ("error", str(e))
+
+def wait_readable(connection):
+    """
+    Under the gevent worker (gunicorn -k gevent) recv() would block every greenlet of the worker
+    until the hardware process answers, so wait for the answer cooperatively first.
+    """
+    if(monkey is not None and monkey.is_module_patched("socket")):
+        wait_read(connection.fileno())
+
+class RemoteLEDUtil:
+    """
+    Has the methods of LEDUtil that the api uses, but executes them in the hardware process.
+    The led states are read directly from shared memory.
+    Every command that is waiting for its answer has a connection of its own, so a slow one
+    (e.g. setting up an animation) does not hold up the others.
+    """
+    def __init__(self, address: str, authkey: bytes, store: LEDStore):
+        self.address = address
+        self.authkey = authkey
+        self.store = store
+        self._idle = [] #connections that are not in use
+        self._lock = threading.Lock()
+        #every worker needs connections of its own
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def call(self, command: str, *args):
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        try:
+            if(connection is None):
+                connection = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+            connection.send((command, args))
+            wait_readable(connection)
+            status, result = connection.recv()
+        except (EOFError, OSError) as e:
+            if(connection is not None):
+                connection.close()
+            raise ConnectionError("Lost the connection to the hardware process") from e
+        with self._lock:
+            if(len(self._idle) < MAX_IDLE_CONNECTIONS):
+                self._idle.append(connection)
+            else:
+                connection.close()
+        if(status != "ok"):
+            raise RuntimeError(result)
+        return result
+
+    def _command(self, command: str, *args) -> dict:
+        try:
+            return self.call(command, *args)
+        except (ConnectionError, RuntimeError) as e:
+            return {"success": False, "message": str(e)}
+
+    @property
+    def leds(self):
+        return self.store.to_list()
+
+    def get(self, led_id):
+        return self.store.get(led_id)
+
+    def update_all(self, data):
+        return self._command("update_all", data)
+
+    def update(self, data, led_id=None):
+        return self._command("update", data, led_id)
+
+    def update_many(self, data):
+        return self._command("update_many", data)
+
+    def play(self, data):
+        return self._command("play", data)
+
+    def play_layers(self, data):
+        return self._command("play_layers", data)
+
+    def stop_animation(self):
+        return self._command("stop_animation")
+
+    def ddp_stats(self):
+        return self._command("ddp_stats")
+
+    def stream_stats(self):
+        return self._command("stream_stats")
+
+    def receive_stream(self, stream, fmt: str, fps: float):
+        return {"success": False, "message": "Frames can not be streamed over http to the hardware process, use DDP instead"}
+
+    def metrics(self) -> str:
+        #the metrics are still served when the hardware process is gone, so that can be alerted on
+        up = MetricsText()
+        try:
+            text = self.call("metrics")
+        except (ConnectionError, RuntimeError):
+            up.add("hardware_up", "gauge", "Whether the hardware process answers", 0)
+            return str(up)
+        up.add("hardware_up", "gauge", "Whether the hardware process answers", 1)
+        return text + str(up)
@@ -0,0 +1,164 @@
+"""
+Long operations (starting an animation, a bluetooth scan, shutting down) run as background jobs,
+so a request returns right away with the id of the job. Its progress can be polled on /api/jobs/<id>
+or followed as server-sent events on /api/jobs/<id>/events.
+Jobs are kept by the worker process that started them. With several workers, ask for the events on the
+same request instead (see wants_events), so they come from the right process.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import Response
+
+MAX_WORKERS = 4 #jobs that run at the same time
+MAX_FINISHED = 50 #finished jobs that are remembered
+KEEP_ALIVE = 15 #seconds between keep-alive comments on an idle event stream
+
+class Job:
+    """
+    Every change of a job is stored as an event {"id", "type", "data"}, so a client that connects late
+    (or reconnects with Last-Event-ID) still receives all of them.
+    """
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.state = "pending"
+        self.progress = 0.
+        self.message = ""
+        self.result = None
+        self.created = time.time()
+        self.finished = None
+        self.events = []
+        self._cond = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("done", "failed")
+
+    def _emit(self, event_type: str, data: dict):
+        with self._cond:
+            self.events.append({"id": len(self.events), "type": event_type, "data": data})
+            self._cond.notify_all()
+
+    def update(self, progress: float | None = None, message: str | None = None, **data):
+        """
+        Reports progress (0...1), a message and/or other data (e.g. a device that was found) to the listeners.
+        """
+        if(progress is not None):
+            self.progress = min(max(progress, 0.), 1.)
+        if(message is not None):
+            self.message = message
+        self._emit("progress", {"progress": self.progress, "message": self.message, **data})
+
+    def _run(self, func, args):
+        self.state = "running"
+        self._emit("state", {"state": self.state})
+        try:
+            self.result = func(self, *args)
+            if(isinstance(self.result, dict) and not self.result.get("success", True)):
+                #e.g. the result of an animation's setup
+                self.state = "failed"
+                self.message = self.result.get("message", "")
+            else:
+                self.state = "done"
+                self.progress = 1.
+        except Exception as e:
+            logging.error(f"Job {self.name} ({self.id}) failed", exc_info=True)
+            self.state = "failed"
+            self.message = str(e)
+        self.finished = time.time()
+        self._emit(self.state, self.to_dict())
+
+    def wait_event(self, index: int, timeout: float) -> bool:
+        """
+        Waits until there is an event with the given index, returns False on a timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self.events) > index, timeout)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "state": self.state, "progress": self.progress,
+                "message": self.message, "result": self.result, "created": self.created, "finished": self.finished}
+
+class JobManager:
+    _instance = None
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(JobManager, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+        #threads do not survive a fork (gunicorn --preload), the pool is created again when it is needed
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self.jobs = OrderedDict()
+
+    def submit(self, name: str, func, *args) -> Job:
+        """
+        Runs func(job, *args) in the background. Its return value (which should be json serializable)
+        becomes the result of the job.
+        """
+        job = Job(name)
+        with self._lock:
+            if(self._executor is None):
+                self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="job")
+            self.jobs[job.id] = job
+            self._forget_finished()
+            self._executor.submit(job._run, func, args)
+        return job
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished)-MAX_FINISHED)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def to_list(self) -> list[dict]:
+        return [job.to_dict() for job in list(self.jobs.values())]
+
+def format_event(event: dict) -> str:
+    return f"id: {event['id']:d}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+def stream_events(job: Job, last_event_id: int = -1):
+    """
+    Generator of the events of the job in the server-sent events format, ends after the job finished.
+    """
+    index = last_event_id+1
+    while True:
+        if(not job.wait_event(index, KEEP_ALIVE)):
+            yield ": keep-alive\n\n"
+            continue
+        while(index < len(job.events)):
+            event = job.events[index]
+            index += 1
+            yield format_event(event)
+            if(event["type"] in ("done", "failed")):
+                return
+
+def wants_events(request) -> bool:
+    """
+    Whether the client asked for the events of the job it starts as the response (Accept: text/event-stream).
+    """
+    return "text/event-stream" in request.headers.get("Accept", "")
+
+def event_response(job: Job, last_event_id=None) -> Response:
+    try:
+        last = int(last_event_id) if last_event_id is not None else -1
+    except ValueError:
+        last = -1
+    return Response(stream_events(job, last), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
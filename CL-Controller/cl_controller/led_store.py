@@ -0,0 +1,106 @@
+import numpy as np
+from . import utils
+
+#leds lose their color and brightness when they are turned off, these are used when they are turned on again without them
+ON_COLOR = (255, 255, 255)
+ON_BRIGHTNESS = 255
+
+class LEDStore:
+    """
+    Keeps the state of every led (color, on/off and brightness) in numpy arrays.
+    Leds are indexed by their id, so looking one up is O(1). The dicts used by the api
+    ({"id", "color", "state", "brightness"}) are only created when serializing.
+    buffer: keep the arrays in this buffer of at least LEDStore.nbytes(num_leds) bytes (e.g. shared memory)
+    """
+    def __init__(self, num_leds: int, color: str = "255,255,255", state: bool = False, brightness: int = 255, buffer=None):
+        self._map(num_leds, buffer)
+        self.colors[:] = utils.color_channels(color) or (0, 0, 0)
+        self.states[:] = state
+        self.brightness[:] = brightness
+
+    @staticmethod
+    def nbytes(num_leds: int) -> int:
+        return num_leds*(4+3+1)
+
+    @classmethod
+    def attach(cls, num_leds: int, buffer) -> "LEDStore":
+        """
+        A store on the buffer of an existing store, without resetting its contents.
+        """
+        store = cls.__new__(cls)
+        store._map(num_leds, buffer)
+        return store
+
+    def _map(self, num_leds: int, buffer):
+        if(buffer is None):
+            buffer = bytearray(self.nbytes(num_leds))
+        self.brightness = np.ndarray(num_leds, dtype=np.int32, buffer=buffer, offset=0)
+        self.colors = np.ndarray((num_leds, 3), dtype=np.uint8, buffer=buffer, offset=4*num_leds) #channels in the order of the color string
+        self.states = np.ndarray(num_leds, dtype=bool, buffer=buffer, offset=7*num_leds)
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, led_id):
+        return isinstance(led_id, (int, np.integer)) and 0 <= led_id < len(self)
+
+    def get(self, led_id: int) -> dict | None:
+        """
+        Returns a copy of the state of the led as a dict, or None if there is no such led
+        """
+        if(led_id not in self):
+            return None
+        return {"id": int(led_id), "color": ",".join(map(str, self.colors[led_id].tolist())),
+                "state": bool(self.states[led_id]), "brightness": int(self.brightness[led_id])}
+
+    def to_list(self) -> list[dict]:
+        colors = [f"{c0},{c1},{c2}" for c0, c1, c2 in self.colors.tolist()]
+        return [{"id": i, "color": color, "state": state, "brightness": brightness}
+                for i, (color, state, brightness) in enumerate(zip(colors, self.states.tolist(), self.brightness.tolist()))]
+
+    def update(self, led_id: int | slice, instruction: dict):
+        """
+        Applies the color, state and/or brightness in the instruction to the given led(s).
+        Leds that are turned off lose their color and brightness, when they are turned on again
+        without a color or brightness they get ON_COLOR and ON_BRIGHTNESS.
+        """
+        turned_on = ~self.states[led_id] & bool(instruction.get("state", False))
+        if("color" in instruction):
+            self.colors[led_id] = utils.color_channels(instruction["color"]) or (0, 0, 0)
+        if("brightness" in instruction):
+            self.brightness[led_id] = int(instruction["brightness"])
+        if("state" in instruction):
+            self.states[led_id] = bool(instruction["state"])
+        if(np.any(turned_on)):
+            ids = np.arange(len(self))[led_id][turned_on] if isinstance(led_id, slice) else led_id
+            if("color" not in instruction):
+                self.colors[ids] = ON_COLOR
+            if("brightness" not in instruction):
+                self.brightness[ids] = ON_BRIGHTNESS
+        off = ~self.states
+        if(isinstance(led_id, slice)):
+            self.colors[off] = 0
+            self.brightness[off] = 0
+        elif(off[led_id]):
+            self.colors[led_id] = 0
+            self.brightness[led_id] = 0
+
+    def update_all(self, instruction: dict):
+        self.update(slice(None), instruction)
+
+    def color(self, led_id: int) -> int:
+        """
+        The packed color (see utils.Color) of the given led
+        """
+        if(not self.states[led_id]):
+            return 0
+        c0, c1, c2 = self.colors[led_id].tolist()
+        return utils.color_brightness(c0, c2, c1, int(self.brightness[led_id]))
+
+    def frame(self) -> np.ndarray:
+        """
+        The packed colors of all leds
+        """
+        c = self.colors.astype(int)
+        colors = utils.color_brightness_array(c[:,0], c[:,2], c[:,1], self.brightness)
+        return np.where(self.states, colors, 0).astype(np.uint32)
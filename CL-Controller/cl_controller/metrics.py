@@ -0,0 +1,138 @@
+"""
+Frame timing of the animations and the strip output, in the Prometheus text format (see /api/metrics).
+"""
+import time
+import numpy as np
+
+QUANTILES = (0.5, 0.9, 0.99)
+PREFIX = "cl_controller_"
+
+class FrameTimes:
+    """
+    Ring buffer with the timing of the last frames: when each one was finished and how long it took.
+    Only the thread producing the frames calls record(), readers may see a frame that is being written.
+    interval: the intended time between frames, the jitter is the deviation from it (or from the median if None)
+    """
+    def __init__(self, size: int = 512, interval: float | None = None):
+        self.ends = np.zeros(size)
+        self.durations = np.zeros(size)
+        self.interval = interval
+        self.count = 0
+        self.total = 0. #summed duration of all frames
+
+    def record(self, start: float, end: float):
+        i = self.count % len(self.ends)
+        self.ends[i] = end
+        self.durations[i] = end-start
+        self.total += end-start
+        self.count += 1
+
+    def _ordered(self) -> tuple[np.ndarray, np.ndarray]:
+        size = len(self.ends)
+        if(self.count <= size):
+            return self.ends[:self.count], self.durations[:self.count]
+        i = self.count % size
+        return np.roll(self.ends, -i), np.roll(self.durations, -i)
+
+    def summary(self) -> dict:
+        """
+        Quantiles of the duration, the interval and the jitter of the buffered frames and the achieved fps.
+        """
+        ends, durations = self._ordered()
+        result = {"count": self.count, "total": self.total, "fps": 0.}
+        if(len(ends) > 0):
+            result["duration"] = quantiles(durations)
+        if(len(ends) > 1):
+            intervals = np.diff(ends)
+            target = self.interval if self.interval is not None else np.median(intervals)
+            result["interval"] = quantiles(intervals)
+            result["jitter"] = quantiles(np.abs(intervals-target))
+            if(time.monotonic()-ends[-1] < max(1., 2*np.max(intervals))):
+                #no fps when nothing was shown for a while
+                result["fps"] = (len(ends)-1)/max(ends[-1]-ends[0], 1e-9)
+        return result
+
+def quantiles(values: np.ndarray) -> dict:
+    return dict(zip(QUANTILES, np.quantile(values, QUANTILES)))
+
+class MetricsText:
+    """
+    Collects metric families and formats them in the Prometheus text exposition format.
+    """
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.families = {}
+
+    def add(self, name: str, kind: str, help: str, value: float, labels: dict | None = None, suffix: str = ""):
+        family = self.families.setdefault(PREFIX+name, {"type": kind, "help": help, "samples": []})
+        family["samples"].append((suffix, labels or {}, value))
+
+    def add_summary(self, name: str, help: str, values: dict | None, count: int, total: float, labels: dict | None = None):
+        labels = labels or {}
+        for q, value in (values or {}).items():
+            self.add(name, "summary", help, value, {**labels, "quantile": str(q)})
+        self.add(name, "summary", help, total, labels, suffix="_sum")
+        self.add(name, "summary", help, count, labels, suffix="_count")
+
+    def add_frame_times(self, name: str, times: FrameTimes, labels: dict):
+        """
+        Adds the duration summary, the interval and jitter quantiles and the fps of a FrameTimes buffer.
+        """
+        summary = times.summary()
+        self.add_summary(name+"_seconds", f"Time spent per frame ({name})", summary.get("duration"), summary["count"], summary["total"], labels)
+        #the quantiles of the interval and jitter only cover the buffered frames, so they are gauges without _sum and _count
+        for key, help in [("interval", "Time between frames"), ("jitter", "Deviation of the time between frames from the target")]:
+            for q, value in summary.get(key, {}).items():
+                self.add(f"{name}_{key}_seconds", "gauge", f"{help} ({name}), over the last {len(times.ends):d} frames",
+                         value, {**labels, "quantile": str(q)})
+        self.add(name+"_fps", "gauge", f"Achieved frames per second ({name})", summary["fps"], labels)
+
+    def __str__(self) -> str:
+        lines = []
+        for name, family in self.families.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for suffix, labels, value in family["samples"]:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{suffix}{{{label_text}}} {float(value):.9g}" if label_text else f"{name}{suffix} {float(value):.9g}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def collect(controller, ddp_listener=None) -> MetricsText:
+    """
+    Gathers the metrics of the strip output, the running animation and, if given, the DDP listener.
+    """
+    from .stream import FrameStream
+    metrics = MetricsText()
+    output = controller.output
+    metrics.add("frames_published_total", "counter", "Frames handed to the output thread", output.published)
+    metrics.add("frames_shown_total", "counter", "Frames written to the strip", output.shown)
+    metrics.add("frames_dropped_total", "counter", "Frames that were never shown", output.dropped, {"stage": "output"})
+    metrics.add("frames_failed_total", "counter", "Frames for which writing to the strip failed", output.failed)
+    metrics.add_frame_times("show", output.times, {})
+
+    animation = controller.animation
+    metrics.add("animation_running", "gauge", "Whether an animation is running", int(animation is not None))
+    if(animation is not None):
+        #render() animations are paced by the render loop, the others by their own clock
+        clock = controller.renderer.clock if animation.renders_frames else animation.clock
+        labels = {"animation": type(animation).__name__}
+        metrics.add("frames_dropped_total", "counter", "Frames that were never shown", clock.dropped, {"stage": "render", **labels})
+        metrics.add("animation_target_fps", "gauge", "Frame rate the animation is paced at", clock.fps, labels)
+        metrics.add_frame_times("render", clock.times, labels)
+        if(isinstance(animation, FrameStream)):
+            stats = animation.stats()
+            metrics.add("stream_frames_received_total", "counter", "Frames received over /api/stream", stats["frames"])
+            metrics.add("frames_dropped_total", "counter", "Frames that were never shown", stats["dropped"], {"stage": "stream"})
+
+    if(ddp_listener is not None):
+        stats = ddp_listener.stats()
+        metrics.add("ddp_packets_total", "counter", "DDP packets received", stats["packets"])
+        metrics.add("ddp_frames_total", "counter", "Frames shown from DDP", stats["frames"])
+        metrics.add("ddp_packets_lost_total", "counter", "DDP packets missing from the sequence", stats["lost"])
+        if(stats["latency_avg"] is not None):
+            metrics.add("ddp_latency_seconds", "gauge", "Average latency according to the DDP timecodes", stats["latency_avg"])
+    return metrics
@@ -1,41 +1,77 @@
+import time
 import logging
-from typing import List, Callable
+import numpy as np
+from typing import List, Callable, Sequence
 logger = logging.getLogger("PixelStrip")
 
 class PixelStrip:
-    def __init__(self, n_pixels:int = 100, *args, **kwargs):
-        logger.debug(f"Initializing PixelStrip with args {args} and kwargs {kwargs}")
-        self.leds: List[int] = [0 for _ in range(n_pixels)]
+    """
+    Stands in for rpi_ws281x.PixelStrip off the Pi. The pixels are kept in a uint32 array,
+    debug messages are only formatted when debug logging is enabled.
+    record: number of shown frames to keep in a ring buffer (see recorded_frames())
+    """
+    def __init__(self, n_pixels:int = 100, *args, record: int = 0, **kwargs):
+        logger.debug("Initializing PixelStrip with args %s and kwargs %s", args, kwargs)
+        self.leds = np.zeros(n_pixels, dtype=np.uint32)
         self.begun = False
-        self.show_callbacks: List[Callable[[List[int]], None]] = []
+        self.show_callbacks: List[Callable[[np.ndarray], None]] = []
+        self.show_count = 0
+        self.show_time = 0. #total time spent in show(), including the callbacks
+        self.last_show = None #time.monotonic() of the last show()
+        self.frames = np.zeros((record, n_pixels), dtype=np.uint32)
 
-    def add_show_callback(self, callback: Callable[[List[int]], None]):
+    def add_show_callback(self, callback: Callable[[np.ndarray], None]):
         logger.debug("Setting show callback")
         self.show_callbacks.append(callback)
 
-    def remove_show_callback(self, callback: Callable[[List[int]], None]):
+    def remove_show_callback(self, callback: Callable[[np.ndarray], None]):
         logger.debug("Removing show callback")
         self.show_callbacks.remove(callback)
 
     def setPixelColor(self, pixel: int, color: int):
-        logger.debug(f"Setting pixel {pixel} to color {color}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Setting pixel {pixel} to color {color}")
         self.leds[pixel] = color
 
+    def setPixelColors(self, colors: Sequence[int] | np.ndarray):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Setting {len(colors)} pixels")
+        self.leds[:len(colors)] = colors
+
     def getPixelColor(self, pixel: int) -> int:
-        logger.debug(f"Getting color of pixel {pixel}")
-        return self.leds[pixel]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Getting color of pixel {pixel}")
+        return int(self.leds[pixel])
+
+    def getPixels(self) -> np.ndarray:
+        return self.leds
 
     def numPixels(self):
-        return 100
-    
+        return len(self.leds)
+
     def show(self):
         if self.begun:
+            start = time.monotonic()
             logger.debug("Showing pixels")
+            if(len(self.frames) > 0):
+                self.frames[self.show_count % len(self.frames)] = self.leds
             for callback in self.show_callbacks:
                 callback(self.leds)
+            self.show_count += 1
+            self.last_show = time.monotonic()
+            self.show_time += self.last_show-start
         else:
             raise Exception("PixelStrip not begun. Call begin() before show().")
 
+    def recorded_frames(self) -> np.ndarray:
+        """
+        The last shown frames (at most as many as were recorded), oldest first.
+        """
+        size = len(self.frames)
+        if(self.show_count <= size):
+            return self.frames[:self.show_count].copy()
+        return np.roll(self.frames, -(self.show_count % size), axis=0)
+
     def begin(self):
         self.begun = True
-        logger.debug("Beginning PixelStrip")
\ No newline at end of file
+        logger.debug("Beginning PixelStrip")
@@ -20,15 +20,16 @@ class TreeVis:
         # Intercept PixelStrip.show to push new states into the visualizer
         self.pixels.add_show_callback(self.update_visualization)
 
-    def update_visualization(self, leds: List[int]):
+    def update_visualization(self, leds: np.ndarray):
         # Non-blocking: try to put the latest state, if full drop the old and replace
+        state = leds.tolist()
         try:
-            self._queue.put_nowait(list(leds))
+            self._queue.put_nowait(state)
         except _queue.Full:
             try:
                 # remove old value, then put the new one
                 self._queue.get_nowait()
-                self._queue.put_nowait(list(leds))
+                self._queue.put_nowait(state)
             except Exception:
                 # best-effort: ignore if queue operations fail
                 pass
@@ -0,0 +1,146 @@
+"""
+A single thread owns the PixelStrip and is the only one that writes to it.
+Everything else publishes complete frames, of which only the newest one is shown.
+"""
+import os
+import time
+import logging
+import threading
+import numpy as np
+from collections import deque
+from . import utils
+from .metrics import FrameTimes
+
+#WS2811 leds are written at 800kHz (30us per led), followed by a reset of at least 50us
+LED_WRITE_TIME = 30e-6
+RESET_TIME = 50e-6
+
+class StripOutput:
+    """
+    Shows the frames published with publish() on the strip in a dedicated thread.
+    Publishing only appends to a deque of length one and sets an event: if the strip is busy, the next frame
+    replaces the previous one (latest frame wins) and the producer never waits for the strip.
+    show() is never called more often than the strip can be refreshed, or max_fps if that is lower.
+    Once stop() was called, frames that are still published (e.g. by a render thread that did not end yet) are ignored.
+    """
+    def __init__(self, strip, max_fps: float | None = None):
+        self.strip = strip
+        num_leds = strip.numPixels()
+        self.interval = num_leds*LED_WRITE_TIME + RESET_TIME
+        if(max_fps is not None):
+            self.interval = max(self.interval, 1./max_fps)
+        self.frame = np.zeros(num_leds, dtype=np.uint32) #the frame that was shown last
+        self.published = 0
+        self.shown = 0
+        self.failed = 0 #frames for which writing to the strip raised
+        self.stopped = False
+        self.times = FrameTimes() #how long writing to the strip takes
+        self._latest = deque(maxlen=1) #appending and popping are atomic, no lock needed
+        self._event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        #threads do not survive a fork (gunicorn --preload), the thread is restarted on the next publish()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def publish(self, frame: np.ndarray):
+        """
+        Hand a complete frame of packed colors to the output thread. The caller should not modify it afterwards.
+        """
+        if(self.stopped):
+            return
+        self._latest.append(frame)
+        self.published += 1
+        self._event.set()
+        if(self._thread is None or not self._thread.is_alive()):
+            self._start()
+
+    @property
+    def dropped(self) -> int:
+        #frames that were replaced by a newer one before they could be shown
+        return self.published-self.shown-self.failed-len(self._latest)
+
+    def _start(self):
+        with self._start_lock:
+            if(self._thread is not None and self._thread.is_alive()):
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="strip-output")
+            self._thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self._stop_event.set()
+        self._event.set()
+        if(self._thread is not None and self._thread is not threading.current_thread()):
+            self._thread.join(timeout=1)
+
+    def flush(self, timeout: float = 1.) -> bool:
+        """
+        Wait until the newest published frame was shown.
+        """
+        end = time.monotonic()+timeout
+        while(len(self._latest) > 0 and time.monotonic() < end):
+            time.sleep(self.interval)
+        return len(self._latest) == 0
+
+    def _after_fork(self):
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._event = threading.Event()
+        if(len(self._latest) > 0):
+            self._event.set()
+
+    def _run(self):
+        next_show = 0.
+        while not self._stop_event.is_set():
+            self._event.wait()
+            self._event.clear()
+            now = time.monotonic()
+            if(now < next_show):
+                #the strip cannot be refreshed faster, newer frames may still replace this one
+                self._stop_event.wait(next_show-now)
+            try:
+                frame = self._latest.popleft()
+            except IndexError:
+                continue
+            start = time.monotonic()
+            try:
+                utils.write_frame(self.strip, frame)
+                self.strip.show()
+            except Exception:
+                #keep the thread alive, the next frame may succeed
+                logging.error("Could not show frame", exc_info=True)
+                self.failed += 1
+                continue
+            self.times.record(start, time.monotonic())
+            self.frame = frame
+            self.shown += 1
+            next_show = start+self.interval
+
+class FrameStrip:
+    """
+    Stands in for the PixelStrip in animations that write pixels themselves.
+    The pixels are set in a buffer and show() publishes a copy of it to the output.
+    """
+    def __init__(self, output: StripOutput, frame: np.ndarray | None = None):
+        self.output = output
+        self.buffer = np.array(output.frame if frame is None else frame, dtype=np.uint32)
+
+    def begin(self):
+        pass
+
+    def numPixels(self) -> int:
+        return len(self.buffer)
+
+    def setPixelColor(self, pixel: int, color: int):
+        self.buffer[pixel] = color
+
+    def setPixelColors(self, colors):
+        self.buffer[:len(colors)] = colors
+
+    def getPixelColor(self, pixel: int) -> int:
+        return int(self.buffer[pixel])
+
+    def show(self):
+        self.output.publish(self.buffer.copy())
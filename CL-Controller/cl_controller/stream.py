@@ -0,0 +1,128 @@
+import threading
+import time
+import logging
+import numpy as np
+from . import utils
+from .animations.animations import Animation
+
+STREAM_FPS = 60 #default rate at which streamed frames are shown
+FORMATS = {"rgb": 3, "packed": 4} #bytes per led
+
+class FrameSlot:
+    """
+    Holds the newest frame of a stream. A frame that arrives before the previous one was shown
+    replaces it (latest frame wins), so a slow strip never builds up a backlog.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.frame = None
+        self.pending = False
+        self.received = 0
+        self.shown = 0
+        self.dropped = 0
+
+    def put(self, frame: np.ndarray):
+        with self._cond:
+            if(self.pending):
+                self.dropped += 1
+            self.frame = frame
+            self.pending = True
+            self.received += 1
+
+    def take(self) -> np.ndarray | None:
+        """
+        Returns the newest frame. If nothing arrived since the last call, this is the same object as before.
+        """
+        with self._cond:
+            if(self.pending):
+                self.pending = False
+                self.shown += 1
+                self._cond.notify_all()
+            return self.frame
+
+    def wait_shown(self, timeout: float) -> bool:
+        """
+        Waits until the newest frame was taken, returns False on a timeout.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self.pending, timeout)
+
+class FrameStream(Animation):
+    """
+    Shows the frames that an external renderer streams to the controller.
+    It is driven by the RenderLoop like any other animation that implements render().
+    """
+    def setup(self, **kwargs):
+        self.num_leds = kwargs["num_leds"]
+        self.slot = FrameSlot()
+        self.black = np.zeros(self.num_leds, dtype=np.uint32)
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._is_setup = True
+        return {"success": True}
+
+    def render(self, t, locations):
+        frame = self.slot.take()
+        return self.black if frame is None else frame
+
+    def stopped(self) -> bool:
+        return self._stop_event.is_set()
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic()-self.started, 1e-9)
+        return {"frames": self.slot.received, "shown": self.slot.shown, "dropped": self.slot.dropped,
+                "bytes": self.bytes, "duration": elapsed,
+                "fps_in": self.slot.received/elapsed, "fps_out": self.slot.shown/elapsed}
+
+def decode_frame(data: bytes, num_leds: int, fmt: str = "rgb") -> np.ndarray:
+    """
+    Converts one frame of a stream to packed colors.
+    rgb: num_leds*3 bytes with the r,g,b values of every led
+    packed: num_leds little-endian uint32's with colors as returned by utils.Color
+    """
+    if(fmt == "rgb"):
+        return utils.pack_frame(np.frombuffer(data, dtype=np.uint8).reshape(num_leds, 3))
+    elif(fmt == "packed"):
+        return np.frombuffer(data, dtype="<u4").astype(np.uint32)
+    raise ValueError("Unknown frame format", fmt)
+
+def _read_exact(stream, size: int) -> bytes | None:
+    #returns None once the stream ends, an incomplete last frame is discarded
+    chunks = []
+    while(size > 0):
+        chunk = stream.read(size)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def receive(stream, controller, fmt: str = "rgb", fps: float = STREAM_FPS) -> dict:
+    """
+    Reads raw frames from stream (a file-like object, e.g. the body of a chunked request)
+    and shows them on the controller until the stream ends or another animation/update takes over.
+    Returns the statistics of the connection.
+    """
+    if(fmt not in FORMATS):
+        return {"success": False, "message": f"Unknown format '{fmt}', use one of {list(FORMATS.keys())}"}
+    num_leds = controller.led_count()
+    frame_size = num_leds*FORMATS[fmt]
+    animation = FrameStream(fps=fps)
+    animation.setup(num_leds=num_leds)
+    controller.play_animation(animation)
+    logging.info(f"Started frame stream ({fmt}, {frame_size:d} bytes per frame)")
+    while not animation.stopped():
+        data = _read_exact(stream, frame_size)
+        if(data is None):
+            break
+        animation.bytes += len(data)
+        animation.slot.put(decode_frame(data, num_leds, fmt))
+        #back-pressure: give the strip up to one frame period to show this frame before reading the next one,
+        #so a fast sender is slowed down by the connection instead of having its frames dropped
+        animation.slot.wait_shown(1./fps)
+    interrupted = animation.stopped()
+    if(controller.animation is animation):
+        controller.stop_animation()
+    stats = animation.stats()
+    logging.info(f"Frame stream ended: {stats}")
+    return {"success": True, "interrupted": interrupted, **stats}
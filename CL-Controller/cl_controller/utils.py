@@ -14,6 +14,41 @@ def Color_array(r: np.ndarray, g: np.ndarray, b: np.ndarray) -> np.ndarray:
     g = g.astype(int)
     return np.bitwise_or(np.bitwise_or(b, r), g)
 
+def pack_frame(frame: np.ndarray) -> np.ndarray:
+    """
+    Convert a frame to an array of packed colors (as returned by Color).
+    frame: either a (N,) array of packed colors or a (N,3) array of r,g,b values.
+    """
+    frame = np.asarray(frame)
+    if(frame.ndim == 1):
+        return frame.astype(np.uint32, copy=False)
+    elif(frame.ndim == 2 and frame.shape[1] == 3):
+        return Color_array(frame[:,0], frame[:,1], frame[:,2]).astype(np.uint32)
+    raise ValueError("Invalid frame shape", frame.shape)
+
+def write_frame(strip, frame: np.ndarray):
+    """
+    Write a whole frame to the strip in one call. Does not call show().
+    """
+    colors = pack_frame(frame)
+    if(hasattr(strip, "setPixelColors")):
+        strip.setPixelColors(colors)
+    else:
+        #rpi_ws281x has no bulk setter, but converting to python ints in one go
+        #already avoids most of the per-pixel overhead
+        set_pixel = strip.setPixelColor
+        for i, color in enumerate(colors.tolist()):
+            set_pixel(i, color)
+
+def crossfade(frame_a: np.ndarray, frame_b: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Blends two frames (packed colors or r,g,b values): alpha=0 gives frame_a, alpha=1 gives frame_b.
+    """
+    a = color_to_rgb_array(pack_frame(frame_a)).astype(np.float32)
+    b = color_to_rgb_array(pack_frame(frame_b)).astype(np.float32)
+    rgb = (a + (b-a)*alpha + 0.5).astype(np.uint8)
+    return Color_array(rgb[:,0], rgb[:,1], rgb[:,2]).astype(np.uint32)
+
 def color_brightness(r: int, g: int, b: int, brightness: int = 255) -> int:
     #maximize brightness first, then scale it
     f = max(r,g,b)
@@ -22,15 +57,40 @@ def color_brightness(r: int, g: int, b: int, brightness: int = 255) -> int:
     f = brightness/f
     return Color(int(r*f), int(g*f), int(b*f))
 
+def color_brightness_array(r: np.ndarray, g: np.ndarray, b: np.ndarray, brightness: np.ndarray | int = 255) -> np.ndarray:
+    """
+    Array version of color_brightness.
+    """
+    r, g, b = np.asarray(r), np.asarray(g), np.asarray(b)
+    m = np.maximum(np.maximum(r, g), b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f = np.where(m == 0, 0, brightness/np.where(m == 0, 1, m))
+    return Color_array((r*f).astype(int), (g*f).astype(int), (b*f).astype(int)).astype(np.uint32)
+
 def color_to_rgb(color: int) -> tuple[int, int, int]:
     return (color >> 8 & 0xff, color & 0xff, color >> 16)
 
-def parse_color(color: str, brightness: int = 255) -> int:
+def color_to_rgb_array(colors: np.ndarray) -> np.ndarray:
+    """
+    Unpacks an array of colors into an (N,3) array of r,g,b values.
+    """
+    colors = np.asarray(colors, dtype=np.uint32)
+    return np.stack((colors >> 8 & 0xff, colors & 0xff, colors >> 16 & 0xff), axis=-1).astype(np.uint8)
+
+def color_channels(color: str) -> tuple[int, int, int] | None:
+    """
+    Splits a color string "c0,c1,c2" into its (clamped) channels, in the order of the string.
+    Returns None if the string is not a valid color.
+    """
     if(search(regex, color)):
         colors = color.split(',')
-        r = clamp(int(colors[0]), 0, 255)
-        b = clamp(int(colors[1]), 0, 255)
-        g = clamp(int(colors[2]), 0, 255)
+        return clamp(int(colors[0]), 0, 255), clamp(int(colors[1]), 0, 255), clamp(int(colors[2]), 0, 255)
+    return None
+
+def parse_color(color: str, brightness: int = 255) -> int:
+    channels = color_channels(color)
+    if(channels is not None):
+        r, b, g = channels
         return color_brightness(r, g, b, brightness)
     return Color(0,0,0)
 
@@ -51,12 +111,46 @@ def rgb_to_hex(color: str) -> str:
         return "#"+to_double_digit_hex(r) + to_double_digit_hex(g) + to_double_digit_hex(b)
     return "#000000"
 
+_brightness_lut = None
+def brightness_lut() -> np.ndarray:
+    """
+    (256,256) table of channel values scaled by a brightness: brightness_lut()[brightness, value]
+    """
+    global _brightness_lut
+    if(_brightness_lut is None):
+        f = np.arange(256)[:,None]/255
+        _brightness_lut = (np.arange(256)[None,:]*f).astype(np.uint8)
+    return _brightness_lut
+
 def adjustBrightness(color: int, brightness: int) -> int:
     brightness = clamp(brightness, 0, 255)
     r,g,b = color_to_rgb(color)
+    if(isinstance(brightness, int)):
+        lut = brightness_lut()[brightness]
+        return Color(int(lut[r]), int(lut[g]), int(lut[b]))
     f = brightness/255
     return Color(min(255,int(r*f)), min(255, int(g*f)), min(255, int(b*f)))
 
+def adjustBrightness_array(color: int, brightness: np.ndarray) -> np.ndarray:
+    """
+    Array version of adjustBrightness: scales a single color to an array of brightnesses.
+    """
+    r,g,b = color_to_rgb(color)
+    f = np.clip(brightness, 0, 255)/255
+    return Color_array((r*f).astype(int), (g*f).astype(int), (b*f).astype(int)).astype(np.uint32)
+
+def scale_colors(colors: np.ndarray, brightness: np.ndarray | int) -> np.ndarray:
+    """
+    Scales an array of colors by integer brightnesses (0-255) using the brightness lookup table,
+    equivalent to calling adjustBrightness for every color.
+    """
+    rgb = color_to_rgb_array(colors)
+    brightness = np.clip(np.asarray(brightness, dtype=int), 0, 255)
+    if(brightness.ndim == 1):
+        brightness = brightness[:,None]
+    rgb = brightness_lut()[brightness, rgb]
+    return Color_array(rgb[...,0], rgb[...,1], rgb[...,2]).astype(np.uint32)
+
 def parse_color_mode(mode: str, brightness: int = 255, is_odd_black: bool = False, is_odd_black_constant: bool = False):
     if(mode=="rainbow"):
         if(is_odd_black):
@@ -74,6 +168,42 @@ def parse_color_mode(mode: str, brightness: int = 255, is_odd_black: bool = Fals
     else:
         return None
 
+def parse_color_mode_array(mode: str, brightness: int = 255, is_odd_black: bool = False, is_odd_black_constant: bool = False):
+    """
+    Array version of parse_color_mode. The returned function accepts arrays for x and i (which are broadcast
+    against each other) and returns an array of packed colors. Its period attribute is the number of
+    iterations after which the colors repeat.
+    """
+    if(mode=="rainbow"):
+        def color(x, max_x, i):
+            x, i = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(i, dtype=int))
+            return wheel_array((x/max_x*100+i*100).astype(int)%255, brightness)
+        period = 51 #i*100 is a multiple of 255 for i=51
+        odd_black = is_odd_black
+    elif(mode=="fixed"):
+        def color(x, max_x, i):
+            x, i = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(i, dtype=int))
+            return wheel_array(((i+1)*40)%255, brightness)
+        period = 51
+        odd_black = is_odd_black
+    elif(parse_color(mode)>0):
+        constant = parse_color(mode, brightness)
+        def color(x, max_x, i):
+            x, i = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(i, dtype=int))
+            return np.full(x.shape, constant, dtype=np.uint32)
+        period = 1
+        odd_black = is_odd_black_constant
+    else:
+        return None
+    if(odd_black):
+        def odd_black_color(x, max_x, i, color=color):
+            colors = color(x, max_x, i)
+            return np.where(np.asarray(i)%2==0, colors, 0).astype(np.uint32)
+        odd_black_color.period = 2*period
+        return odd_black_color
+    color.period = period
+    return color
+
 def hsv_to_rgb(h: float, s: float, v: float) -> tuple[int, int, int]:
     """
     h: hue, in degrees
@@ -105,6 +235,33 @@ def hsv_to_rgb(h: float, s: float, v: float) -> tuple[int, int, int]:
     else:
         return v, p, q
 
+def hsv_to_rgb_array(h: np.ndarray, s: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    Array version of hsv_to_rgb, returns an (N,3) array of r,g,b values.
+    """
+    h, s, v = np.broadcast_arrays(np.asarray(h, dtype=float), np.asarray(s, dtype=float), np.asarray(v, dtype=float))
+    h = np.where(h >= 360, 0, h)/60.
+    i = h.astype(int)
+    f = h-i
+    v = v*255
+    p = (v*(1-s)).astype(int)
+    q = (v*(1-s*f)).astype(int)
+    t = (v*(1-s*(1-f))).astype(int)
+    v = v.astype(int)
+    #the sector of the hue determines the order of the channels, see hsv_to_rgb
+    rgb = np.select([i[...,None]==k for k in range(5)],
+                    [np.stack(c, axis=-1) for c in [(v,t,p), (q,v,p), (p,v,t), (p,q,v), (t,p,v)]],
+                    default=np.stack((v,p,q), axis=-1))
+    #no saturation means gray
+    return np.where((s <= 0)[...,None], v[...,None], rgb)
+
+def hsv_to_color_array(h: np.ndarray, s: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    Converts hsv values straight to packed colors.
+    """
+    rgb = hsv_to_rgb_array(h, s, v)
+    return Color_array(rgb[...,0], rgb[...,1], rgb[...,2]).astype(np.uint32)
+
 def rgb_to_hsv(r, g, b):
     r /= 255
     g /= 255
@@ -133,8 +290,38 @@ def rgb_to_hsv(r, g, b):
     return h, s, v
 
 
+def _wheel_rgb(pos: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    #the r,g,b values of the three segments of the wheel (before scaling the brightness), see wheel()
+    r = np.select([pos<85, pos<170], [pos*3, 255-(pos-85)*3], 0)
+    g = np.select([pos<85, pos<170], [255-pos*3, 0], (pos-170)*3)
+    b = np.select([pos<85, pos<170], [0, (pos-85)*3], 255-(pos-170)*3)
+    return r, g, b
+
+_wheel_lut = None
+def wheel_lut() -> np.ndarray:
+    """
+    (256,256) table of packed wheel colors: wheel_lut()[pos, brightness] == wheel(pos, brightness)
+    """
+    global _wheel_lut
+    if(_wheel_lut is None):
+        _wheel_lut = color_brightness_array(*_wheel_rgb(np.arange(256)[:,None]), np.arange(256)[None,:])
+    return _wheel_lut
+
+def wheel_array(pos: np.ndarray, brightness: np.ndarray | int = 255) -> np.ndarray:
+    """
+    Array version of wheel for integer positions (0-255).
+    """
+    pos = np.asarray(pos, dtype=int)
+    brightness = np.asarray(brightness)
+    if(np.all((brightness == np.round(brightness)) & (brightness >= 0) & (brightness <= 255))):
+        return wheel_lut()[pos, brightness.astype(int)]
+    #brightness outside of the table
+    return color_brightness_array(*_wheel_rgb(pos), brightness)
+
 def wheel(pos, brightness=255):
     """Generate rainbow colors across 0-255 positions."""
+    if(isinstance(brightness, int) and 0 <= brightness <= 255 and 0 <= pos <= 255 and int(pos) == pos):
+        return int(wheel_lut()[int(pos), brightness])
     if pos < 85:
         return color_brightness(pos * 3, 255 - pos * 3, 0, brightness)
     elif pos < 170:
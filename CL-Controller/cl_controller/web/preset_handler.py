@@ -1,4 +1,4 @@
-from flask import g, jsonify, render_template
+from flask import jsonify, render_template
 from flask_restx import Api, fields, Resource, Namespace, marshal
 import sqlite3 as sq
 import os
@@ -6,10 +6,14 @@ import json, datetime
 from cl_controller.animations.animations import AnimData
 import queue, threading
 import html
-from typing import Tuple, Any
+import copy
+import logging
+from contextlib import contextmanager
 
 PRESET_TEMPLATE = "presets.html"
 DATABASE_PATH = "database.db"
+POOL_SIZE = 4 #idle connections that are kept open
+BUSY_TIMEOUT = 5000 #ms to wait for another process that writes to the database
 
 preset_api = Namespace("presets", description="Preset related operations", path="/api/presets")
 model = preset_api.model("Preset", {
@@ -21,16 +25,17 @@ model = preset_api.model("Preset", {
 })
 animdata = AnimData()
 
-def get_database() -> 'ThreadedDatabaseHandler':
-    db = getattr(g, '_database', None)
-    if db is None:
-        db = g._database = ThreadedDatabaseHandler(DATABASE_PATH)
-    return db
-
 def close(exception=None):
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+    PresetRepository().close()
+
+def parse_settings(value) -> dict:
+    """
+    The settings of a preset from its json (a string or already parsed), raises ValueError if they are invalid.
+    """
+    settings = json.loads(value) if type(value) is str else value
+    if not isinstance(settings, dict):
+        raise ValueError("The json of a preset has to be an object")
+    return settings
 
 @preset_api.route('/create', methods=['POST'])
 @preset_api.route('/<int:preset_id>', methods=['GET', 'PUT', 'DELETE'])
@@ -40,18 +45,13 @@ class PresetAPI(Resource):
     init_every_request = False
 
     def __init__(self, model:Api):
+        super().__init__(model)
         self.model = model
 
-    def _get_item(self, id) -> dict | None:
-        res, _ = get_database().execute("SELECT id, name, animation, created_on, json FROM presets WHERE id=(:id)", args=dict(id=id), one=True)
-        if res is not None:
-            return res
-        return None
-
     @preset_api.marshal_with(model)
-    def get(self, id):
+    def get(self, preset_id):
         #get a preset
-        item = self._get_item(id)
+        item = PresetRepository().get(preset_id)
         if(item is None):
             return {"success": False, "message": "Preset does not exist"}, 404
         else:
@@ -59,24 +59,27 @@ class PresetAPI(Resource):
         
     @preset_api.expect(model, validate=True)
     @preset_api.marshal_with(model)
-    def put(self, id):
+    def put(self, preset_id):
         #update a preset
-        item = self._get_item(id)
+        item = PresetRepository().get(preset_id)
         if item is None:
             return {"success": False, "message": "Preset does not exist"}, 404
         try:
             assert item["animation"] == preset_api.payload["animation"], "Cannot change animation of preset."
+            parse_settings(preset_api.payload["json"])
             item.update(preset_api.payload)
             item = marshal(item, model)
-            get_database().execute("UPDATE presets SET name=(:name), created_on=(:created_on), json=(:json) WHERE id=(:id)", args=item, commit=True)
+            item["id"] = preset_id
+            PresetRepository().update(item)
         except Exception as e:
             return {"success": False, "message": str(e)}, 400
         return item, 200
 
     @preset_api.response(204, "Preset deleted")
-    def delete(self, id):
+    def delete(self, preset_id):
         #delete a preset
-        get_database().execute("DELETE FROM preset WHERE id=(:id)", args=dict(id=id), commit=True)
+        if not PresetRepository().delete(preset_id):
+            return {"success": False, "message": "Preset does not exist"}, 404
         return {"success": True}, 204
     
     #@preset_api.expect(model, validate=True)
@@ -106,9 +109,8 @@ class PresetAPI(Resource):
             return "Missing parameters", 400
         if not all([param in settings for param in params]):
             return "Invalid parameters", 400
-        get_database().execute("INSERT INTO presets (name, animation, created_on, json) VALUES (:name, :animation, :created_on, :json)",
-                    args=payload, commit=True)
-        res = {"success": True, "name": payload["name"], "animation": payload["animation"], "json": params}
+        preset_id = PresetRepository().create(payload["name"], payload["animation"], params, payload["created_on"])
+        res = {"success": True, "id": preset_id, "name": payload["name"], "animation": payload["animation"], "json": params}
         return res, 201
 
 @preset_api.route("/")
@@ -117,24 +119,22 @@ class PresetListAPI(Resource):
     init_every_request = False
 
     def __init__(self, model):
+        super().__init__(model)
         self.model = model
 
     #@preset_api.marshal_list_with(model)
     def get(self, animation=None):
         #get a list of all presets
-        if animation is None:
-            items, _ = get_database().execute("SELECT id, name, animation, created_on, json FROM presets")
-        else:
-            items, _ = get_database().execute("SELECT id, name, animation, created_on, json FROM presets WHERE animation=(:animation)", args=dict(animation=animation))
-        if items is None:
+        items = PresetRepository().list(animation)
+        if len(items) == 0:
             return {"success": False, "message": "No presets found"}, 404
         return jsonify([item for item in items])
 
 def render_preset_template():
     #create preset table
-    items, _ = get_database().execute("SELECT id, name, animation, created_on, json FROM presets")
+    items = PresetRepository().list()
     anims = {}
-    for item in items:  # type: ignore
+    for item in items:
         if item["animation"] not in anims:
             anims[item["animation"]] = []
         anims[item["animation"]].append(item)
@@ -153,69 +153,184 @@ def render_preset_template():
         tables.append(table)
     return render_template(PRESET_TEMPLATE, table_presets="\n".join(tables))
 
-#ensure that this is threadsafe
-class ThreadedDatabaseHandler:
-    #make it a singleton
+sq.register_adapter(datetime.datetime, lambda x: x.strftime("%Y-%m-%d %H:%M:%S"))
+sq.register_converter("DATE", lambda x: datetime.datetime.fromisoformat(x.decode()))
+
+class PresetRepository:
+    """
+    The presets in the database, kept in memory as well: reading a preset or listing them only asks SQLite
+    whether the database changed (PRAGMA data_version), writes go to the database and then to the cache.
+    Connections are taken from a pool (one per request at a time), the database is in WAL mode so
+    reading does not wait for writing. That way, writes by other processes (workers) are noticed as well.
+    """
     _instance = None
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
-            cls._instance = super(ThreadedDatabaseHandler, cls).__new__(cls)
+            cls._instance = super(PresetRepository, cls).__new__(cls)
+            cls._instance._initialize(*args, **kwargs)
         return cls._instance
 
-    def __init__(self, db_file):
+    def _initialize(self, db_file: str = DATABASE_PATH):
         self.db_file = db_file
-        sq.register_adapter(datetime.datetime, lambda x: x.strftime("%Y-%m-%d %H:%M:%S"))
-        sq.register_converter("DATE", lambda x: datetime.datetime.fromisoformat(x.decode()))
-        sq.register_adapter(dict, lambda x: json.dumps(x, ensure_ascii=True))
-        sq.register_adapter("JSON", lambda x: json.loads(x))  # type: ignore
-        if not os.path.isfile(DATABASE_PATH):
-            print("!!! Creating database !!!")
-            con = sq.connect(DATABASE_PATH, detect_types=sq.PARSE_DECLTYPES)
-            cur = con.cursor()
-            cur.execute("CREATE TABLE presets(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, animation TEXT, created_on DATE, json JSON)")
+        self._pool = queue.LifoQueue()
+        self._lock = threading.RLock()
+        self._presets: dict[int, dict] | None = None #id -> row, loaded on first use
+        self._settings: dict[int, dict] = {} #id -> parsed json of the row, parsed when it is first needed
+        self._by_animation: dict[str, list[int]] = {}
+        self._create_schema()
+        #sqlite connections must not be used across a fork (gunicorn --preload)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        #the inherited connections are not closed, that could affect the parent's locks
+        self._inherited = self._pool
+        self._pool = queue.LifoQueue()
+        self._lock = threading.RLock()
+        self._presets = None
+
+    def _connect(self) -> list:
+        """
+        A new connection, as [connection, last seen data_version].
+        """
+        con = sq.connect(self.db_file, detect_types=sq.PARSE_DECLTYPES, check_same_thread=False)
+        con.row_factory = self.make_dicts
+        con.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT:d}")
+        con.execute("PRAGMA synchronous=NORMAL")
+        return [con, None]
+
+    @contextmanager
+    def _connection(self):
+        try:
+            entry = self._pool.get_nowait()
+        except queue.Empty:
+            entry = self._connect()
+        try:
+            yield entry
+        finally:
+            if self._pool.qsize() < POOL_SIZE:
+                self._pool.put(entry)
+            else:
+                entry[0].close()
+
+    def _create_schema(self):
+        with self._connection() as (con, _):
+            #persistent, only has to be set once per database
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("CREATE TABLE IF NOT EXISTS presets(id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, animation TEXT, created_on DATE, json JSON)")
+            con.execute("CREATE INDEX IF NOT EXISTS presets_animation ON presets(animation)")
             con.commit()
-            con.close()
-            self.connection = None
-        self.query_queue = queue.Queue()
-        self.db_thread = threading.Thread(target=self._worker)
-        self.db_thread.daemon = True
-        self.db_thread.start()
 
     def make_dicts(self, cursor, row):
         return dict((cursor.description[idx][0], value)
                 for idx, value in enumerate(row))
 
-    def _worker(self):
-        con = sq.connect(self.db_file, detect_types=sq.PARSE_DECLTYPES)
-        con.row_factory = self.make_dicts
-        while True:
-            query, args, one, commit, result_queue = self.query_queue.get()
-            if query is None:
-                break
-            cur = con.cursor()
-            args = args or ()
-            cur.execute(query, args)
-            if commit:
-                con.commit()
-            if one:
-                result_queue.put((cur.fetchone(), 1))
-            else:
-                result_queue.put((cur.fetchall(), cur.rowcount))
-            cur.close()
-        con.close()
-    
-    def execute(self, query: str, args: dict | list | tuple | None = None, one: bool = False, commit: bool = False) -> Tuple[Any | None, int]:
-        args = args or ()
-        res_queue = queue.Queue(1)
-        self.query_queue.put((query, args, one, commit, res_queue))
-        res, count = res_queue.get()
-        return (None if res is None or len(res)==0 else res), count
-
-    def __del__(self):
-        self.close()
-        ThreadedDatabaseHandler._instance = None
-    
+    def _cached(self) -> dict[int, dict]:
+        """
+        The cached presets, loaded again if another connection wrote to the database in the meantime.
+        """
+        with self._connection() as entry:
+            con, last_version = entry
+            version = con.execute("PRAGMA data_version").fetchone()["data_version"]
+            entry[1] = version
+            with self._lock:
+                if self._presets is None or version != last_version:
+                    self._load(con)
+                return self._presets
+
+    def _load(self, con: sq.Connection):
+        rows = con.execute("SELECT id, name, animation, created_on, json FROM presets ORDER BY id").fetchall()
+        self._presets = {}
+        self._settings = {}
+        self._by_animation = {}
+        for row in rows:
+            self._cache(row)
+
+    def _cache(self, row: dict):
+        self._presets[row["id"]] = row
+        self._settings.pop(row["id"], None)
+        ids = self._by_animation.setdefault(row["animation"], [])
+        if row["id"] not in ids:
+            ids.append(row["id"])
+
+    def _uncache(self, preset_id: int):
+        row = self._presets.pop(preset_id, None)
+        self._settings.pop(preset_id, None)
+        if row is not None:
+            self._by_animation[row["animation"]].remove(preset_id)
+
+    def get(self, preset_id: int) -> dict | None:
+        """
+        A copy of the row of the preset ({"id", "name", "animation", "created_on", "json"}), or None.
+        """
+        row = self._cached().get(preset_id)
+        return dict(row) if row is not None else None
+
+    def settings(self, preset_id: int) -> dict | None:
+        """
+        The settings of the preset (its parsed json), or None (also if its json is invalid).
+        """
+        with self._lock:
+            row = self._cached().get(preset_id)
+            if row is None:
+                return None
+            if preset_id not in self._settings:
+                try:
+                    self._settings[preset_id] = parse_settings(row["json"])
+                except ValueError:
+                    logging.warning(f"Preset {preset_id:d} has invalid json")
+                    return None
+            return copy.deepcopy(self._settings[preset_id])
+
+    def list(self, animation: str | None = None) -> list[dict]:
+        with self._lock:
+            presets = self._cached()
+            if animation is None:
+                return [dict(row) for row in presets.values()]
+            return [dict(presets[preset_id]) for preset_id in self._by_animation.get(animation, [])]
+
+    def create(self, name: str, animation: str, settings: dict, created_on: datetime.datetime | None = None) -> int:
+        row = {"name": name, "animation": animation, "created_on": (created_on or datetime.datetime.now()).replace(microsecond=0),
+               "json": json.dumps(settings, ensure_ascii=True)}
+        with self._connection() as (con, _), self._lock:
+            self._cached()
+            cur = con.execute("INSERT INTO presets (name, animation, created_on, json) VALUES (:name, :animation, :created_on, :json)", row)
+            con.commit()
+            row = {"id": cur.lastrowid, **row}
+            self._cache(row)
+        return row["id"]
+
+    def update(self, item: dict):
+        """
+        Stores the name, creation date and json of the preset with the id of the item.
+        Raises ValueError if the json is invalid, nothing is written then.
+        """
+        row = {key: item[key] for key in ("id", "name", "created_on", "json")}
+        row["json"] = json.dumps(parse_settings(row["json"]), ensure_ascii=True)
+        with self._connection() as (con, _), self._lock:
+            presets = self._cached()
+            con.execute("UPDATE presets SET name=(:name), created_on=(:created_on), json=(:json) WHERE id=(:id)", row)
+            con.commit()
+            if row["id"] in presets:
+                #read it back, so the cache has the same types as after loading
+                self._cache(con.execute("SELECT id, name, animation, created_on, json FROM presets WHERE id=(:id)", row).fetchone())
+
+    def delete(self, preset_id: int) -> bool:
+        """
+        Returns False if there was no such preset.
+        """
+        with self._connection() as (con, _), self._lock:
+            self._cached()
+            count = con.execute("DELETE FROM presets WHERE id=(:id)", dict(id=preset_id)).rowcount
+            con.commit()
+            self._uncache(preset_id)
+        return count > 0
+
     def close(self):
-        print("Closing ThreadedDatabaseHandler")
-        self.query_queue.put((None,None,None, None, None))
-        self.db_thread.join()
\ No newline at end of file
+        """
+        Closes the idle connections.
+        """
+        while True:
+            try:
+                self._pool.get_nowait()[0].close()
+            except queue.Empty:
+                return
@@ -1,14 +1,17 @@
-from flask import render_template
-import subprocess
+from flask import render_template, Response
 import cl_controller.utils as utils
 from cl_controller.animations import animations as anim
+from collections import OrderedDict
 import json, html
+import hashlib
+import datetime
+import threading
+import copy
 
 animdata = None
-result = subprocess.run(['hostname', '-I'], stdout=subprocess.PIPE)
-IP = result.stdout.decode("utf-8").split(" ")[0]
 MAIN_TEMPLATE = "index.html"
 ANIM_TEMPLATE = "animation.html"
+MAX_PAGES = 128 #generated pages that are kept, the least recently used one is dropped first
 
 class Element:
     def __init__(self, name, url):
@@ -57,22 +60,22 @@ class Element:
         self.names.append(name)
 
     def _create_dropdown(self, name, options, default, onclick=None):
-        dd = f"""<form class='drop-down_container'><ul class='drop-down'>\n
+        dd = [f"""<form class='drop-down_container'><ul class='drop-down'>\n
                     <li><input class='drop-down_close' type='radio' name='drop-down_{name:s}' id='{name:s}-close' value=''/><span class='drop-down_label drop-down_placeholder'>Select option</span></li>\n
                     <li class='drop-down_items'>\n
                         <input class='drop-down_expand' type='radio' name='drop-down_{name:s}' id='{name:s}_open'/><label class='drop-down_close_label' for='{name:s}_close'></label>\n
                         <ul class='drop-down_options'>\n
-                    """
+                    """]
         for option in options:
-            dd += f"<li class='drop-down_option'>\n"
-            dd += f"<input class='drop-down_input'" + (f" onclick='{onclick:s}(\"{name:s}\", \"{option:s}\")'" if onclick else "") \
+            dd.append(f"<li class='drop-down_option'>\n")
+            dd.append(f"<input class='drop-down_input'" + (f" onclick='{onclick:s}(\"{name:s}\", \"{option:s}\")'" if onclick else "") \
                     +f" type='radio' name='drop-down_{name:s}' value='{option:s}' id='{name:s}-{option:s}' " \
-                    + ("checked" if option==default else "")+"/>\n"
-            dd += f"<label class='drop-down_label' for='{name:s}-{option:s}'>{option:s}</label>\n"
-            dd += "</li>\n"
-        dd += f"</ul><label class='drop-down_expand_label' for='{name:s}_open'></label>\n"
-        dd += "</li></ul></form>"
-        return dd
+                    + ("checked" if option==default else "")+"/>\n")
+            dd.append(f"<label class='drop-down_label' for='{name:s}-{option:s}'>{option:s}</label>\n")
+            dd.append("</li>\n")
+        dd.append(f"</ul><label class='drop-down_expand_label' for='{name:s}_open'></label>\n")
+        dd.append("</li></ul></form>")
+        return "".join(dd)
 
     def add_list(self, display_name, name, options, default=None):
         if(default is None):
@@ -91,12 +94,11 @@ class Element:
         return f"<tr><td colspan=3 class='center-cell'><button id='{self.name:s}_btn' class='table-btn' onclick='send_{self.name:s}()'>Send</button></td></tr>\n"
 
     def create_table(self):
-        s = f"<table id='{self.name:s}'>\n"
-        for i in range(len(self.items)):
-            s += self.items[i] +"\n"
-        s += self._create_button()
-        s += "</table>\n"
-        return s
+        rows = [f"<table id='{self.name:s}'>\n"]
+        rows.extend(item+"\n" for item in self.items)
+        rows.append(self._create_button())
+        rows.append("</table>\n")
+        return "".join(rows)
     
     def get_script(self):
         script  = f"function parse_data()" + "{\n"
@@ -116,18 +118,18 @@ def create_tables():
     table_leds_html = table_leds.create_table()
     script = "<script>\n" + table_leds.get_script() + "</script>\n"
 
-    table_animation = "<h4 style='text-align:center'><a onclick='stop_animation()' href='#'>Stop animation</a></h4>"
-    table_animation += "<ul id='anim_list'>"
+    table_animation = ["<h4 style='text-align:center'><a onclick='stop_animation()' href='#'>Stop animation</a></h4>"]
+    table_animation.append("<ul id='anim_list'>")
     #get animations info
     if(animdata):
         for animation in animdata.names:
             info = animdata.info[animation]
-            table_animation += f"<li onclick='window.location.href=\"home?animation={html.escape(animation):s}\";'><span class='anim_name'>{html.escape(info['name']):s}</span><br/>{html.escape(info['description']):s}</li>\n"
-    table_animation += "</ul>\n"
+            table_animation.append(f"<li onclick='window.location.href=\"home?animation={html.escape(animation):s}\";'><span class='anim_name'>{html.escape(info['name']):s}</span><br/>{html.escape(info['description']):s}</li>\n")
+    table_animation.append("</ul>\n")
 
     table_controller = "<div class='controller'><p><button id='shutdown' onclick='rpi_command(\"option\", \"shutdown\", \"/api/rpi/\");'>Shutdown</button></p>\n"
     table_controller += "<p><button id='restart' onclick='rpi_command(\"option\",\"restart\", \"/api/rpi/\");'>Restart</button></p></div>\n"
-    return dict(table_leds=table_leds_html, table_animaties=table_animation, table_controller=table_controller, script=script)
+    return dict(table_leds=table_leds_html, table_animaties="".join(table_animation), table_controller=table_controller, script=script)
 
 def create_animation_page(anim_name:str, preset: int | None = None):
     def calculate_step(low, high):
@@ -171,16 +173,16 @@ def create_animation_page(anim_name:str, preset: int | None = None):
     settings = Element("settings_table", "/api/anim/")
     settings.add_hidden("name", value=anim_name)
     settings.add_button("Presets", "presets", f"toggle_preset_dialog(\"{anim_name}\")")
-    instructions = animation.instructions
+    #the instructions belong to the class, the defaults of a preset must not end up on other pages
+    instructions = copy.deepcopy(animation.instructions)
 
     #load the preset
     preset_result = None
     if preset is not None:
         try:
             preset = int(preset)
-            from preset_handler import ThreadedDatabaseHandler, DATABASE_PATH
-            handler = ThreadedDatabaseHandler(DATABASE_PATH)
-            preset_result, _ = handler.execute("SELECT id, name, animation, created_on, json FROM presets WHERE id=(:id)", args=dict(id=preset), one=True)  # type: ignore
+            from cl_controller.web.preset_handler import PresetRepository
+            preset_result = PresetRepository().get(preset)
             print("Loading preset:", preset_result)
             if preset_result is None:
                 print(f"Could not find preset with ID {preset}!")
@@ -193,11 +195,10 @@ def create_animation_page(anim_name:str, preset: int | None = None):
             print(e)
 
     if(preset_result):
-        if type(preset_result["json"]) is str:
-            preset_result["json"] = json.loads(preset_result["json"])
-        for key in preset_result["json"]:
+        preset_settings = PresetRepository().settings(preset) or {}
+        for key in preset_settings:
             if key in animation.settings:
-                instructions[key]["default"] = preset_result["json"][key]
+                instructions[key]["default"] = preset_settings[key]
 
     for key in animation.settings:
         setting = instructions[key]
@@ -205,12 +206,75 @@ def create_animation_page(anim_name:str, preset: int | None = None):
     settings.add_button("Save preset", "save_preset", f"save_preset(null, \"{anim_name}\", parse_data());")
     return dict(animation_name=animdata.info[anim_name]["name"], script="<script>\n"+settings.get_script()+"</script>\n", settings=settings.create_table())
 
-def render_webpage(animation: str | None = None, preset: int | None = None):
+class Page:
+    def __init__(self, body: str, version):
+        self.body = body
+        self.version = version
+        self.etag = hashlib.sha1(body.encode("utf-8")).hexdigest()[:20]
+        #HTTP dates have a resolution of a second
+        self.last_modified = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+class PageCache:
+    """
+    The generated pages by (animation, preset). A page is generated again when the version it was
+    generated for changed, e.g. because the preset was edited.
+    """
+    def __init__(self, max_pages: int = MAX_PAGES):
+        self.max_pages = max_pages
+        self.pages: OrderedDict[tuple, Page] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, version, render) -> Page:
+        with self._lock:
+            page = self.pages.get(key)
+            if(page is not None and page.version == version):
+                self.pages.move_to_end(key)
+                return page
+        #rendered outside of the lock, at worst two requests render the same page
+        page = Page(render(), version)
+        with self._lock:
+            self.pages[key] = page
+            self.pages.move_to_end(key)
+            while(len(self.pages) > self.max_pages):
+                self.pages.popitem(last=False)
+        return page
+
+    def clear(self):
+        with self._lock:
+            self.pages.clear()
+
+pages = PageCache()
+
+def preset_version(preset: int | None):
+    """
+    The stored preset, so the page is generated again when it was changed (also by other worker processes).
+    """
+    if(preset is None):
+        return None
+    from cl_controller.web.preset_handler import PresetRepository
+    return PresetRepository().get(preset)
+
+def get_page(animation: str | None = None, preset: int | None = None) -> Page:
     global animdata
     if animdata is None:
         animdata = anim.AnimData()
     if(animation is None):
-        return render_template(MAIN_TEMPLATE, **create_tables())
-    else:
-        return render_template(ANIM_TEMPLATE, **create_animation_page(animation, preset))
+        return pages.get((None, None), None, lambda: render_template(MAIN_TEMPLATE, **create_tables()))
+    return pages.get((animation, preset), preset_version(preset),
+                     lambda: render_template(ANIM_TEMPLATE, **create_animation_page(animation, preset)))
+
+def render_webpage(animation: str | None = None, preset: int | None = None) -> str:
+    return get_page(animation, preset).body
+
+def webpage_response(request, animation: str | None = None, preset: int | None = None) -> Response:
+    """
+    The page with an ETag and Last-Modified, answers with 304 Not Modified if the browser has it already.
+    """
+    page = get_page(animation, preset)
+    response = Response(page.body, mimetype="text/html")
+    response.set_etag(page.etag)
+    response.last_modified = page.last_modified
+    #the browser may keep the page, but has to ask whether it is still valid
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
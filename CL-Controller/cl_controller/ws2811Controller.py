@@ -1,5 +1,9 @@
-import time, random
+import time, random, threading
+import numpy as np
 from . import utils
+from .animations.animations import RenderLoop
+from .led_store import LEDStore
+from .output import StripOutput, FrameStrip
 import multiprocessing
 if utils.is_raspberrypi():
     from rpi_ws281x import PixelStrip  # pyright: ignore[reportMissingImports]
@@ -28,19 +32,25 @@ class ws2811Controller:
             cls._lock.release()
         return cls._instance
 
-    def initialize(self, num_leds, led_pin, led_freq, led_dma, led_invert, led_brightness, led_channel, switch_pin):
+    def initialize(self, num_leds, led_pin, led_freq, led_dma, led_invert, led_brightness, led_channel, switch_pin, led_buffer=None):
+        """
+        led_buffer: buffer for the led states (see LEDStore), e.g. shared memory that other processes can read
+        """
         self.switch_pin = switch_pin
         GPIO.setup(switch_pin, GPIO.OUT)
         self.on = False
         self.animation = None
+        self.renderer = RenderLoop(output=self.set_frame)
         GPIO.output(switch_pin, GPIO.LOW)
         self.nonce = random.randint(0,2**15-1)
         self.has_begun = False
         self.trigger_times = {}
-        self.leds = [{"id": i, "color": "255,255,255", "state": False, "brightness": 255} for i in range(num_leds)]
+        self.leds = LEDStore(num_leds, color="255,255,255", state=False, brightness=255, buffer=led_buffer)
         self.strip = PixelStrip(num_leds, led_pin, led_freq, led_dma, led_invert, led_brightness, led_channel)
+        #the output thread is the only one writing to the strip, the controller edits its own copy of the frame
+        self.output = StripOutput(self.strip)
+        self.frame = np.zeros(num_leds, dtype=np.uint32)
         if not utils.is_raspberrypi():
-            import numpy as np
             from .mock import TreeVis
             self.vis = TreeVis(self.strip, np.load("cl_controller/animations/locations.npy"))  # type: ignore
     
@@ -70,6 +80,9 @@ class ws2811Controller:
     def stop(self):
         print("Ending ws2811Controller")
         self.stop_animation()
+        self.renderer.stop()
+        self.output.flush()
+        self.output.stop()
         GPIO.output(self.switch_pin, GPIO.LOW)
         GPIO.setup(self.switch_pin, GPIO.IN)
         GPIO.cleanup()
@@ -78,9 +91,10 @@ class ws2811Controller:
         self.stop()
 
     def get(self, led_id):
-        for led in self.leds:
-            if(led["id"]==led_id):
-                return led
+        """
+        Returns a copy of the state of the given led, or None if it does not exist
+        """
+        return self.leds.get(led_id)
 
     def turn_on(self):
         GPIO.output(self.switch_pin, GPIO.HIGH)
@@ -101,11 +115,8 @@ class ws2811Controller:
                     break
         elif(isinstance(instructions, dict)):
             #apply this instruction to every led
-            for led in self.leds:
-                led.update(instructions)
-                if not self.update(led, False):
-                    succ = False
-                    break
+            self.leds.update_all(instructions)
+            self.set_frame(self.leds.frame(), show=False)
         if(show):
             self.show()
         return succ
@@ -113,15 +124,11 @@ class ws2811Controller:
     def update(self, instruction, show=False):
         self.stop_animation()
         led_id = instruction["id"]
-        if(instruction["state"]):
-            led = self.get(led_id)
-            if led is not None: led.update(instruction)
-            color = utils.parse_color(instruction["color"], instruction["brightness"])
-            self.strip.setPixelColor(led_id, color)
-        else:
-            led = self.get(led_id)
-            if led is not None: led.update({"state": False, "color": "0,0,0", "brightness": 0})
-            self.strip.setPixelColor(led_id, utils.Color(0,0,0))
+        if(led_id not in self.leds):
+            return False
+        self.leds.update(led_id, instruction)
+        color = self.leds.color(led_id)
+        self.frame[led_id] = color
         if(show):
             self.show()
         return True
@@ -140,9 +147,8 @@ class ws2811Controller:
         elif(type(color) is not int):
             raise ValueError("Invalid color", color)
 
-        for i in range(self.strip.numPixels()):
-            self.strip.setPixelColor(i, color)
-            self.leds[i].update({"color": "0,0,0"})
+        self.set_frame(np.full(self.strip.numPixels(), color, dtype=np.uint32), show=False)
+        self.leds.colors[:] = 0
         self.show()
 
     def begin(self):
@@ -158,25 +164,24 @@ class ws2811Controller:
         
         
         for i in range(3):
-            self.strip.setPixelColor(i, colors[i])
+            self.frame[i] = colors[i]
             self.show()
             time.sleep(0.04)
 
         for i in range(3, N):
-            self.strip.setPixelColor(i, colors[i%3])
-            self.strip.setPixelColor(i-3, 0)
+            self.frame[i] = colors[i%3]
+            self.frame[i-3] = 0
             self.show()
             time.sleep(0.04)
 
         for i in range(N, N+3):
-            self.strip.setPixelColor(i-3, 0)
+            self.frame[i-3] = 0
             self.show()
             time.sleep(0.04)
         
         print("Startup complete!")
-        for led in self.leds:
-            self.update(led)
-        self.show()
+        #restore the stored state of every led
+        self.update_all({}, show=True)
         self.turn_off()
         self.has_begun = True
         return True
@@ -187,26 +192,70 @@ class ws2811Controller:
     def stop_animation(self):
         if(self.animation is not None):
             print(str(self), "Stopping running animation", self.animation)
-            self.animation.stop()
+            self.renderer.clear()
+            self._stop(self.animation)
             self.animation = None
 
-    def play_animation(self, animation):
+    def _stop(self, animation):
+        animation.stop()
+        if(animation.is_alive() and animation is not threading.current_thread()):
+            #wait for the thread to write its last frame, so it never writes at the same time as the next animation
+            animation.join(timeout=1)
+        if(isinstance(getattr(animation, "strip", None), FrameStrip)):
+            #continue from the pixels the thread set last
+            np.copyto(self.frame, animation.strip.buffer)
+
+    def play_animation(self, animation, transition: float = 0.):
         print(str(self), "Starting new animation", animation, self.animation)
         """
-        Will start playing the given animation.
+        Will start playing the given animation, crossfading from what is shown in [transition] seconds.
+        Only animations that implement render() can be faded in.
         The animation can be stopped by calling stop_animation()
         or by performing any kind of update.
         """
-        if(self.animation is not None):
+        previous = self.animation
+        if(animation.renders_frames):
+            start_frame = None
+            if(previous is not None and not previous.renders_frames):
+                #fade from the last frame the thread wrote
+                self._stop(previous)
+                start_frame = self.frame.copy()
+            elif(previous is None and transition > 0):
+                start_frame = self.frame.copy() if self.on else np.zeros(self.strip.numPixels(), dtype=np.uint32)
+            elif(previous is not None):
+                #the render loop keeps rendering it until the transition is over
+                previous.stop()
+            if(not self.on):
+                self.turn_on()
+            self.animation = animation
+            #driven by the render loop, no need for a new thread
+            self.renderer.set_animation(animation, transition=transition, start_frame=start_frame)
+        else:
             self.stop_animation()
-        if(not self.on):
-            self.turn_on()
-        self.animation = animation
-        self.animation.play(self.strip)
+            if(not self.on):
+                self.turn_on()
+            self.animation = animation
+            #the thread sets its pixels in a buffer of its own and publishes whole frames
+            self.animation.play(FrameStrip(self.output, self.frame))
+
+    def set_frame(self, frame, show=True):
+        """
+        Commit a whole frame to the strip in one call.
+        frame: (N,) array of packed colors or a (N,3) array of r,g,b values
+        """
+        frame = utils.pack_frame(frame)
+        if(frame.shape[0] != self.strip.numPixels()):
+            raise ValueError("Frame size does not match the number of LEDs", frame.shape[0])
+        #copied, animations may reuse their frame array
+        np.copyto(self.frame, frame)
+        if(show):
+            self.show()
 
     def show(self):
-        #print("Showing!")
-        self.strip.show()
+        """
+        Hands the current frame to the output thread, returns without waiting for the strip.
+        """
+        self.output.publish(self.frame.copy())
 
     def __str__(self):
         return f"ws2811Controller [{self.nonce}]"
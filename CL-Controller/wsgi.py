@@ -3,6 +3,7 @@ logging.basicConfig(level=logging.INFO)
 from cl_controller.cl_controller import create_app
 import multiprocessing
 from  cl_controller.ws2811Controller import ws2811Controller
+from cl_controller import hardware
 from datetime import datetime
 
 def main(*args, **kwargs):
@@ -13,7 +14,11 @@ def main(*args, **kwargs):
     logging.basicConfig(level=logging.INFO, filename=f"logs/log_{time}.log", filemode='w', format='%(asctime)s - %(levelname)s, %(module)s: %(message)s')
     logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
     logging.info("Main method "+ str(multiprocessing.current_process()))
-    return create_app()
+    options = {"ddp": kwargs.get("ddp", False)}
+    if("hardware_process" in kwargs):
+        #e.g. wsgi:main(hardware_process=True) to run more than one worker
+        options["hardware_process"] = kwargs["hardware_process"]
+    return create_app(**options)
 
 def wsgi_on_starting(server):
     logging.debug("On Starting " + str(multiprocessing.current_process()))
@@ -21,4 +26,5 @@ def wsgi_on_starting(server):
 def wsgi_on_exit(server):
     if ws2811Controller._instance is not None:
         ws2811Controller._instance.stop()
+    hardware.stop()
     logging.info("Exiting")
\ No newline at end of file
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import socket
+import random
+import colorsys
+import numpy as np
+import requests
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "CL-Controller"))
+from cl_controller.ddp import build_packets, next_sequence, DDP_PORT
+
+def rainbow(t: float, num_leds: int) -> bytes:
+    #a rainbow moving along the strip, one full turn every 5 seconds
+    hues = (np.arange(num_leds)/num_leds + t/5) % 1
+    rgb = np.array([colorsys.hsv_to_rgb(h, 1, 1) for h in hues])
+    return (rgb*255).astype(np.uint8).tobytes()
+
+def main(host: str = "raspberrypi4.local", port: int = DDP_PORT, num_leds: int = 100, fps: float = 60, duration: float = 10, drop: float = 0, api: str | None = None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start = time.monotonic()
+    deadline = start
+    sequence = 1
+    sent = dropped = 0
+    while(time.monotonic()-start < duration):
+        packets = build_packets(rainbow(time.monotonic()-start, num_leds), sequence)
+        sequence = next_sequence(sequence, len(packets))
+        for packet in packets:
+            if(random.random() < drop):
+                #simulate packet loss to check the counters of the listener
+                dropped += 1
+                continue
+            sock.sendto(packet, (host, port))
+            sent += 1
+        deadline += 1/fps
+        delay = deadline-time.monotonic()
+        if(delay > 0):
+            time.sleep(delay)
+    print(f"Sent {sent:d} packets, dropped {dropped:d}")
+    if(api is not None):
+        time.sleep(0.2)
+        print(requests.get(api+"/stream/ddp").json())
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Send a test animation to the DDP listener of the controller")
+    parser.add_argument("--host", help="Host of the controller", default="raspberrypi4.local")
+    parser.add_argument("--port", help="UDP port of the listener", type=int, default=DDP_PORT)
+    parser.add_argument("--num-leds", help="Number of leds", type=int, default=100)
+    parser.add_argument("--fps", help="Frames per second", type=float, default=60)
+    parser.add_argument("--duration", help="Number of seconds to send", type=float, default=10)
+    parser.add_argument("--drop", help="Fraction of the packets to drop on purpose", type=float, default=0)
+    parser.add_argument("--api", help="Url of the api to print the listener's statistics, e.g. http://raspberrypi4.local/api")
+    args = parser.parse_args()
+    main(host=args.host, port=args.port, num_leds=args.num_leds, fps=args.fps, duration=args.duration, drop=args.drop, api=args.api)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+import colorsys
+import numpy as np
+import requests
+import argparse
+
+rest_url = "http://raspberrypi4.local/api"
+
+def rainbow(t: float, num_leds: int) -> np.ndarray:
+    #a rainbow moving along the strip, one full turn every 5 seconds
+    hues = (np.arange(num_leds)/num_leds + t/5) % 1
+    rgb = np.array([colorsys.hsv_to_rgb(h, 1, 1) for h in hues])
+    return (rgb*255).astype(np.uint8)
+
+def frames(num_leds: int, fps: float, duration: float):
+    """
+    Renders the frames at the given rate and yields them as raw r,g,b bytes.
+    requests sends a generator as a chunked request body.
+    """
+    start = time.monotonic()
+    deadline = start
+    count = 0
+    while(duration <= 0 or time.monotonic()-start < duration):
+        yield rainbow(time.monotonic()-start, num_leds).tobytes()
+        count += 1
+        deadline += 1/fps
+        delay = deadline-time.monotonic()
+        if(delay > 0):
+            time.sleep(delay)
+        if(count % int(fps*5) == 0):
+            print(f"Sent {count:d} frames ({count/(time.monotonic()-start):.1f} fps)")
+
+def main(fps: float = 60, duration: float = 0, url: str = rest_url):
+    response = requests.get(url+"/all/")
+    if(response.status_code != 200):
+        print("Could not get the number of leds", response.status_code)
+        return
+    num_leds = len(response.json())
+    response = requests.post(url+"/all/", json={"power": True})
+    if(response.status_code != 200):
+        print("Failed to turn on power...")
+        return
+    print(f"Streaming to {num_leds:d} leds at {fps:.0f} fps")
+    try:
+        response = requests.post(url+"/stream/", params={"format": "rgb", "fps": fps}, data=frames(num_leds, fps, duration))
+        print(response.json())
+    except KeyboardInterrupt:
+        print("Stopped")
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Render an animation on this machine and stream the frames to the tree")
+    parser.add_argument("--fps", help="Frames per second", type=float, default=60)
+    parser.add_argument("--duration", help="Number of seconds to stream, 0 streams until interrupted", type=float, default=0)
+    parser.add_argument("--url", help="Url of the api", default=rest_url)
+    args = vars(parser.parse_args())
+    main(**args)
@@ -146,20 +146,22 @@ def main(show:bool=True, rotation:int=0, leds: list[int] | None = None, ybox: tu
         print("Failed to turn off all leds...")
         return
 
-    post_request = {"id": 0, "color": "255,0,0", "state": True, "brightness": 255}
     stop = False
+    previous = None #the led that is still on
     
     locs = np.full((num_leds,2), -1, dtype=np.int32)
     to_iter = leds or range(num_leds)
     for i in to_iter:
-        post_request["id"] = i #select the next led
-        post_request["state"] = True #turn it on
+        post_request = [{"id": i, "color": "255,0,0", "state": True, "brightness": 255}] #turn on the next led
+        if(previous is not None):
+            post_request.insert(0, {"id": previous, "state": False}) #and turn off the previous one in the same request
         count = 0
         while(count<5):
             count += 1
             print("sending ", post_request)
-            response = requests.patch(rest_url+'/leds/', json=post_request) #turn on that led
+            response = requests.patch(rest_url+'/leds/batch', json=post_request)
             if(response.status_code==200):
+                previous = i
                 #response == OK, so the led should be on right now. But for safety, wait 0.5s
                 sleep(.5)
                 img = reader.read() #read image from webcam
@@ -180,18 +182,6 @@ def main(show:bool=True, rotation:int=0, leds: list[int] | None = None, ybox: tu
                 if(cv.waitKey(1)==27):
                     stop = True
                     break
-                
-                post_request["state"] = False #turn it off
-                count2 = 0
-                while(count2<5):
-                    count2 += 1
-                    response = requests.patch(rest_url +"/leds/", json=post_request)
-                    if(response.status_code==200):
-                        break
-                    sleep(.1)
-                else:
-                    stop = True
-                    break
                 break
             else:
                 msg = ""
@@ -204,6 +194,9 @@ def main(show:bool=True, rotation:int=0, leds: list[int] | None = None, ybox: tu
             stop = True
         if(stop):
             break
+    if(previous is not None):
+        #turn off the last led as well
+        requests.patch(rest_url+'/leds/batch', json=[{"id": previous, "state": False}])
     file = f"locations/locations_{rotation:d}.npy"
     if(leds is None):
         np.save(file, locs)